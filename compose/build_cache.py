@@ -0,0 +1,50 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import json
+import logging
+import os
+from threading import Lock
+
+from .utils import atomic_write
+
+
+log = logging.getLogger(__name__)
+
+
+DEFAULT_INDEX_PATH = os.path.join('~', '.docker', 'compose', 'build-index.json')
+
+
+class BuildIndex(object):
+    """A local index of the images built by compose, keyed by the digest of
+    their build context (see :func:`compose.build_context.context_digest`).
+    """
+
+    lock = Lock()
+
+    def __init__(self, path=None):
+        self.path = os.path.expanduser(
+            path or os.environ.get('COMPOSE_BUILD_INDEX') or DEFAULT_INDEX_PATH)
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def get(self, digest):
+        return self.load().get(digest)
+
+    def add(self, digest, image_id):
+        with self.lock:
+            index = self.load()
+            index[digest] = image_id
+            try:
+                self.save(index)
+            except (IOError, OSError) as e:
+                log.debug('Failed to write the build index {}: {}'.format(self.path, e))
+
+    def save(self, index):
+        with atomic_write(self.path) as f:
+            json.dump(index, f, indent=2, sort_keys=True)
@@ -0,0 +1,297 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import fnmatch
+import hashlib
+import io
+import os
+import re
+import stat
+import tarfile
+
+from .config.config import DOCKER_VALID_URL_PREFIXES
+
+
+DEFAULT_DOCKERFILE = 'Dockerfile'
+
+READ_CHUNK_SIZE = 64 * 1024
+
+STREAM_CHUNK_SIZE = 256 * 1024
+
+FROM_INSTRUCTION = re.compile(
+    r'^FROM\s+(?:--\S+\s+)*(?P<image>\S+)(?:\s+AS\s+(?P<stage>\S+))?',
+    re.IGNORECASE)
+
+COPY_FROM_FLAG = re.compile(r'^(?:COPY|ADD)\s.*?--from=(?P<source>\S+)', re.IGNORECASE)
+
+
+def is_remote_context(path):
+    return path.startswith(DOCKER_VALID_URL_PREFIXES)
+
+
+def read_dockerignore(path):
+    """Return the patterns in the `.dockerignore` file of the build context at
+    `path`, the same way the docker client reads them.
+    """
+    dockerignore = os.path.join(path, '.dockerignore')
+    if not os.path.exists(dockerignore):
+        return []
+
+    with open(dockerignore, 'r') as f:
+        return list(filter(bool, f.read().splitlines()))
+
+
+class ContextFilter(object):
+    """Decides which paths of a build context are sent to the daemon, with
+    the same rules as `docker.utils.exclude_paths`, but with the
+    `.dockerignore` patterns compiled once instead of for every path.
+    """
+
+    def __init__(self, patterns, dockerfile=None):
+        exceptions = [pattern[1:] for pattern in patterns if pattern.startswith('!')]
+        self.has_exceptions = bool(exceptions)
+        self.exclude = [
+            compile_pattern(pattern)
+            for pattern in set(patterns) if not pattern.startswith('!')
+        ]
+        self.include = [
+            compile_pattern(pattern)
+            for pattern in exceptions + [dockerfile or DEFAULT_DOCKERFILE, '.dockerignore']
+        ]
+
+    def includes(self, path):
+        if any(matches(path) for matches in self.exclude):
+            return any(matches(path) for matches in self.include)
+        return True
+
+
+def compile_pattern(pattern):
+    """Return a function which matches a relative path against a
+    `.dockerignore` pattern. Like the docker client, a pattern also matches
+    everything below the paths it matches.
+    """
+    pattern = pattern.rstrip('/')
+    depth = len(pattern.split('/'))
+    regex = re.compile(fnmatch.translate(pattern))
+
+    def matches(path):
+        return regex.match('/'.join(path.split('/')[:depth])) is not None
+
+    return matches
+
+
+def walk_context(path, dockerfile=None):
+    """Yield the relative paths of the files and directories which are sent
+    to the daemon for the build context at `path`. Directories are yielded
+    before their contents, and entries of a directory in sorted order.
+    """
+    root = os.path.abspath(path)
+    dockerfile = dockerfile or DEFAULT_DOCKERFILE
+    context_filter = ContextFilter(read_dockerignore(root), dockerfile)
+    found_dockerfile = False
+
+    for parent, dirs, files in os.walk(root, topdown=True, followlinks=False):
+        parent = os.path.relpath(parent, root)
+        if parent == '.':
+            parent = ''
+
+        dirs.sort()
+        if not context_filter.has_exceptions:
+            # Don't descend into excluded directories. With exceptions a path
+            # below an excluded directory may be included again.
+            dirs[:] = [
+                name for name in dirs
+                if context_filter.includes(os.path.join(parent, name))
+            ]
+
+        for name in dirs + sorted(files):
+            relative_path = os.path.join(parent, name)
+            if context_filter.includes(relative_path):
+                found_dockerfile = found_dockerfile or relative_path == dockerfile
+                yield relative_path
+
+    # The Dockerfile is always sent, even if it is in an excluded directory
+    if not found_dockerfile and os.path.exists(os.path.join(root, dockerfile)):
+        yield dockerfile
+
+
+def context_paths(path, dockerfile=None):
+    """Return the relative paths of the files and directories which are sent
+    to the daemon for the build context at `path`.
+    """
+    return list(walk_context(path, dockerfile))
+
+
+def stream_context(path, dockerfile=None, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield the build context at `path` as an uncompressed tar archive, in
+    chunks of about `chunk_size` bytes.
+
+    The archive is produced while it is read, so it can be uploaded with
+    chunked transfer encoding as the context is walked. Files are read in
+    blocks, so memory use doesn't depend on the size of the context.
+    """
+    root = os.path.abspath(path)
+    # Only used to create the headers of the entries, and detect hard links
+    archive = tarfile.open(mode='w', fileobj=io.BytesIO())
+
+    def members():
+        for relative_path in walk_context(root, dockerfile):
+            full_path = os.path.join(root, relative_path)
+            info = archive.gettarinfo(full_path, arcname=relative_path)
+            if info is None:
+                # Sockets and other files which can't be archived
+                continue
+
+            if info.isreg() and info.size:
+                yield info, read_blocks(full_path, info.size)
+            else:
+                yield info, None
+
+    return stream_tar(members(), chunk_size)
+
+
+def stream_tar(members, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield an uncompressed tar archive of `members`, in chunks of about
+    `chunk_size` bytes. `members` is an iterable of pairs of a TarInfo and
+    an iterable of the blocks of the member's contents (or None).
+    """
+    archive = tarfile.open(mode='w', fileobj=io.BytesIO())
+    buf = bytearray()
+
+    for info, blocks in members:
+        buf += info.tobuf(archive.format, archive.encoding, archive.errors)
+        if blocks is not None:
+            for data in blocks:
+                buf += data
+                if len(buf) >= chunk_size:
+                    yield bytes(buf)
+                    del buf[:]
+            buf += tarfile.NUL * (-info.size % tarfile.BLOCKSIZE)
+
+        if len(buf) >= chunk_size:
+            yield bytes(buf)
+            del buf[:]
+
+    # The end of an archive is marked with two empty blocks
+    buf += tarfile.NUL * (2 * tarfile.BLOCKSIZE)
+    yield bytes(buf)
+
+
+def read_blocks(path, size):
+    """Yield the contents of the file at `path`, which is expected to be
+    `size` bytes long, in blocks of at most READ_CHUNK_SIZE bytes.
+    """
+    remaining = size
+    with open(path, 'rb') as f:
+        while remaining:
+            data = f.read(min(READ_CHUNK_SIZE, remaining))
+            if not data:
+                raise IOError("{} changed size while the build context was sent".format(path))
+            remaining -= len(data)
+            yield data
+
+
+def context_digest(path, dockerfile=None, args=None, base_image_ids=None):
+    """Return a digest of everything a build depends on locally: the files
+    in the `.dockerignore` filtered build context, their modes, the name of
+    the Dockerfile, the build args and the ids of the images the Dockerfile
+    is built from (`base_image_ids`, a dict of image names to ids, or to
+    None if they don't exist yet). Returns None for remote contexts.
+    """
+    if is_remote_context(path):
+        return None
+
+    root = os.path.abspath(path)
+    digest = hashlib.sha256()
+
+    def update(*parts):
+        for part in parts:
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+
+    update('dockerfile', dockerfile or DEFAULT_DOCKERFILE)
+    for name, value in sorted((args or {}).items()):
+        update('arg', name, '' if value is None else str(value))
+    for image, image_id in sorted((base_image_ids or {}).items()):
+        update('base', image, image_id or '')
+
+    for relative_path in context_paths(root, dockerfile):
+        full_path = os.path.join(root, relative_path)
+        mode = os.lstat(full_path).st_mode
+        update('path', relative_path, oct(stat.S_IMODE(mode)))
+
+        if stat.S_ISLNK(mode):
+            update('link', os.readlink(full_path))
+        elif stat.S_ISREG(mode):
+            update('file', file_digest(full_path))
+
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_instructions(path):
+    """Return the instructions of the Dockerfile at `path`, with comments
+    removed and continuation lines joined.
+    """
+    instructions = []
+    current = ''
+    with open(path, 'r') as f:
+        for line in f.read().splitlines():
+            line = line.strip()
+            if not current and (not line or line.startswith('#')):
+                continue
+            if line.endswith('\\'):
+                current += line[:-1] + ' '
+                continue
+            instructions.append(current + line)
+            current = ''
+    if current:
+        instructions.append(current)
+    return instructions
+
+
+def base_images(path, dockerfile=None):
+    """Return the images that the Dockerfile of the build context at `path`
+    is built from, in the order they are referenced. This includes the base
+    image of every stage of a multi-stage build and the sources of
+    `COPY --from`, but not references to earlier stages of the same build.
+
+    Returns an empty list for remote contexts and missing Dockerfiles, and
+    skips references which use build args, as they can't be resolved here.
+    """
+    if is_remote_context(path):
+        return []
+
+    dockerfile_path = os.path.join(path, dockerfile or DEFAULT_DOCKERFILE)
+    if not os.path.isfile(dockerfile_path):
+        return []
+
+    stages = set()
+    images = []
+
+    def add(image):
+        if image.lower() in stages or image.isdigit() or '$' in image:
+            return
+        if image != 'scratch' and image not in images:
+            images.append(image)
+
+    for instruction in read_instructions(dockerfile_path):
+        match = FROM_INSTRUCTION.match(instruction)
+        if match:
+            add(match.group('image'))
+            if match.group('stage'):
+                stages.add(match.group('stage').lower())
+            continue
+
+        match = COPY_FROM_FLAG.match(instruction)
+        if match:
+            add(match.group('source'))
+
+    return images
@@ -0,0 +1,175 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import logging
+import tarfile
+from contextlib import closing
+
+from docker.errors import APIError
+
+from .build_context import READ_CHUNK_SIZE
+from .build_context import stream_tar
+from .image_cache import member_entry
+from .image_cache import member_info
+from .parallel import parallel_execute
+
+
+log = logging.getLogger(__name__)
+
+
+DEFAULT_CONCURRENCY = 4
+
+INDEX_NAME = 'index.json'
+BLOB_PREFIX = 'blobs/'
+# The name of a blob before its digest is known. Blob names have a fixed
+# length, so the header can be rewritten in place once it is.
+PLACEHOLDER_BLOB_NAME = BLOB_PREFIX + '0' * 64
+
+
+class BundleError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
+class BundleWriter(object):
+    """Write the images of a project to a single tar archive.
+
+    The files of every image saved with `docker save` (mostly the tarballs
+    of its layers) are written once by their content as `blobs/<sha256>`,
+    so layers which are shared by several images are only written once.
+    `index.json`, at the end of the archive, lists the files of each image,
+    so it can be put back together by :class:`BundleReader`.
+
+    The output of `docker save` is copied to the archive as it is read, so
+    images are never held in memory or written to disk twice.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.blobs = set()
+        self.images = []
+
+    def add_image(self, client, image):
+        log.info('Saving {}'.format(image))
+        members = []
+        with closing(client.get_image(image)) as response:
+            archive = tarfile.open(mode='r|', fileobj=response)
+            for info in archive:
+                member = member_entry(info)
+                if info.isreg():
+                    member['blob'] = self.write_blob(archive.extractfile(info), info.size)
+                members.append(member)
+
+        self.images.append({'image': image, 'members': members})
+
+    def write_blob(self, source, size):
+        """Copy `size` bytes from `source` to the archive, unless a blob with
+        the same contents has already been written, and return the digest of
+        its contents.
+        """
+        start = self.fileobj.tell()
+        info = tarfile.TarInfo(PLACEHOLDER_BLOB_NAME)
+        info.size = size
+        self.fileobj.write(info.tobuf(tarfile.USTAR_FORMAT))
+
+        digest = hashlib.sha256()
+        for data in iter(lambda: source.read(READ_CHUNK_SIZE), b''):
+            digest.update(data)
+            self.fileobj.write(data)
+        self.fileobj.write(tarfile.NUL * (-size % tarfile.BLOCKSIZE))
+
+        blob_digest = digest.hexdigest()
+        if blob_digest in self.blobs:
+            # Already in the archive, drop the copy
+            self.fileobj.seek(start)
+            self.fileobj.truncate()
+            return blob_digest
+
+        end = self.fileobj.tell()
+        info.name = BLOB_PREFIX + blob_digest
+        self.fileobj.seek(start)
+        self.fileobj.write(info.tobuf(tarfile.USTAR_FORMAT))
+        self.fileobj.seek(end)
+        self.blobs.add(blob_digest)
+        return blob_digest
+
+    def close(self):
+        index = json.dumps({'images': self.images}).encode('utf-8')
+        info = tarfile.TarInfo(INDEX_NAME)
+        info.size = len(index)
+        for data in stream_tar([(info, [index])]):
+            self.fileobj.write(data)
+
+
+class BundleReader(object):
+    """Read the images of an archive written by :class:`BundleWriter`.
+
+    Blobs are read straight from their offset in the archive, so several
+    images can be loaded into the daemon at the same time, each from its own
+    file handle, without extracting the archive.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.blobs = {}
+        index = None
+
+        try:
+            with tarfile.open(path, 'r') as archive:
+                for info in archive:
+                    if info.name.startswith(BLOB_PREFIX):
+                        self.blobs[info.name[len(BLOB_PREFIX):]] = (info.offset_data, info.size)
+                    elif info.name == INDEX_NAME:
+                        index = json.loads(archive.extractfile(info).read().decode('utf-8'))
+        except (IOError, OSError, tarfile.TarError) as e:
+            raise BundleError("Couldn't read bundle {}: {}".format(path, e))
+
+        if index is None:
+            raise BundleError("{} is not a bundle: it has no {}".format(path, INDEX_NAME))
+        self.images = index['images']
+
+    def load(self, client, concurrency=DEFAULT_CONCURRENCY):
+        """Load every image of the bundle into the daemon, `concurrency`
+        images at a time. Raises :class:`BundleError` if any image fails to
+        load, once the other images have been loaded.
+        """
+        entries = dict((entry['image'], entry) for entry in self.images)
+        parallel_execute(
+            [entry['image'] for entry in self.images],
+            lambda image: self.load_image(client, entries[image]),
+            lambda image: image,
+            'Loading',
+            limit=concurrency)
+
+    def load_image(self, client, entry):
+        try:
+            with open(self.path, 'rb') as f:
+                client.load_image(stream_tar(self.members(f, entry)))
+        except APIError as e:
+            # Not an APIError, so parallel_execute raises it once it's done
+            raise BundleError("Failed to load {}: {}".format(entry['image'], e.explanation))
+
+    def members(self, fileobj, entry):
+        for member in entry['members']:
+            info = member_info(member)
+            if 'blob' in member:
+                offset, size = self.blobs[member['blob']]
+                yield info, read_range(fileobj, offset, size)
+            else:
+                yield info, None
+
+
+def read_range(fileobj, offset, size):
+    fileobj.seek(offset)
+    remaining = size
+    while remaining:
+        data = fileobj.read(min(READ_CHUNK_SIZE, remaining))
+        if not data:
+            raise BundleError("Bundle is truncated")
+        remaining -= len(data)
+        yield data
@@ -11,6 +11,7 @@ from . import verbose_proxy
 from .. import config
 from ..config.environment import Environment
 from ..const import API_VERSIONS
+from ..lockfile import Lockfile
 from ..project import Project
 from .docker_client import docker_client
 from .docker_client import tls_config_from_options
@@ -76,7 +77,9 @@ def get_project(project_dir, config_path=None, project_name=None, verbose=False,
         host=host, environment=environment
     )
 
-    return Project.from_config(project_name, config_data, client)
+    return Project.from_config(
+        project_name, config_data, client,
+        lockfile=Lockfile.find(config_details.working_dir))
 
 
 def get_project_name(working_dir, project_name=None, environment=None):
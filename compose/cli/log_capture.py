@@ -0,0 +1,383 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import calendar
+import hashlib
+import os
+import re
+import time
+import zlib
+from collections import Counter
+from collections import deque
+from collections import namedtuple
+
+from compose.utils import atomic_write
+from compose.utils import makedirs
+
+
+# Bytes of log lines compressed together. Each block is a gzip member of its
+# own, so reading can start at any block.
+BLOCK_SIZE = 256 * 1024
+# Seconds a block is kept open before it is compressed and written
+BLOCK_INTERVAL = 5
+# A segment is closed and a new one started when it is this large, in
+# compressed bytes, or this old, in seconds
+SEGMENT_SIZE = 16 * 1024 * 1024
+SEGMENT_AGE = 3600
+# Segments kept for each container, the oldest are removed first
+MAX_SEGMENTS = 10
+
+INDEX_NAME = 'index'
+# The daemon timestamp of the last lines captured, and the lines captured
+# with it, to tell which lines of a replayed history were captured before
+LAST_NAME = 'last'
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+DOCKER_TIMESTAMP = re.compile(r'^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(\.\d+)?(?:Z|[+-]00:00) ')
+
+
+class IndexEntry(namedtuple('_IndexEntry', 'segment offset first last')):
+    """A block of a segment: the number of the segment, the offset of the
+    block in it, and the timestamps of its first and last line.
+    """
+
+    @classmethod
+    def parse(cls, line):
+        segment, offset, first, last = line.split()
+        return cls(int(segment), int(offset), float(first), float(last))
+
+    def format(self):
+        return '{} {} {:.6f} {:.6f}\n'.format(*self)
+
+
+class LogCapture(object):
+    """A directory with the captured logs of containers, one directory for
+    each container name.
+
+    The lines of each container are stored with a timestamp in segment files
+    of compressed blocks (see :class:`CaptureWriter`), and an index of the
+    time span of every block, so the lines of a time range can be read
+    without reading the rest.
+    """
+
+    def __init__(self, path, until=None):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.until = until
+
+    def container_path(self, container):
+        return os.path.join(self.path, container.name)
+
+    def has(self, container):
+        return os.path.exists(os.path.join(self.container_path(container), INDEX_NAME))
+
+    def reads(self, container, log_args):
+        """Whether the logs of `container` are read from the capture rather
+        than from the daemon: when they aren't followed, and there are any.
+        """
+        return not log_args.get('follow') and self.has(container)
+
+    def writer(self, container):
+        return CaptureWriter(self.container_path(container))
+
+    def log_generator(self, container, log_args):
+        reader = CaptureReader(self.container_path(container))
+        lines = reader.lines(since=log_args.get('since'), until=self.until)
+
+        tail = log_args.get('tail')
+        if isinstance(tail, int):
+            lines = deque(lines, maxlen=tail)
+
+        for timestamp, line in lines:
+            if log_args.get('timestamps'):
+                line = '{} {}'.format(format_timestamp(timestamp), line)
+            yield line
+
+
+class CaptureWriter(object):
+    """Write the log lines of a container to compressed segment files.
+
+    Lines are collected into blocks of about BLOCK_SIZE bytes, which are
+    compressed as separate gzip members and appended to the current segment,
+    so the segment is a valid gzip file and can also be read from the start
+    of any block. Every block is recorded in the index with the time span of
+    its lines. Segments are rotated by size and age, and the oldest are
+    removed.
+
+    Lines are stored with the timestamp the daemon added if they have one
+    (see `logs --timestamps`), and the time they were read otherwise. Lines
+    with a daemon timestamp older than the last one captured, or with the
+    same timestamp and contents as a line captured with it, were captured
+    before, and are skipped. Timestamps are compared to the nanosecond.
+    """
+
+    def __init__(self,
+                 path,
+                 block_size=BLOCK_SIZE,
+                 block_interval=BLOCK_INTERVAL,
+                 segment_size=SEGMENT_SIZE,
+                 segment_age=SEGMENT_AGE,
+                 max_segments=MAX_SEGMENTS):
+        self.path = path
+        self.block_size = block_size
+        self.block_interval = block_interval
+        self.segment_size = segment_size
+        self.segment_age = segment_age
+        self.max_segments = max_segments
+
+        if not os.path.isdir(path):
+            makedirs(path)
+        self.entries = read_index(path)
+        # The lines at the last timestamp, and how many times each has been
+        # seen again since
+        self.last_time, self.last_lines = read_last(path, self.entries)
+        self.seen_lines = Counter()
+        # Never append to a segment from an earlier run
+        self.segment = self.entries[-1].segment + 1 if self.entries else 0
+        self.segment_file = None
+        self.segment_started = None
+
+        self.block = []
+        self.block_bytes = 0
+        self.block_started = None
+        self.first = self.last = None
+
+    def write(self, line):
+        nanoseconds, line = split_timestamp_ns(line)
+        if nanoseconds is None:
+            timestamp = time.time()
+        elif self.is_captured(nanoseconds, line):
+            return
+        else:
+            timestamp = nanoseconds / 1e9
+
+        if not line.endswith('\n'):
+            line += '\n'
+        data = '{:.6f} {}'.format(timestamp, line).encode('utf-8')
+
+        now = time.time()
+        if not self.block:
+            self.block_started = now
+            self.first = timestamp
+        self.block.append(data)
+        self.block_bytes += len(data)
+        self.last = timestamp
+
+        if self.block_bytes >= self.block_size or now - self.block_started >= self.block_interval:
+            self.flush()
+
+    def is_captured(self, nanoseconds, line):
+        """Whether the line logged at `nanoseconds` was captured before, and
+        record it as captured if it wasn't.
+        """
+        key = line_digest(line)
+        if nanoseconds < self.last_time:
+            return True
+        if nanoseconds > self.last_time:
+            self.last_time = nanoseconds
+            self.last_lines = Counter()
+            self.seen_lines = Counter()
+
+        # Lines with the same timestamp and contents are told apart by count
+        self.seen_lines[key] += 1
+        if self.seen_lines[key] <= self.last_lines[key]:
+            return True
+        self.last_lines[key] += 1
+        return False
+
+    def flush(self):
+        """Compress the lines collected so far, and append them to the
+        current segment as a block.
+        """
+        if not self.block:
+            return
+
+        compressor = zlib.compressobj(6, zlib.DEFLATED, GZIP_WBITS)
+        data = compressor.compress(b''.join(self.block)) + compressor.flush()
+
+        if self.segment_file is None or self.is_full():
+            self.rotate()
+        entry = IndexEntry(self.segment, self.segment_file.tell(), self.first, self.last)
+        self.segment_file.write(data)
+        self.segment_file.flush()
+
+        self.entries.append(entry)
+        with open(os.path.join(self.path, INDEX_NAME), 'a') as f:
+            f.write(entry.format())
+        write_last(self.path, self.last_time, self.last_lines)
+
+        self.block = []
+        self.block_bytes = 0
+
+    def is_full(self):
+        return (
+            self.segment_file.tell() >= self.segment_size or
+            time.time() - self.segment_started >= self.segment_age
+        )
+
+    def rotate(self):
+        if self.segment_file is not None:
+            self.segment_file.close()
+            self.segment += 1
+        self.segment_file = open(segment_path(self.path, self.segment), 'ab')
+        self.segment_started = time.time()
+        self.remove_old_segments()
+
+    def remove_old_segments(self):
+        segments = sorted(set(entry.segment for entry in self.entries) | {self.segment})
+        removed = set(segments[:-self.max_segments])
+        if not removed:
+            return
+
+        for segment in removed:
+            if os.path.exists(segment_path(self.path, segment)):
+                os.remove(segment_path(self.path, segment))
+        self.entries = [entry for entry in self.entries if entry.segment not in removed]
+        write_index(self.path, self.entries)
+
+    def close(self):
+        self.flush()
+        if self.segment_file is not None:
+            self.segment_file.close()
+            self.segment_file = None
+
+
+class CaptureReader(object):
+    """Read the log lines captured by :class:`CaptureWriter`."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = read_index(path)
+
+    def lines(self, since=None, until=None):
+        """Yield `(timestamp, line)` for each line from `since` to `until`.
+        Blocks which only have lines outside of the range aren't read.
+        """
+        for entry in self.entries:
+            if since is not None and entry.last < since:
+                continue
+            if until is not None and entry.first > until:
+                continue
+
+            for timestamp, line in self.read_block(entry):
+                if since is not None and timestamp < since:
+                    continue
+                if until is not None and timestamp > until:
+                    continue
+                yield timestamp, line
+
+    def read_block(self, entry):
+        path = segment_path(self.path, entry.segment)
+        if not os.path.exists(path):
+            return
+
+        decompressor = zlib.decompressobj(GZIP_WBITS)
+        data = []
+        with open(path, 'rb') as f:
+            f.seek(entry.offset)
+            # A block ends where its gzip member does
+            while not decompressor.unused_data:
+                chunk = f.read(64 * 1024)
+                if not chunk:
+                    break
+                data.append(decompressor.decompress(chunk))
+
+        for line in b''.join(data).decode('utf-8', 'replace').splitlines(True):
+            timestamp, line = line.split(' ', 1)
+            yield float(timestamp), line
+
+
+def segment_path(path, segment):
+    return os.path.join(path, '{:06d}.log.gz'.format(segment))
+
+
+def read_index(path):
+    index_path = os.path.join(path, INDEX_NAME)
+    if not os.path.exists(index_path):
+        return []
+    with open(index_path, 'r') as f:
+        return [IndexEntry.parse(line) for line in f if line.strip()]
+
+
+def read_last(path, entries):
+    """Return the last daemon timestamp captured at `path`, in nanoseconds,
+    and the digests of the lines captured with it.
+    """
+    last_path = os.path.join(path, LAST_NAME)
+    if not os.path.exists(last_path):
+        # Lines with the same timestamp as the last entry can't be told apart
+        return (int(round(entries[-1].last * 1e9)) if entries else 0), Counter()
+
+    with open(last_path, 'r') as f:
+        lines = f.read().splitlines()
+    last_lines = Counter()
+    for line in lines[1:]:
+        count, digest = line.split()
+        last_lines[digest] = int(count)
+    return int(lines[0]), last_lines
+
+
+def write_last(path, last_time, last_lines):
+    with atomic_write(os.path.join(path, LAST_NAME)) as f:
+        f.write('{}\n'.format(last_time))
+        for digest, count in sorted(last_lines.items()):
+            f.write('{} {}\n'.format(count, digest))
+
+
+def line_digest(line):
+    return hashlib.sha1(line.encode('utf-8')).hexdigest()
+
+
+def write_index(path, entries):
+    with atomic_write(os.path.join(path, INDEX_NAME)) as f:
+        for entry in entries:
+            f.write(entry.format())
+
+
+def split_timestamp(line):
+    """Split the timestamp the daemon added to `line`, if it has one, and
+    return it in seconds since the epoch with the rest of the line.
+    """
+    match = DOCKER_TIMESTAMP.match(line)
+    if not match:
+        return None, line
+    timestamp = calendar.timegm(time.strptime(match.group(1), '%Y-%m-%dT%H:%M:%S'))
+    if match.group(2):
+        timestamp += float('0' + match.group(2))
+    return timestamp, line[match.end():]
+
+
+def split_timestamp_ns(line):
+    """Like :func:`split_timestamp`, but return the timestamp in whole
+    nanoseconds, which the daemon's timestamps are exact to.
+    """
+    match = DOCKER_TIMESTAMP.match(line)
+    if not match:
+        return None, line
+    seconds = calendar.timegm(time.strptime(match.group(1), '%Y-%m-%dT%H:%M:%S'))
+    fraction = (match.group(2) or '.')[1:10]
+    return seconds * 10 ** 9 + int(fraction.ljust(9, '0')), line[match.end():]
+
+
+def format_timestamp(timestamp):
+    # Round to microseconds first, so a fraction which rounds up to a whole
+    # second carries into the seconds
+    seconds, microseconds = divmod(int(round(timestamp * 1000000)), 1000000)
+    return '{}.{:06d}Z'.format(
+        time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds)),
+        microseconds)
+
+
+def parse_time(value):
+    """Parse a time given on the command line, either in seconds since the
+    epoch, or as a UTC date and time like 2016-05-01T12:00:00.
+    """
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    timestamp, rest = split_timestamp(value.rstrip('Z') + 'Z ')
+    if timestamp is None or rest:
+        raise ValueError("Invalid time {}: expected seconds since the epoch, "
+                         "or a date and time like 2016-05-01T12:00:00".format(value))
+    return timestamp
@@ -0,0 +1,139 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import json
+import mmap
+import os
+
+from .log_capture import split_timestamp
+
+
+class JsonLogFile(object):
+    """The log file of a container which uses the json-file log driver,
+    read directly from disk rather than through the daemon.
+
+    Each line of the file is a JSON object like
+    `{"log": "hello\\n", "stream": "stdout", "time": "2016-05-01T12:00:00.1Z"}`,
+    in the order they were logged. The file is memory mapped, so the lines
+    of `--tail` are found by scanning back from the end, and the first line
+    of `--since` by a binary search on the time of each line, without
+    reading the rest of the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def lines(self, since=None, tail=None):
+        """Yield `(time, line)` for the last `tail` lines logged since
+        `since`, where `time` is the time the daemon logged the line.
+        """
+        with open(self.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                start = 0
+                if since is not None:
+                    start = find_since(data, since)
+                if isinstance(tail, int):
+                    start = max(start, find_tail(data, tail, start))
+
+                for entry in read_entries(data, start):
+                    yield entry.get('time'), entry.get('log', '')
+            finally:
+                data.close()
+
+    def log_generator(self, log_args):
+        for time, line in self.lines(log_args.get('since'), log_args.get('tail')):
+            if log_args.get('timestamps') and time:
+                line = '{} {}'.format(time, line)
+            yield line
+
+
+def line_bounds(data, offset):
+    """Return the start and end of the line which `offset` is in."""
+    start = data.rfind(b'\n', 0, offset) + 1
+    end = data.find(b'\n', offset)
+    if end == -1:
+        end = len(data)
+    return start, end
+
+
+def find_since(data, since):
+    """Return the offset of the first line logged at or after `since`.
+
+    Only complete lines are searched, and lines without a time which can be
+    read are skipped in favour of the next line which has one, so the times
+    searched are in order.
+    """
+    limit = data.rfind(b'\n') + 1
+    low, high = 0, limit
+    while low < high:
+        start, _ = line_bounds(data, (low + high) // 2)
+        timestamp, end = next_line_time(data, start, limit)
+        if timestamp is not None and timestamp < since:
+            low = end + 1
+        else:
+            high = start
+    return low
+
+
+def find_tail(data, tail, start=0):
+    """Return the offset of the line `tail` lines from the end, but not
+    before `start`. A last line without a newline is still being written,
+    and isn't counted.
+    """
+    end = data.rfind(b'\n', start)
+    if end == -1:
+        return start
+    for _ in range(tail):
+        end = data.rfind(b'\n', start, end)
+        if end == -1:
+            return start
+    return end + 1
+
+
+def read_entries(data, start):
+    offset = start
+    while offset < len(data):
+        end = data.find(b'\n', offset)
+        if end == -1:
+            end = len(data)
+        entry = parse_line(data[offset:end])
+        if entry is not None:
+            yield entry
+        offset = end + 1
+
+
+def parse_line(line):
+    """Parse a line of a log file, or return None if it isn't valid, e.g.
+    because the daemon is still writing it.
+    """
+    try:
+        entry = json.loads(line.decode('utf-8'))
+    except ValueError:
+        return None
+    return entry if isinstance(entry, dict) else None
+
+
+def next_line_time(data, start, limit):
+    """Return the time of the first line from `start` which has one, with
+    the end of that line, or None and `limit` if there is no such line.
+    """
+    while start < limit:
+        end = data.find(b'\n', start, limit)
+        if end == -1:
+            end = limit
+        timestamp = line_time(data[start:end])
+        if timestamp is not None:
+            return timestamp, end
+        start = end + 1
+    return None, limit
+
+
+def line_time(line):
+    entry = parse_line(line)
+    if entry is None:
+        return None
+    timestamp, _ = split_timestamp('{} '.format(entry.get('time', '')))
+    return timestamp
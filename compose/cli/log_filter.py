@@ -0,0 +1,55 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import re
+
+from . import colors
+
+
+# Words which mark the lines of each level, and of every level above it
+LEVEL_WORDS = [
+    ('error', ['emerg', 'alert', 'crit', 'critical', 'fatal', 'panic', 'err', 'error',
+               'exception', 'traceback']),
+    ('warning', ['warn', 'warning']),
+]
+LEVELS = [level for level, _ in LEVEL_WORDS]
+
+
+def level_pattern(level):
+    """Return a pattern matching the lines of `level` or above, e.g.
+    warnings and errors for 'warning'.
+    """
+    words = []
+    for name, level_words in LEVEL_WORDS:
+        words.extend(level_words)
+        if name == level:
+            return r'(?i)\b(?:{})\b'.format('|'.join(words))
+    raise ValueError("Unknown level {}, expected one of: {}".format(level, ', '.join(LEVELS)))
+
+
+class LogFilter(object):
+    """Select the log lines which match `grep` and `level`, and don't match
+    `exclude`.
+
+    Patterns are compiled once, and lines are matched by the readers before
+    they are formatted or queued, so lines which are filtered out cost
+    little more than a regex search.
+    """
+
+    def __init__(self, grep=None, exclude=None, level=None):
+        self.include = [
+            re.compile(pattern)
+            for pattern in (grep, level and level_pattern(level)) if pattern
+        ]
+        self.exclude = re.compile(exclude) if exclude else None
+
+    def match(self, line):
+        if self.exclude is not None and self.exclude.search(line):
+            return False
+        return all(pattern.search(line) for pattern in self.include)
+
+    def highlight(self, line):
+        """Return `line` with the parts which matched shown in reverse video."""
+        for pattern in self.include:
+            line = pattern.sub(lambda match: colors.ansi_color('7', match.group(0)), line)
+        return line
@@ -1,46 +1,176 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import heapq
+import json
+import logging
+import os
+import socket
 import sys
+import time
+from collections import defaultdict
+from collections import deque
 from collections import namedtuple
 from itertools import cycle
 from threading import Thread
 
 from six.moves import _thread as thread
 from six.moves.queue import Empty
+from six.moves.queue import Full
 from six.moves.queue import Queue
 
 from . import colors
+from .log_capture import DOCKER_TIMESTAMP
+from .log_capture import format_timestamp
+from .log_capture import split_timestamp
+from .log_file import JsonLogFile
+from .log_stream import ChunkedDecoder
+from .log_stream import FrameDecoder
+from .log_stream import is_chunked
+from .log_stream import read_available
+from .log_stream import READ_SIZE
+from .log_stream import response_socket
+from .log_stream import STREAM_NAMES
+from .log_stream import WOULD_BLOCK
 from compose import utils
 from compose.cli.signals import ShutdownException
+from compose.utils import LineBuffer
 from compose.utils import split_buffer
 
+try:
+    import selectors
+except ImportError:
+    selectors = None
+
+
+log = logging.getLogger(__name__)
+
+
+# Characters of output collected before they are written
+WRITE_BUFFER_SIZE = 64 * 1024
+# Seconds output is held at most before it is written, while lines keep coming
+FLUSH_INTERVAL = 0.05
+
+# Characters of output queued at most, while the output is slower than the
+# containers
+LOG_QUEUE_SIZE = 4 * 1024 * 1024
+# What readers do when the queue is full: wait for it to drain, which holds
+# up the containers' log streams, or drop their lines
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP = 'drop'
+
+# Lines read ahead for each container when logs are merged
+MERGE_WINDOW = 1000
+
+FORMAT_TEXT = 'text'
+FORMAT_JSON = 'json'
+LOG_FORMATS = (FORMAT_TEXT, FORMAT_JSON)
+
 
 class LogPresenter(object):
 
-    def __init__(self, prefix_width, color_func):
+    def __init__(self, prefix_width, color_func, log_filter=None, highlight=False):
         self.prefix_width = prefix_width
         self.color_func = color_func
+        self.log_filter = log_filter
+        self.highlight = highlight and log_filter is not None
+        self.container = None
+        self.prefix = None
+
+    def accepts(self, line):
+        """Return whether `line` should be shown at all. Readers check this
+        before a line is presented or queued.
+        """
+        return self.log_filter is None or self.log_filter.match(line)
+
+    def present(self, container, line, stream=None):
+        if self.highlight:
+            line = self.log_filter.highlight(line)
+        if container is not self.container:
+            # A presenter is used for one container at a time, so the
+            # colored prefix is only built when the container changes
+            self.container = container
+            self.prefix = '{} '.format(self.color_func(
+                container.name_without_project.ljust(self.prefix_width) + ' |'))
+        return self.prefix + line
+
+    def present_exit(self, container):
+        return self.color_func(wait_on_exit(container))
+
+
+class JsonLogPresenter(object):
+    """Present each log line as a JSON object on a line of its own, with
+    the container, its service and number, the stream the line was written
+    to (if known), and the time the daemon logged it, or the time it was
+    read if the daemon didn't add one.
+
+    The fields which are the same for every line of a container are encoded
+    once, so each line only costs encoding the line itself.
+    """
 
-    def present(self, container, line):
-        prefix = container.name_without_project.ljust(self.prefix_width)
-        return '{prefix} {line}'.format(
-            prefix=self.color_func(prefix + ' |'),
-            line=line)
-
-
-def build_log_presenters(service_names, monochrome):
+    def __init__(self, log_filter=None):
+        self.log_filter = log_filter
+        self.container = None
+        self.prefix = None
+
+    def accepts(self, line):
+        if self.log_filter is None:
+            return True
+        # The daemon's timestamp goes in its own field, so it isn't filtered
+        match = DOCKER_TIMESTAMP.match(line)
+        if match:
+            line = line[match.end():]
+        return self.log_filter.match(line)
+
+    def container_fields(self, container):
+        if container is not self.container:
+            self.container = container
+            self.prefix = json.dumps({
+                'container': container.name,
+                'service': container.service,
+                'number': container.number,
+            })[:-1]
+        return self.prefix
+
+    def present(self, container, line, stream=None):
+        match = DOCKER_TIMESTAMP.match(line)
+        if match:
+            timestamp, line = line[:match.end() - 1], line[match.end():]
+        else:
+            timestamp = format_timestamp(time.time())
+        if line.endswith('\n'):
+            line = line[:-1]
+
+        return '{}, "stream": {}, "time": {}, "line": {}}}\n'.format(
+            self.container_fields(container),
+            json.dumps(stream),
+            json.dumps(timestamp),
+            json.dumps(line))
+
+    def present_exit(self, container):
+        return '{}, "exit_code": {}}}\n'.format(
+            self.container_fields(container),
+            json.dumps(container.wait()))
+
+
+def build_log_presenters(service_names, monochrome, log_filter=None, log_format=FORMAT_TEXT):
     """Return an iterable of functions.
 
     Each function can be used to format the logs output of a container.
+    If `log_filter` is set, only the lines it matches are shown, with the
+    matches highlighted unless the output is monochrome.
     """
+    if log_format == FORMAT_JSON:
+        while True:
+            yield JsonLogPresenter(log_filter)
+
     prefix_width = max_name_width(service_names)
 
     def no_color(text):
         return text
 
     for color_func in cycle([no_color] if monochrome else colors.rainbow()):
-        yield LogPresenter(prefix_width, color_func)
+        yield LogPresenter(prefix_width, color_func, log_filter, not monochrome)
 
 
 def max_name_width(service_names, max_index_width=3):
@@ -62,20 +192,23 @@ class LogPrinter(object):
                  event_stream,
                  output=sys.stdout,
                  cascade_stop=False,
-                 log_args=None):
+                 log_args=None,
+                 capture=None):
         self.containers = containers
         self.presenters = presenters
         self.event_stream = event_stream
         self.output = utils.get_output_stream(output)
         self.cascade_stop = cascade_stop
         self.log_args = log_args or {}
+        self.capture = capture
 
     def run(self):
         if not self.containers:
             return
 
-        queue = Queue()
-        thread_args = queue, self.log_args
+        queue = LogQueue.from_env()
+        multiplexer = build_multiplexer(queue, self.log_args, self.capture)
+        thread_args = queue, self.log_args, multiplexer, self.capture
         thread_map = build_thread_map(self.containers, self.presenters, thread_args)
         start_producer_thread((
             thread_map,
@@ -83,19 +216,154 @@ class LogPrinter(object):
             self.presenters,
             thread_args))
 
-        for line in consume_queue(queue, self.cascade_stop):
-            remove_stopped_threads(thread_map)
-
-            if not line:
-                if not thread_map:
-                    # There are no running containers left to tail, so exit
-                    return
-                # We got an empty line because of a timeout, but there are still
-                # active containers to tail, so continue
-                continue
+        writer = BatchedWriter(self.output)
+        try:
+            for line in consume_queue(queue, self.cascade_stop):
+                if not line:
+                    remove_stopped_threads(thread_map)
+                    if not thread_map:
+                        # There are no running containers left to tail, so exit
+                        return
+                    # We got an empty line because of a timeout, but there are still
+                    # active containers to tail, so continue
+                    continue
+
+                writer.write(line)
+                if queue.empty():
+                    writer.flush()
+        finally:
+            writer.flush()
+            for name, count in sorted(queue.dropped.items()):
+                log.warn("{} log lines of {} were dropped because the output was "
+                         "too slow".format(count, name))
+
+
+class BatchedWriter(object):
+    """Write lines to `output` in batches.
+
+    Lines are written and flushed together once `max_size` characters have
+    been collected or `interval` seconds have passed since the last write,
+    so a container which prints many lines doesn't cost a write and a flush
+    for each of them. The caller flushes as soon as no more lines are
+    waiting, so output is never held back while containers are quiet.
+    """
 
-            self.output.write(line)
+    def __init__(self, output, max_size=WRITE_BUFFER_SIZE, interval=FLUSH_INTERVAL):
+        self.output = output
+        self.max_size = max_size
+        self.interval = interval
+        self.lines = []
+        self.size = 0
+        self.last_flush = time.time()
+
+    def write(self, line):
+        self.lines.append(line)
+        self.size += len(line)
+        if self.size >= self.max_size or time.time() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            self.output.write(''.join(self.lines))
             self.output.flush()
+            self.lines = []
+            self.size = 0
+        self.last_flush = time.time()
+
+
+class MergedLogPrinter(object):
+    """Print the logs of many containers as a single timeline, ordered by
+    the time the daemon logged each line.
+
+    The logs of all the containers are read at the same time, each by a
+    thread which reads at most `window` lines ahead into a queue of its
+    own, and the heads of the queues are merged with a heap. As the log of
+    each container is in order already, this puts every line in order
+    without holding more than `window` lines of each container in memory.
+    Logs which are followed never end, so they can't be merged.
+    """
+
+    def __init__(self,
+                 containers,
+                 presenters,
+                 output=sys.stdout,
+                 log_args=None,
+                 capture=None,
+                 window=MERGE_WINDOW):
+        self.containers = containers
+        self.presenters = presenters
+        self.output = utils.get_output_stream(output)
+        self.log_args = log_args or {}
+        self.capture = capture
+        self.window = window
+
+    def run(self):
+        # The timestamps are needed to merge lines, and only shown if asked for
+        log_args = dict(self.log_args, timestamps=True)
+        show_timestamps = self.log_args.get('timestamps')
+
+        readers = []
+        for container in self.containers:
+            queue = Queue(self.window)
+            reader = Thread(
+                target=read_for_merge,
+                args=(container, log_args, self.capture, queue))
+            reader.daemon = True
+            reader.start()
+            readers.append((container, next(self.presenters), queue))
+
+        heap = []
+        for index, (_, _, queue) in enumerate(readers):
+            push_next_line(heap, index, queue)
+
+        writer = BatchedWriter(self.output)
+        try:
+            while heap:
+                _, index, line = heapq.heappop(heap)
+                container, presenter, queue = readers[index]
+                push_next_line(heap, index, queue)
+
+                if not show_timestamps:
+                    line = split_timestamp(line)[1]
+                if presenter.accepts(line):
+                    writer.write(presenter.present(container, line))
+        finally:
+            writer.flush()
+
+
+def read_for_merge(container, log_args, capture, queue):
+    generator = get_log_generator(container, log_args, capture)
+    try:
+        for line in generator(container, log_args):
+            queue.put(QueueItem.new(line))
+    except Exception as e:
+        queue.put(QueueItem.exception(e))
+        return
+    queue.put(QueueItem.stop())
+
+
+def push_next_line(heap, index, queue):
+    """Push the next line of the container at `index` onto `heap`, by its
+    timestamp, unless it has no more lines.
+    """
+    while True:
+        try:
+            item = queue.get(timeout=0.1)
+            break
+        except Empty:
+            # Wait with a timeout, so the wait can be interrupted
+            continue
+        # See https://github.com/docker/compose/issues/189
+        except thread.error:
+            raise ShutdownException()
+
+    if item.exc:
+        raise item.exc
+    if item.is_stop:
+        return
+
+    timestamp, _ = split_timestamp(item.item)
+    heapq.heappush(heap, (timestamp or 0, index, item.item))
 
 
 def remove_stopped_threads(thread_map):
@@ -104,10 +372,35 @@ def remove_stopped_threads(thread_map):
             thread_map.pop(container_id, None)
 
 
-def build_thread(container, presenter, queue, log_args):
+def build_multiplexer(queue, log_args, capture=None):
+    """Return a running :class:`LogMultiplexer`, or None if the platform
+    doesn't support one, in which case each container gets a reader thread.
+    """
+    if selectors is None or sys.platform == 'win32':
+        return None
+    multiplexer = LogMultiplexer(queue, log_args, capture)
+    multiplexer.start()
+    return multiplexer
+
+
+def build_thread(container, presenter, queue, log_args, multiplexer=None, capture=None):
+    """Start reading the logs of `container`, with `multiplexer` if it can
+    poll its log stream, and with a thread of its own otherwise. Return an
+    object with an `is_alive()` method which tells if it is still reading.
+    """
+    reads_capture = capture is not None and capture.reads(container, log_args)
+    reads_file = not log_args.get('follow') and direct_logs_enabled()
+    if (
+        multiplexer is not None and container.has_api_logs and
+        not (reads_capture or reads_file)
+    ):
+        source = multiplexer.add(container, presenter)
+        if source is not None:
+            return source
+
     tailer = Thread(
         target=tail_container_logs,
-        args=(container, presenter, queue, log_args))
+        args=(container, presenter, queue, log_args, capture))
     tailer.daemon = True
     tailer.start()
     return tailer
@@ -135,27 +428,157 @@ class QueueItem(namedtuple('_QueueItem', 'item is_stop exc')):
         return cls(None, True, None)
 
 
-def tail_container_logs(container, presenter, queue, log_args):
-    generator = get_log_generator(container)
+class LogQueue(Queue):
+    """A queue of log output which holds at most `max_size` characters, so
+    memory use stays flat when the output is slower than the containers.
+
+    When the queue is full, readers wait for it to drain if `overflow` is
+    OVERFLOW_BLOCK, which in turn holds up the log streams of the
+    containers. With OVERFLOW_DROP, lines which don't fit are dropped and
+    counted for each container in `dropped`, and a note of how many were
+    dropped is shown with the next lines of the container which fit.
+    Stop and exception items are never dropped.
+    """
+
+    def __init__(self, max_size=LOG_QUEUE_SIZE, overflow=OVERFLOW_BLOCK):
+        Queue.__init__(self, max_size)
+        self.overflow = overflow
+        self.dropped = defaultdict(int)
+        self.unreported = defaultdict(int)
+
+    @classmethod
+    def from_env(cls):
+        """Configure the queue with COMPOSE_LOG_QUEUE_SIZE and
+        COMPOSE_LOG_OVERFLOW, if they are set and valid.
+        """
+        size = os.environ.get('COMPOSE_LOG_QUEUE_SIZE', '')
+        overflow = os.environ.get('COMPOSE_LOG_OVERFLOW')
+        return cls(
+            int(size) if size.isdigit() and int(size) else LOG_QUEUE_SIZE,
+            overflow if overflow in (OVERFLOW_BLOCK, OVERFLOW_DROP) else OVERFLOW_BLOCK)
+
+    # The size of the queue is the number of characters in it, with each
+    # item counting for at least one
+    def _init(self, maxsize):
+        Queue._init(self, maxsize)
+        self.size = 0
+
+    def _qsize(self, *args):
+        return self.size
+
+    def _put(self, item):
+        Queue._put(self, item)
+        self.size += item_size(item)
+
+    def _get(self):
+        item = Queue._get(self)
+        self.size -= item_size(item)
+        return item
+
+    def put_lines(self, presenter, container, lines):
+        """Present `lines` of `container`, a list of `(stream, line)`, and
+        put them on the queue as one item, unless they are dropped.
+        """
+        if not lines:
+            return
+
+        name = container.name_without_project
+        if self.unreported[name]:
+            note = "[{} lines dropped]\n".format(self.unreported[name])
+            lines = [(None, note)] + list(lines)
+
+        item = QueueItem.new(''.join(
+            presenter.present(container, line, stream) for stream, line in lines))
+        if self.overflow == OVERFLOW_BLOCK:
+            self.put(item)
+            return
+
+        try:
+            self.put_nowait(item)
+        except Full:
+            dropped = len(lines) - (1 if self.unreported[name] else 0)
+            self.dropped[name] += dropped
+            self.unreported[name] += dropped
+        else:
+            self.unreported[name] = 0
+
+
+def item_size(item):
+    return len(item.item) + 1 if item.item else 1
+
+
+def tail_container_logs(container, presenter, queue, log_args, capture=None):
+    writer = capture_writer(container, log_args, capture)
+    # An attached stream has no timestamps, requested logs can have them
+    # added for the capture
+    strip_timestamps = False
+    if container.log_stream is None:
+        read_args = capture_log_args(container, log_args, capture)
+        strip_timestamps = read_args.get('timestamps') and not log_args.get('timestamps')
+        log_args = read_args
+    generator = get_log_generator(container, log_args, capture)
 
     try:
         for item in generator(container, log_args):
-            queue.put(QueueItem.new(presenter.present(container, item)))
+            if writer is not None:
+                writer.write(item)
+            if strip_timestamps:
+                item = split_timestamp(item)[1]
+            if presenter.accepts(item):
+                queue.put_lines(presenter, container, [(None, item)])
     except Exception as e:
         queue.put(QueueItem.exception(e))
         return
+    finally:
+        if writer is not None:
+            writer.close()
 
     if log_args.get('follow'):
-        queue.put(QueueItem.new(presenter.color_func(wait_on_exit(container))))
+        queue.put(QueueItem.new(presenter.present_exit(container)))
     queue.put(QueueItem.stop())
 
 
-def get_log_generator(container):
+def get_log_generator(container, log_args=None, capture=None):
+    if capture is not None and capture.reads(container, log_args or {}):
+        return capture.log_generator
+    if not (log_args or {}).get('follow') and direct_logs_enabled():
+        return build_log_file_generator
     if container.has_api_logs:
         return build_log_generator
     return build_no_log_generator
 
 
+def direct_logs_enabled():
+    """Whether the log files of containers are read from disk, when they can
+    be, as set by COMPOSE_LOG_DIRECT.
+    """
+    return os.environ.get('COMPOSE_LOG_DIRECT', '').lower() in ('1', 'true')
+
+
+def is_captured(container, log_args, capture):
+    """Whether the lines of `container` are captured: when `capture` is set,
+    and they are followed from the daemon.
+    """
+    return capture is not None and log_args.get('follow') and container.has_api_logs
+
+
+def capture_writer(container, log_args, capture):
+    """Return a writer for the lines of `container` if they are captured."""
+    if not is_captured(container, log_args, capture):
+        return None
+    return capture.writer(container)
+
+
+def capture_log_args(container, log_args, capture):
+    """Return the arguments to request the logs of `container` with. Lines
+    which are captured are stored, and told apart from lines captured
+    before, by the daemon's timestamps, so they are always requested.
+    """
+    if not is_captured(container, log_args, capture):
+        return log_args
+    return dict(log_args, timestamps=True)
+
+
 def build_no_log_generator(container, log_args):
     """Return a generator that prints a warning about logs and waits for
     container to exit.
@@ -175,11 +598,246 @@ def build_log_generator(container, log_args):
     return split_buffer(stream)
 
 
+def build_log_file_generator(container, log_args):
+    """Read the logs of a container which uses the json-file log driver from
+    its log file, when the daemon is local and the file can be read, and
+    from the daemon otherwise.
+    """
+    path = container.get('LogPath')
+    if not container.has_api_logs:
+        return build_no_log_generator(container, log_args)
+    if container.log_driver not in (None, 'json-file') or not path:
+        return build_log_generator(container, log_args)
+    if not os.access(path, os.R_OK):
+        log.debug("Can't read {}, reading the logs of {} from the daemon".format(
+            path, container.name))
+        return build_log_generator(container, log_args)
+    return JsonLogFile(path).log_generator(log_args)
+
+
 def wait_on_exit(container):
     exit_code = container.wait()
     return "%s exited with code %s\n" % (container.name, exit_code)
 
 
+class LogSource(object):
+    """The log stream of one container, read from the socket of its attach
+    or logs response.
+    """
+
+    def __init__(self, container, presenter, sock, tty=False, chunked=False, response=None,
+                 writer=None, strip_timestamps=False):
+        self.container = container
+        self.presenter = presenter
+        self.sock = sock
+        self.response = response
+        self.writer = writer
+        # Set when the daemon's timestamps were only requested for `writer`
+        self.strip_timestamps = strip_timestamps
+        self.frames = None if tty else FrameDecoder()
+        self.chunks = ChunkedDecoder() if chunked else None
+        # The lines of each stream are split separately, as frames of stdout
+        # and stderr can be interleaved in the middle of a line
+        self.lines = {}
+        self.finished = False
+
+    def is_alive(self):
+        return not self.finished
+
+    @property
+    def done(self):
+        """The response has ended, although the socket may be kept open."""
+        return self.chunks is not None and self.chunks.done
+
+    def feed(self, data):
+        """Return the lines completed by `data`, as `(stream, line)`."""
+        if self.chunks is not None:
+            data = self.chunks.feed(data)
+        if self.frames is None:
+            frames = [(1, data)]
+        else:
+            frames = self.frames.feed(data)
+
+        lines = []
+        for stream, payload in frames:
+            stream = STREAM_NAMES.get(stream)
+            if stream not in self.lines:
+                self.lines[stream] = LineBuffer()
+            lines.extend((stream, line) for line in self.lines[stream].feed(payload))
+        return lines
+
+    def flush(self):
+        """Return what is left of the last line of each stream, if it had
+        no line break.
+        """
+        return [
+            (stream, line)
+            for stream, buffer in self.lines.items()
+            for line in buffer.flush()
+        ]
+
+    def close(self):
+        if self.response is not None:
+            self.response.close()
+        else:
+            self.sock.close()
+        if self.writer is not None:
+            self.writer.close()
+
+
+class LogMultiplexer(object):
+    """Read the logs of many containers on a single thread.
+
+    The socket of each log stream is switched to non-blocking mode and
+    polled with a selector, so following the logs of thousands of containers
+    doesn't take a thread (and a blocked read) for each of them. Containers
+    can be added from other threads while the multiplexer is running.
+    Formatted lines are put on `queue`, as reader threads do.
+    """
+
+    def __init__(self, queue, log_args, capture=None):
+        self.queue = queue
+        self.log_args = log_args
+        self.capture = capture
+        self.selector = selectors.DefaultSelector()
+        self.pending = deque()
+        self.wakeup_read, self.wakeup_write = socket.socketpair()
+        self.wakeup_read.setblocking(False)
+        self.selector.register(self.wakeup_read, selectors.EVENT_READ, None)
+
+    def start(self):
+        reader = Thread(target=self.run)
+        reader.daemon = True
+        reader.start()
+        return reader
+
+    def add(self, container, presenter):
+        """Start reading the logs of `container`, and return its
+        :class:`LogSource`, or None if its log stream can't be polled, in
+        which case `container.log_stream` is left for a reader thread.
+        """
+        response = container.log_response
+        container.log_response = None
+        if response is not None:
+            sock, buffered = response_socket(response)
+            if sock is None:
+                # The attached stream is read by a thread instead
+                return None
+            strip_timestamps = False
+        else:
+            log_args = capture_log_args(container, self.log_args, self.capture)
+            response = container.open_log_response(**log_args)
+            sock, buffered = response_socket(response)
+            if sock is None:
+                # A thread requests the logs of its own
+                response.close()
+                return None
+            strip_timestamps = log_args.get('timestamps') and not self.log_args.get('timestamps')
+
+        container.log_stream = None
+        source = LogSource(
+            container,
+            presenter,
+            sock,
+            tty=container.get('Config.Tty'),
+            chunked=is_chunked(response),
+            response=response,
+            writer=capture_writer(container, self.log_args, self.capture),
+            strip_timestamps=bool(strip_timestamps))
+        self.add_source(source, buffered)
+        return source
+
+    def add_source(self, source, buffered=b''):
+        """Register `source` with the running loop. `buffered` is any output
+        which has already been read from its socket.
+        """
+        self.pending.append((source, buffered))
+        self.wakeup_write.send(b'\0')
+
+    def run(self):
+        try:
+            while True:
+                for key, _ in self.selector.select():
+                    if key.data is None:
+                        self.register_pending()
+                    else:
+                        self.read(key.data)
+        except Exception as e:
+            self.queue.put(QueueItem.exception(e))
+
+    def register_pending(self):
+        try:
+            while self.wakeup_read.recv(READ_SIZE):
+                pass
+        except socket.error as e:
+            if e.errno not in WOULD_BLOCK:
+                raise
+
+        while self.pending:
+            source, buffered = self.pending.popleft()
+            self.selector.register(source.sock, selectors.EVENT_READ, source)
+            if buffered:
+                self.put_lines(source, source.feed(buffered))
+            if source.done:
+                self.finish(source)
+
+    def read(self, source):
+        try:
+            data, eof = read_available(source.sock)
+        except socket.error as e:
+            self.finish(source, exception=e)
+            return
+
+        if data:
+            self.put_lines(source, source.feed(data))
+        if eof or source.done:
+            self.finish(source)
+
+    def put_lines(self, source, lines):
+        if source.writer is not None:
+            for _, line in lines:
+                source.writer.write(line)
+        if source.strip_timestamps:
+            lines = [(stream, split_timestamp(line)[1]) for stream, line in lines]
+        presenter = source.presenter
+        # All the lines from one read go on the queue as one item
+        self.queue.put_lines(
+            presenter,
+            source.container,
+            [(stream, line) for stream, line in lines if presenter.accepts(line)])
+
+    def finish(self, source, exception=None):
+        self.selector.unregister(source.sock)
+        self.put_lines(source, source.flush())
+        source.close()
+
+        if exception is not None:
+            self.queue.put(QueueItem.exception(exception))
+        elif self.log_args.get('follow'):
+            # The stream can end before the container stops, so wait for it
+            # on a thread of its own rather than blocking every other stream
+            waiter = Thread(target=report_exit, args=(source, self.queue))
+            waiter.daemon = True
+            waiter.start()
+            return
+        else:
+            self.queue.put(QueueItem.stop())
+        source.finished = True
+
+
+def report_exit(source, queue):
+    """Wait for the container of `source` to exit, and put its exit line on
+    `queue`.
+    """
+    try:
+        queue.put(QueueItem.new(source.presenter.present_exit(source.container)))
+    except Exception as e:
+        queue.put(QueueItem.exception(e))
+    else:
+        queue.put(QueueItem.stop())
+    source.finished = True
+
+
 def start_producer_thread(thread_args):
     producer = Thread(target=watch_events, args=thread_args)
     producer.daemon = True
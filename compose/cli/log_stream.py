@@ -0,0 +1,146 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import errno
+import socket
+import ssl
+import struct
+
+
+# Bytes read from a socket with each call to recv()
+READ_SIZE = 64 * 1024
+# Bytes read from one socket before the others get a turn
+MAX_READ_PER_EVENT = 16 * READ_SIZE
+
+STREAM_HEADER = struct.Struct('>BxxxL')
+STREAM_NAMES = {0: 'stdin', 1: 'stdout', 2: 'stderr'}
+
+WOULD_BLOCK = (errno.EAGAIN, errno.EWOULDBLOCK)
+
+
+class FrameDecoder(object):
+    """Incrementally split the output of a container without a tty into the
+    frames Docker multiplexes stdout and stderr with: an 8 byte header with
+    the stream and the length of the payload, followed by the payload.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Return a list of `(stream, payload)` for each frame completed by
+        `data`.
+        """
+        self.buffer.extend(data)
+        frames = []
+        offset = 0
+        while len(self.buffer) - offset >= STREAM_HEADER.size:
+            stream, length = STREAM_HEADER.unpack_from(self.buffer, offset)
+            start = offset + STREAM_HEADER.size
+            if len(self.buffer) - start < length:
+                break
+            frames.append((stream, bytes(self.buffer[start:start + length])))
+            offset = start + length
+        del self.buffer[:offset]
+        return frames
+
+
+class ChunkedDecoder(object):
+    """Incrementally decode the body of a response sent with chunked
+    transfer encoding, which is how the daemon sends `logs` (but not
+    `attach`) responses.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        # Bytes of data left in the current chunk, and whether the CRLF
+        # after it is still to come
+        self.chunk_left = 0
+        self.chunk_end = False
+        self.done = False
+
+    def feed(self, data):
+        self.buffer.extend(data)
+        output = []
+        offset = 0
+        while not self.done:
+            if self.chunk_left:
+                end = min(offset + self.chunk_left, len(self.buffer))
+                output.append(bytes(self.buffer[offset:end]))
+                self.chunk_left -= end - offset
+                offset = end
+                if self.chunk_left:
+                    break
+                self.chunk_end = True
+
+            if self.chunk_end:
+                if len(self.buffer) - offset < 2:
+                    break
+                offset += 2
+                self.chunk_end = False
+
+            index = self.buffer.find(b'\r\n', offset)
+            if index == -1:
+                break
+            size = int(bytes(self.buffer[offset:index]).split(b';')[0], 16)
+            offset = index + 2
+            if not size:
+                self.done = True
+            self.chunk_left = size
+
+        del self.buffer[:offset]
+        return b''.join(output)
+
+
+def response_socket(response):
+    """Return the socket of a streamed `requests` response, switched to
+    non-blocking mode, and any output already read into the buffer of the
+    response, or `(None, b'')` if the response isn't read from a socket.
+    """
+    try:
+        fp = response.raw._fp.fp
+        sock = fp.raw._sock
+    except AttributeError:
+        return None, b''
+    if not isinstance(sock, socket.socket):
+        return None, b''
+
+    sock.setblocking(False)
+    # Reading the headers may have read the start of the body too
+    buffered = fp.peek()
+    if buffered:
+        fp.read(len(buffered))
+    return sock, buffered
+
+
+def is_chunked(response):
+    return bool(getattr(response.raw._fp, 'chunked', False))
+
+
+def read_available(sock):
+    """Read what is available from the non-blocking `sock`, and return it
+    with whether the end of the stream was reached.
+    """
+    chunks = []
+    size = 0
+    while size < MAX_READ_PER_EVENT or pending_bytes(sock):
+        try:
+            data = sock.recv(READ_SIZE)
+        except ssl.SSLWantReadError:
+            break
+        except socket.error as e:
+            if e.errno in WOULD_BLOCK:
+                break
+            raise
+        if not data:
+            return b''.join(chunks), True
+        chunks.append(data)
+        size += len(data)
+    return b''.join(chunks), False
+
+
+def pending_bytes(sock):
+    """Bytes which have been decrypted but not read yet, which a selector
+    can't know about.
+    """
+    return sock.pending() if isinstance(sock, ssl.SSLSocket) else 0
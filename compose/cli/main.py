@@ -14,6 +14,7 @@ from operator import attrgetter
 from . import errors
 from . import signals
 from .. import __version__
+from ..bundle import BundleError
 from ..config import config
 from ..config import ConfigurationError
 from ..config import parse_environment
@@ -21,14 +22,18 @@ from ..config.environment import Environment
 from ..config.serialize import serialize_config
 from ..const import DEFAULT_TIMEOUT
 from ..const import IS_WINDOWS_PLATFORM
+from ..pool import ContainerPool
 from ..progress_stream import StreamOutputError
 from ..project import NoSuchService
 from ..project import OneOffFilter
+from ..readiness import ReadinessError
+from ..reaper import Reaper
 from ..service import BuildAction
 from ..service import BuildError
 from ..service import ConvergenceStrategy
 from ..service import ImageType
 from ..service import NeedsBuildError
+from ..service import StartFirstError
 from .command import get_config_path_from_options
 from .command import project_from_options
 from .docopt_command import DocoptDispatcher
@@ -37,8 +42,16 @@ from .docopt_command import NoSuchCommand
 from .errors import UserError
 from .formatter import ConsoleWarningFormatter
 from .formatter import Formatter
+from .log_capture import LogCapture
+from .log_capture import parse_time
+from .log_filter import LEVELS
+from .log_filter import LogFilter
 from .log_printer import build_log_presenters
+from .log_printer import FORMAT_JSON
+from .log_printer import FORMAT_TEXT
+from .log_printer import LOG_FORMATS
 from .log_printer import LogPrinter
+from .log_printer import MergedLogPrinter
 from .utils import get_version_info
 from .utils import yesno
 
@@ -58,7 +71,8 @@ def main():
     except (KeyboardInterrupt, signals.ShutdownException):
         log.error("Aborting.")
         sys.exit(1)
-    except (UserError, NoSuchService, ConfigurationError) as e:
+    except (UserError, NoSuchService, ConfigurationError, StartFirstError,
+            ReadinessError, BundleError) as e:
         log.error(e.msg)
         sys.exit(1)
     except BuildError as e:
@@ -163,6 +177,7 @@ class TopLevelCommand(object):
 
     Commands:
       build              Build or rebuild services
+      bundle             Save service images to an archive, or load them
       config             Validate and view the compose file
       create             Create services
       down               Stop and remove containers, networks, images, and volumes
@@ -170,6 +185,7 @@ class TopLevelCommand(object):
       exec               Execute a command in a running container
       help               Get help on a command
       kill               Kill containers
+      lock               Lock service images to their current digests
       logs               View output from containers
       pause              Pause services
       port               Print the public port for a port binding
@@ -201,15 +217,36 @@ class TopLevelCommand(object):
         Usage: build [options] [SERVICE...]
 
         Options:
-            --force-rm  Always remove intermediate containers.
-            --no-cache  Do not use cache when building the image.
-            --pull      Always attempt to pull a newer version of the image.
+            --force-rm       Always remove intermediate containers.
+            --no-cache       Do not use cache when building the image.
+            --pull           Always attempt to pull a newer version of the image.
+            --cache-dir DIR  Load images which were built from the same context
+                             from DIR instead of building them, and save built
+                             images to DIR.
         """
         self.project.build(
             service_names=options['SERVICE'],
             no_cache=bool(options.get('--no-cache', False)),
             pull=bool(options.get('--pull', False)),
-            force_rm=bool(options.get('--force-rm', False)))
+            force_rm=bool(options.get('--force-rm', False)),
+            cache_dir=options.get('--cache-dir'))
+
+    def bundle(self, options):
+        """
+        Save the images of services to a single archive, or load the images
+        in an archive into the daemon, e.g. to move them to a host without
+        access to a registry.
+
+        Layers which are shared by several images are only stored once in
+        the archive. Images are loaded in parallel.
+
+        Usage: bundle save FILE [SERVICE...]
+               bundle load FILE
+        """
+        if options['save']:
+            self.project.save_bundle(options['FILE'], service_names=options['SERVICE'])
+        else:
+            self.project.load_bundle(options['FILE'])
 
     def config(self, config_options, options):
         """
@@ -380,6 +417,19 @@ class TopLevelCommand(object):
 
         self.project.kill(service_names=options['SERVICE'], signal=signal)
 
+    def lock(self, options):
+        """
+        Resolve the images of services to their current digests, and write
+        them to a lockfile (docker-compose.lock) next to the Compose file.
+
+        While the lockfile exists, containers are created from the locked
+        digests, and `pull` only pulls the locked images which are missing.
+        Run `lock` again to update the digests.
+
+        Usage: lock [SERVICE...]
+        """
+        self.project.lock(service_names=options['SERVICE'])
+
     def logs(self, options):
         """
         View output from containers.
@@ -392,6 +442,21 @@ class TopLevelCommand(object):
             -t, --timestamps    Show timestamps.
             --tail="all"        Number of lines to show from the end of the logs
                                 for each container.
+            --grep=REGEX        Only show lines which match REGEX, with the
+                                matches highlighted.
+            --exclude=REGEX     Don't show lines which match REGEX.
+            --level=LEVEL       Only show lines which mention LEVEL (error or
+                                warning) or a level above it.
+            --since=TIME        Only show lines since TIME, in seconds since the
+                                epoch or as a UTC time like 2016-05-01T12:00:00.
+            --until=TIME        Only show lines until TIME. Needs --capture-dir.
+            --capture-dir=DIR   Read logs which were captured to DIR, if there
+                                are any, instead of from the daemon. With
+                                --follow, capture the logs to DIR.
+            --format=FORMAT     Output format, text or json (one JSON object
+                                per line). [default: text]
+            --merge             Show the lines of all containers in the order
+                                they were logged. Can't be used with --follow.
         """
         containers = self.project.containers(service_names=options['SERVICE'], stopped=True)
 
@@ -406,12 +471,46 @@ class TopLevelCommand(object):
             'tail': tail,
             'timestamps': options['--timestamps']
         }
-        print("Attaching to", list_containers(containers))
+        log_format = log_format_from_option(options['--format'])
+        if log_format == FORMAT_JSON:
+            # The daemon's timestamps go in their own field
+            log_args['timestamps'] = True
+        if options['--since']:
+            log_args['since'] = int(time_from_option('--since', options['--since']))
+        until = options['--until'] and time_from_option('--until', options['--until'])
+        if until and not options['--capture-dir']:
+            raise UserError("--until can only be used with --capture-dir")
+
+        if options['--merge'] and options['--follow']:
+            raise UserError("--merge and --follow cannot be combined.")
+
+        capture = None
+        if options['--capture-dir']:
+            capture = LogCapture(options['--capture-dir'], until=until)
+
+        log_filter = log_filter_from_options(options)
+        if options['--merge']:
+            MergedLogPrinter(
+                containers,
+                build_log_presenters(
+                    self.project.service_names,
+                    options['--no-color'],
+                    log_filter,
+                    log_format),
+                log_args=log_args,
+                capture=capture).run()
+            return
+
+        if log_format != FORMAT_JSON:
+            print("Attaching to", list_containers(containers))
         log_printer_from_project(
             self.project,
             containers,
             options['--no-color'],
-            log_args).run()
+            log_args,
+            log_filter=log_filter,
+            capture=capture,
+            log_format=log_format).run()
 
     def pause(self, options):
         """
@@ -566,6 +665,9 @@ class TopLevelCommand(object):
             -T                    Disable pseudo-tty allocation. By default `docker-compose run`
                                   allocates a TTY.
             -w, --workdir=""      Working directory inside the container
+            --pool SIZE           Start a pre-created container from a pool of SIZE
+                                  stopped containers with the same options, and
+                                  add a container to the pool in the background.
         """
         service = self.project.get_service(options['SERVICE'])
         detach = options['-d']
@@ -582,6 +684,12 @@ class TopLevelCommand(object):
                 'can not be used togather'
             )
 
+        if options['--pool'] is not None:
+            if not options['--pool'].isdigit() or not int(options['--pool']):
+                raise UserError("pool flag must be a positive number")
+            if options['--name']:
+                raise UserError("--pool and --name cannot be combined.")
+
         if options['COMMAND']:
             command = [options['COMMAND']] + options['ARGS']
         else:
@@ -606,6 +714,7 @@ class TopLevelCommand(object):
                                      (default: 10)
         """
         timeout = int(options.get('--timeout') or DEFAULT_TIMEOUT)
+        services = []
 
         for s in options['SERVICE=NUM']:
             if '=' not in s:
@@ -616,7 +725,11 @@ class TopLevelCommand(object):
             except ValueError:
                 raise UserError('Number of containers for service "%s" is not a '
                                 'number' % service_name)
-            self.project.get_service(service_name).scale(num, timeout=timeout)
+            services.append((self.project.get_service(service_name), num))
+
+        with Reaper() as reaper:
+            for service, num in services:
+                service.scale(num, timeout=timeout, reaper=reaper)
 
     def start(self, options):
         """
@@ -706,6 +819,14 @@ class TopLevelCommand(object):
                                        running. (default: 10)
             --remove-orphans           Remove containers for services not
                                        defined in the Compose file
+            --start-first              When recreating a container, start the new
+                                       container before stopping the old one. Ignored
+                                       for services with a container_name or host ports.
+            --capture-dir DIR          Capture the logs of attached containers to DIR,
+                                       to read them later with `logs --capture-dir`.
+            --log-format FORMAT        Format of the logs of attached containers, text
+                                       or json (one JSON object per line).
+                                       (default: text)
         """
         start_deps = not options['--no-deps']
         cascade_stop = options['--abort-on-container-exit']
@@ -713,36 +834,44 @@ class TopLevelCommand(object):
         timeout = int(options.get('--timeout') or DEFAULT_TIMEOUT)
         remove_orphans = options['--remove-orphans']
         detached = options.get('-d')
+        capture = options.get('--capture-dir') and LogCapture(options['--capture-dir'])
+        log_format = log_format_from_option(options.get('--log-format'))
 
         if detached and cascade_stop:
             raise UserError("--abort-on-container-exit and -d cannot be combined.")
 
-        with up_shutdown_context(self.project, service_names, timeout, detached):
-            to_attach = self.project.up(
-                service_names=service_names,
-                start_deps=start_deps,
-                strategy=convergence_strategy_from_opts(options),
-                do_build=build_action_from_opts(options),
-                timeout=timeout,
-                detached=detached,
-                remove_orphans=remove_orphans)
-
-            if detached:
-                return
-
-            log_printer = log_printer_from_project(
-                self.project,
-                filter_containers_to_service_names(to_attach, service_names),
-                options['--no-color'],
-                {'follow': True},
-                cascade_stop,
-                event_stream=self.project.events(service_names=service_names))
-            print("Attaching to", list_containers(log_printer.containers))
-            log_printer.run()
-
-            if cascade_stop:
-                print("Aborting on container exit...")
-                self.project.stop(service_names=service_names, timeout=timeout)
+        with Reaper() as reaper:
+            with up_shutdown_context(self.project, service_names, timeout, detached):
+                to_attach = self.project.up(
+                    service_names=service_names,
+                    start_deps=start_deps,
+                    strategy=convergence_strategy_from_opts(options),
+                    do_build=build_action_from_opts(options),
+                    timeout=timeout,
+                    detached=detached,
+                    remove_orphans=remove_orphans,
+                    reaper=reaper,
+                    start_first=options['--start-first'])
+
+                if detached:
+                    return
+
+                log_printer = log_printer_from_project(
+                    self.project,
+                    filter_containers_to_service_names(to_attach, service_names),
+                    options['--no-color'],
+                    {'follow': True},
+                    cascade_stop,
+                    event_stream=self.project.events(service_names=service_names),
+                    capture=capture,
+                    log_format=log_format)
+                if log_format != FORMAT_JSON:
+                    print("Attaching to", list_containers(log_printer.containers))
+                log_printer.run()
+
+                if cascade_stop:
+                    print("Aborting on container exit...")
+                    self.project.stop(service_names=service_names, timeout=timeout)
 
     @classmethod
     def version(cls, options):
@@ -841,12 +970,11 @@ def run_one_off_container(container_options, project, service, options):
                 start_deps=True,
                 strategy=ConvergenceStrategy.never)
 
-    project.initialize()
-
-    container = service.create_container(
-        quiet=True,
-        one_off=True,
-        **container_options)
+    container, pool = claim_or_create_container(container_options, project, service, options)
+    if pool:
+        # The replacement is created while the command runs, and isn't
+        # waited for
+        pool.refill_in_background()
 
     if options['-d']:
         service.start_container(container)
@@ -883,6 +1011,25 @@ def run_one_off_container(container_options, project, service, options):
     sys.exit(exit_code)
 
 
+def claim_or_create_container(container_options, project, service, options):
+    """Return a one-off container claimed from the pool if `--pool` is set
+    and it has one, or a newly created container, and the pool.
+    """
+    pool = None
+    if options['--pool']:
+        pool = ContainerPool(service, int(options['--pool']), container_options)
+        container = pool.claim()
+        if container is not None:
+            return container, pool
+
+    project.initialize()
+    container = service.create_container(
+        quiet=True,
+        one_off=True,
+        **container_options)
+    return container, pool
+
+
 def log_printer_from_project(
     project,
     containers,
@@ -890,13 +1037,45 @@ def log_printer_from_project(
     log_args,
     cascade_stop=False,
     event_stream=None,
+    log_filter=None,
+    capture=None,
+    log_format=FORMAT_TEXT,
 ):
     return LogPrinter(
         containers,
-        build_log_presenters(project.service_names, monochrome),
+        build_log_presenters(project.service_names, monochrome, log_filter, log_format),
         event_stream or project.events(),
         cascade_stop=cascade_stop,
-        log_args=log_args)
+        log_args=log_args,
+        capture=capture)
+
+
+def log_format_from_option(value):
+    if not value:
+        return FORMAT_TEXT
+    if value not in LOG_FORMATS:
+        raise UserError("format must be one of: {}".format(', '.join(LOG_FORMATS)))
+    return value
+
+
+def time_from_option(name, value):
+    try:
+        return parse_time(value)
+    except ValueError as e:
+        raise UserError("{}: {}".format(name, e))
+
+
+def log_filter_from_options(options):
+    grep, exclude, level = options['--grep'], options['--exclude'], options['--level']
+    if not (grep or exclude or level):
+        return None
+
+    if level and level not in LEVELS:
+        raise UserError("level must be one of: {}".format(', '.join(LEVELS)))
+    try:
+        return LogFilter(grep=grep, exclude=exclude, level=level)
+    except re.error as e:
+        raise UserError("Invalid pattern: {}".format(e))
 
 
 def filter_containers_to_service_names(containers, service_names):
@@ -38,6 +38,7 @@ from .validation import validate_config_section
 from .validation import validate_depends_on
 from .validation import validate_extends_file_path
 from .validation import validate_network_mode
+from .validation import validate_readiness
 from .validation import validate_service_constraints
 from .validation import validate_top_level_object
 from .validation import validate_ulimits
@@ -94,6 +95,7 @@ ALLOWED_KEYS = DOCKER_CONFIG_KEYS + [
     'log_opt',
     'logging',
     'network_mode',
+    'readiness',
 ]
 
 DOCKER_VALID_URL_PREFIXES = (
@@ -580,6 +582,7 @@ def validate_service(service_config, service_names, version):
     validate_ulimits(service_config)
     validate_network_mode(service_config, service_names)
     validate_depends_on(service_config, service_names)
+    validate_readiness(service_config)
 
     if not service_dict.get('image') and has_uppercase(service_name):
         raise ConfigurationError(
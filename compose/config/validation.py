@@ -179,6 +179,35 @@ def validate_depends_on(service_config, service_names):
                 "undefined.".format(s=service_config, dep=dependency))
 
 
+def validate_readiness(service_config):
+    if 'readiness' not in service_config.config:
+        return
+
+    readiness = service_config.config['readiness']
+    checks = [check for check in ('port', 'exec', 'log') if check in readiness]
+    if len(checks) != 1:
+        raise ConfigurationError(
+            "Service '{s.name}' has an invalid readiness probe. It must "
+            "define exactly one of 'port', 'exec' or 'log'.".format(
+                s=service_config))
+
+    if 'log' in readiness:
+        try:
+            re.compile(readiness['log'])
+        except re.error as e:
+            raise ConfigurationError(
+                "Service '{s.name}' has an invalid readiness log pattern "
+                "'{pattern}': {error}".format(
+                    s=service_config,
+                    pattern=readiness['log'],
+                    error=e))
+
+    if 'port' in readiness and 'ports' not in service_config.config:
+        raise ConfigurationError(
+            "Service '{s.name}' has a readiness port but does not publish "
+            "any ports.".format(s=service_config))
+
+
 def get_unsupported_config_msg(path, error_key):
     msg = "Unsupported config option for {}: '{}'".format(path_string(path), error_key)
     if error_key in DOCKER_CONFIG_HINTS:
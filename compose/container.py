@@ -20,6 +20,7 @@ class Container(object):
         self.dictionary = dictionary
         self.has_been_inspected = has_been_inspected
         self.log_stream = None
+        self.log_response = None
 
     @classmethod
     def from_ps(cls, client, dictionary, **kwargs):
@@ -44,7 +45,41 @@ class Container(object):
     @classmethod
     def create(cls, client, **options):
         response = client.create_container(**options)
-        return cls.from_id(client, response['Id'])
+        return cls.from_create(client, response, options)
+
+    @classmethod
+    def from_create(cls, client, response, options):
+        """
+        Construct a container object from the response of POST
+        /containers/create and the options which were sent with it. Values
+        which are not known from the request are read by inspecting the
+        container the first time they are needed.
+        """
+        if not options.get('name'):
+            return cls.from_id(client, response['Id'])
+
+        host_config = options.get('host_config') or {}
+        network_mode = host_config.get('NetworkMode')
+        if network_mode and not network_mode.startswith('container:'):
+            networks = {network_mode: {}}
+        else:
+            networks = {}
+
+        dictionary = {
+            'Id': response['Id'],
+            'Image': options.get('image'),
+            'Name': '/' + options['name'],
+            'Config': {
+                'Labels': dict(options.get('labels') or {}),
+                'Tty': bool(options.get('tty')),
+            },
+            # Sent as it is, so the log driver is known without inspecting
+            'HostConfig': dict(host_config),
+            'NetworkSettings': {
+                'Networks': networks,
+            },
+        }
+        return cls(client, dictionary)
 
     @property
     def id(self):
@@ -168,22 +203,58 @@ class Container(object):
     def attach_log_stream(self):
         """A log stream can only be attached if the container uses a json-file
         log driver.
+
+        The raw response is kept as well, so the log printer can read it
+        straight from its socket instead of through the stream.
         """
         if self.has_api_logs:
-            self.log_stream = self.attach(stdout=True, stderr=True, stream=True)
+            self.log_response = self.client._post(
+                self.client._url('/containers/{0}/attach', self.id),
+                params={'stdout': 1, 'stderr': 1, 'stream': 1},
+                stream=True)
+            self.log_stream = self.stream_response(self.log_response)
+
+    def open_log_response(self, follow=False, tail='all', timestamps=False, since=None):
+        """Request the logs of the container, and return the raw response
+        without reading any of it.
+        """
+        params = {
+            'stdout': 1,
+            'stderr': 1,
+            'follow': follow and 1 or 0,
+            'timestamps': timestamps and 1 or 0,
+            'tail': 'all' if tail is None else tail,
+        }
+        if since is not None:
+            params['since'] = since
+        return self.client._get(
+            self.client._url('/containers/{0}/logs', self.id),
+            params=params,
+            stream=True)
+
+    def stream_response(self, response):
+        """Return a stream of the output in the raw `response` of an attach
+        or logs request.
+        """
+        return self.client._get_result_tty(True, response, self.get('Config.Tty'))
 
     def get(self, key):
         """Return a value from the container or None if the value is not set.
 
+        If the container has not been inspected, values already present in
+        the partial dictionary are returned without inspecting it.
+
         :param key: a string using dotted notation for nested dictionary
                     lookups
         """
-        self.inspect_if_not_inspected()
-
-        def get_value(dictionary, key):
-            return (dictionary or {}).get(key)
+        if not self.has_been_inspected:
+            value = reduce(get_value, key.split('.'), self.dictionary)
+            if value is not _missing:
+                return value
+            self.inspect()
 
-        return reduce(get_value, key.split('.'), self.dictionary)
+        value = reduce(get_value, key.split('.'), self.dictionary)
+        return None if value is _missing else value
 
     def get_local_port(self, port, protocol='tcp'):
         port = self.ports.get("%s/%s" % (port, protocol))
@@ -261,6 +332,15 @@ class Container(object):
         return self.id.__hash__()
 
 
+_missing = object()
+
+
+def get_value(dictionary, key):
+    if dictionary is _missing:
+        return _missing
+    return (dictionary or {}).get(key, _missing)
+
+
 def get_container_name(container):
     if not container.get('Name') and not container.get('Names'):
         return None
@@ -0,0 +1,131 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import logging
+import os
+import tarfile
+import tempfile
+from contextlib import closing
+
+from .build_context import READ_CHUNK_SIZE
+from .build_context import read_blocks
+from .build_context import stream_tar
+from .utils import atomic_write
+from .utils import makedirs
+
+
+log = logging.getLogger(__name__)
+
+
+MEMBER_FIELDS = ('name', 'type', 'mode', 'mtime', 'size', 'linkname', 'uid', 'gid')
+
+
+class ImageCache(object):
+    """A directory of images saved with `docker save`, keyed by the digest of
+    the build context they were built from (see
+    :func:`compose.build_context.context_digest`).
+
+    The files in a saved image (mostly the tarballs of its layers) are
+    stored once by their content in `blobs/`, so layers shared by several
+    images only take up space once. `images/` has an index of the files of
+    each image, which is used to put the archive back together for
+    `docker load`. Images are streamed in both directions, so they are never
+    held in memory or written to disk as a whole.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(os.path.expanduser(path))
+
+    def blob_path(self, blob_digest):
+        return os.path.join(self.path, 'blobs', blob_digest)
+
+    def entry_path(self, digest):
+        return os.path.join(self.path, 'images', '{}.json'.format(digest))
+
+    def has(self, digest):
+        return os.path.exists(self.entry_path(digest))
+
+    def save(self, client, image, image_id, digest):
+        """Save `image` (with id `image_id`) from the daemon as the image
+        built from a context with `digest`.
+        """
+        log.debug('Saving {} to the build cache'.format(image))
+        members = []
+        with closing(client.get_image(image)) as response:
+            archive = tarfile.open(mode='r|', fileobj=response)
+            for info in archive:
+                member = member_entry(info)
+                if info.isreg():
+                    member['blob'] = self.store_blob(archive.extractfile(info))
+                members.append(member)
+
+        write_json(self.entry_path(digest), {
+            'image': image,
+            'image_id': image_id,
+            'members': members,
+        })
+
+    def load(self, client, digest):
+        """Load the image built from a context with `digest` into the
+        daemon, and return its id.
+        """
+        with open(self.entry_path(digest), 'r') as f:
+            entry = json.load(f)
+
+        log.debug('Loading {} from the build cache'.format(entry['image']))
+        client.load_image(stream_tar(self.members(entry)))
+        return entry['image_id']
+
+    def members(self, entry):
+        for member in entry['members']:
+            info = member_info(member)
+            if 'blob' in member:
+                yield info, read_blocks(self.blob_path(member['blob']), info.size)
+            else:
+                yield info, None
+
+    def store_blob(self, fileobj):
+        """Copy `fileobj` into the blob store, unless a blob with the same
+        contents is already stored, and return the digest of its contents.
+        """
+        directory = os.path.join(self.path, 'blobs')
+        if not os.path.isdir(directory):
+            makedirs(directory)
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            for data in iter(lambda: fileobj.read(READ_CHUNK_SIZE), b''):
+                digest.update(data)
+                f.write(data)
+
+        blob_digest = digest.hexdigest()
+        if os.path.exists(self.blob_path(blob_digest)):
+            os.remove(tmp_path)
+        else:
+            os.rename(tmp_path, self.blob_path(blob_digest))
+        return blob_digest
+
+
+def member_entry(info):
+    """Return a JSON serializable record of the tar member `info`."""
+    member = dict((field, getattr(info, field)) for field in MEMBER_FIELDS)
+    member['type'] = member['type'].decode('ascii')
+    return member
+
+
+def member_info(member):
+    """Return the TarInfo of a member recorded by :func:`member_entry`."""
+    info = tarfile.TarInfo(member['name'])
+    for field in MEMBER_FIELDS:
+        if field != 'name':
+            setattr(info, field, member[field])
+    info.type = info.type.encode('ascii')
+    return info
+
+
+def write_json(path, data):
+    with atomic_write(path) as f:
+        json.dump(data, f)
@@ -0,0 +1,35 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from .service import image_key
+
+
+class ImageIndex(object):
+    """The images of the daemon by name, loaded with a single `images()`
+    call at the start of an operation, so services don't each inspect their
+    image to find out if it exists and what its id is.
+
+    An image which isn't in the index may still exist under a name which is
+    written differently, so a miss is not proof that an image doesn't exist.
+    """
+
+    def __init__(self, images=()):
+        self.images = {}
+        for image in images:
+            entry = {'Id': image['Id']}
+            for name in (image.get('RepoTags') or []) + (image.get('RepoDigests') or []):
+                if not name.startswith('<none>'):
+                    self.images[image_key(name)] = entry
+
+    @classmethod
+    def load(cls, client):
+        return cls(client.images())
+
+    def get(self, name):
+        return self.images.get(image_key(name))
+
+    def add(self, name, image):
+        self.images[image_key(name)] = image
+
+    def discard(self, name):
+        self.images.pop(image_key(name), None)
@@ -0,0 +1,69 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import json
+import os
+
+import six
+
+from .config import ConfigurationError
+from .service import image_key
+from .utils import atomic_write
+
+
+LOCKFILE_NAME = 'docker-compose.lock'
+
+
+class Lockfile(object):
+    """The digests that the images of services are locked to, written by
+    `docker-compose lock` next to the Compose file.
+
+    The lockfile maps each image name, as written in the Compose file, to
+    the digest it resolved to, e.g. `{"images": {"redis:3": "sha256:..."}}`.
+    """
+
+    def __init__(self, path, images=None):
+        self.path = path
+        self.images = dict(images or {})
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return cls(path)
+
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except ValueError as e:
+            raise ConfigurationError("Invalid lockfile {}: {}".format(path, e))
+
+        images = data.get('images') if isinstance(data, dict) else None
+        if not isinstance(images, dict) or not all(
+                isinstance(digest, six.string_types) for digest in images.values()):
+            raise ConfigurationError(
+                "Invalid lockfile {}: expected a mapping of images to digests".format(path))
+        return cls(path, images)
+
+    @classmethod
+    def find(cls, working_dir):
+        return cls.load(os.path.join(working_dir, LOCKFILE_NAME))
+
+    def digest(self, image):
+        """Return the digest `image` is locked to, or None."""
+        key = image_key(image)
+        for name, digest in self.images.items():
+            if image_key(name) == key:
+                return digest
+        return None
+
+    def set(self, image, digest):
+        key = image_key(image)
+        for name in list(self.images):
+            if image_key(name) == key:
+                del self.images[name]
+        self.images[image] = digest
+
+    def save(self):
+        with atomic_write(self.path) as f:
+            json.dump({'images': self.images}, f, indent=2, sort_keys=True)
+            f.write('\n')
@@ -18,12 +18,13 @@ from compose.utils import get_output_stream
 log = logging.getLogger(__name__)
 
 
-def parallel_execute(objects, func, get_name, msg, get_deps=None):
+def parallel_execute(objects, func, get_name, msg, get_deps=None, limit=None):
     """Runs func on objects in parallel while ensuring that func is
     ran on object only after it is ran on all its dependencies.
 
     get_deps called on object must return a collection with its dependencies.
     get_name called on object must return its name.
+    limit is the maximum number of objects func runs on at the same time.
     """
     objects = list(objects)
     stream = get_output_stream(sys.stderr)
@@ -32,7 +33,7 @@ def parallel_execute(objects, func, get_name, msg, get_deps=None):
     for obj in objects:
         writer.initialize(get_name(obj))
 
-    events = parallel_execute_stream(objects, func, get_deps)
+    events = parallel_execute_stream(objects, func, get_deps, limit)
 
     errors = {}
     results = []
@@ -45,11 +46,19 @@ def parallel_execute(objects, func, get_name, msg, get_deps=None):
         elif isinstance(exception, APIError):
             errors[get_name(obj)] = exception.explanation
             writer.write(get_name(obj), 'error')
+        elif isinstance(exception, OperationFailedError):
+            errors[get_name(obj)] = exception.msg
+            writer.write(get_name(obj), 'error')
         elif isinstance(exception, UpstreamError):
             writer.write(get_name(obj), 'error')
         else:
             errors[get_name(obj)] = exception
             error_to_reraise = exception
+            reraised_name = get_name(obj)
+
+    if error_to_reraise:
+        # Reported by the caller, which handles it
+        del errors[reraised_name]
 
     for obj_name, error in errors.items():
         stream.write("\nERROR: for {}  {}\n".format(obj_name, error))
@@ -78,8 +87,11 @@ class State(object):
     def pending(self):
         return set(self.objects) - self.started - self.finished - self.failed
 
+    def running(self):
+        return self.started - self.finished - self.failed
 
-def parallel_execute_stream(objects, func, get_deps):
+
+def parallel_execute_stream(objects, func, get_deps, limit=None):
     if get_deps is None:
         get_deps = _no_deps
 
@@ -87,7 +99,7 @@ def parallel_execute_stream(objects, func, get_deps):
     state = State(objects)
 
     while not state.is_done():
-        for event in feed_queue(objects, func, get_deps, results, state):
+        for event in feed_queue(objects, func, get_deps, results, state, limit):
             yield event
 
         try:
@@ -117,11 +129,15 @@ def queue_producer(obj, func, results):
         results.put((obj, None, e))
 
 
-def feed_queue(objects, func, get_deps, results, state):
+def feed_queue(objects, func, get_deps, results, state, limit=None):
     pending = state.pending()
     log.debug('Pending: {}'.format(pending))
 
     for obj in pending:
+        if limit is not None and len(state.running()) >= limit:
+            log.debug('Limit of {} reached - waiting'.format(limit))
+            break
+
         deps = get_deps(obj)
 
         if any(dep in state.failed for dep in deps):
@@ -143,6 +159,18 @@ class UpstreamError(Exception):
     pass
 
 
+class OperationFailedError(Exception):
+    """An operation failed in a way which is reported like an API error,
+    without stopping the other operations.
+    """
+
+    def __init__(self, reason):
+        self.msg = reason
+
+    def __str__(self):
+        return self.msg
+
+
 class ParallelStreamWriter(object):
     """Write out messages for operations happening in parallel.
 
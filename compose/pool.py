@@ -0,0 +1,147 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import logging
+from threading import Thread
+
+from cached_property import cached_property
+from docker.errors import APIError
+
+from .const import LABEL_CONFIG_HASH
+from .const import LABEL_POOL
+from .container import Container
+from .utils import json_hash
+
+
+log = logging.getLogger(__name__)
+
+
+POOL_SUFFIX = '_pool'
+
+
+class ContainerPool(object):
+    """A pool of pre-created, stopped one-off containers for a service.
+
+    Every container in the pool was created from the current service
+    configuration and the same one-off `options`, so any of them can be
+    started in place of a newly created container. Pool containers are named
+    like regular one-off containers with a `_pool` suffix. A container is
+    claimed by renaming it to drop the suffix, which only one client can do.
+    Pool containers of the service which were created from an older
+    configuration are removed when the pool is refilled.
+    """
+
+    def __init__(self, service, size, options):
+        self.service = service
+        self.size = size
+        self.options = options
+
+    @cached_property
+    def key(self):
+        return json_hash({
+            'config': self.service.config_dict(),
+            'options': self.options,
+        })
+
+    def labels(self):
+        return self.service.labels(one_off=True) + [
+            '{0}={1}'.format(LABEL_POOL, self.key),
+        ]
+
+    def containers(self):
+        """Return the unclaimed containers in the pool."""
+        containers = [
+            Container.from_ps(self.service.client, container)
+            for container in self.service.client.containers(
+                all=True,
+                filters={'label': self.labels(), 'status': 'created'})
+        ]
+        return [c for c in containers if c and c.name.endswith(POOL_SUFFIX)]
+
+    def stale_containers(self):
+        """Return the unclaimed pool containers of the service, from any
+        pool, which were created from an older service configuration.
+        """
+        config_hash = self.service.config_hash
+        containers = [
+            Container.from_ps(self.service.client, container)
+            for container in self.service.client.containers(
+                all=True,
+                filters={
+                    'label': self.service.labels(one_off=True) + [LABEL_POOL],
+                    'status': 'created',
+                })
+            if (container.get('Labels') or {}).get(LABEL_CONFIG_HASH) != config_hash
+        ]
+        return [c for c in containers if c and c.name.endswith(POOL_SUFFIX)]
+
+    def remove_stale_containers(self):
+        for container in self.stale_containers():
+            try:
+                # Another client may have claimed it since it was listed
+                container.inspect()
+                if not container.name.endswith(POOL_SUFFIX):
+                    continue
+                container.remove()
+            except APIError as e:
+                # Removed or claimed by another client
+                log.debug('Failed to remove {} from the pool: {}'.format(
+                    container.name, e.explanation))
+
+    def claim(self):
+        """Claim a container from the pool. Returns None if the pool is
+        empty.
+        """
+        for container in self.containers():
+            try:
+                self.service.client.rename(
+                    container.id,
+                    container.name[:-len(POOL_SUFFIX)])
+            except APIError:
+                log.debug('{} was claimed by another client'.format(container.name))
+                continue
+
+            log.debug('Claimed {} from the pool'.format(container.name))
+            return Container.from_id(self.service.client, container.id)
+
+        return None
+
+    def create_container(self):
+        number = self.service._next_container_number(one_off=True)
+        labels = dict(self.service.options.get('labels') or {})
+        labels[LABEL_POOL] = self.key
+        # One-off containers aren't stamped with the config hash, but pool
+        # containers need it to tell when they are stale
+        labels[LABEL_CONFIG_HASH] = self.service.config_hash
+        options = dict(self.options, labels=labels)
+        options['name'] = self.service.get_container_name(number, one_off=True) + POOL_SUFFIX
+
+        return self.service.create_container(
+            one_off=True,
+            number=number,
+            quiet=True,
+            **options)
+
+    def refill(self):
+        """Remove stale pool containers, and create a container if the pool
+        has fewer than `size` unclaimed containers. Each run refills at most
+        the one container it claimed, so the pool fills up over runs.
+        """
+        self.remove_stale_containers()
+        if len(self.containers()) >= self.size:
+            return
+        try:
+            self.create_container()
+        except APIError as e:
+            log.debug('Failed to add a container to the pool: {}'.format(
+                e.explanation))
+
+    def refill_in_background(self):
+        """Refill the pool in a daemon thread, and return the thread. The
+        thread doesn't keep the process alive; if it exits first, the next
+        run refills the pool instead.
+        """
+        filler = Thread(target=self.refill)
+        filler.daemon = True
+        filler.start()
+        return filler
@@ -0,0 +1,110 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import logging
+
+import six
+from docker.errors import APIError
+
+from .parallel import OperationFailedError
+from .parallel import parallel_execute
+from .progress_stream import StreamOutputError
+from .service import image_key
+from .service import parse_repository_tag
+from .utils import json_stream
+
+
+log = logging.getLogger(__name__)
+
+
+DEFAULT_CONCURRENCY = 4
+
+
+def external_base_images(services, project_services):
+    """Return the images which the Dockerfiles of `services` are built from,
+    without duplicates, and excluding images which are built by one of
+    `project_services`.
+    """
+    built = set(
+        image_key(service.image_name)
+        for service in project_services if service.can_be_built()
+    )
+    images = []
+    seen = set()
+    for service in services:
+        if not service.can_be_built():
+            continue
+        for image in service.build_base_images():
+            key = image_key(image)
+            if key not in built and key not in seen:
+                seen.add(key)
+                images.append(image)
+    return images
+
+
+def prefetch_base_images(client, services, project_services, pull=False,
+                         concurrency=DEFAULT_CONCURRENCY):
+    """Pull the base images of `services` in parallel before they are built,
+    so builds which share a base image don't each pull it in turn.
+
+    If `pull` is False, only the base images which don't exist yet are
+    pulled. Images which can't be pulled are reported as errors, but are
+    left to the build, which fails if the image is really needed.
+
+    Return the keys (see :func:`compose.service.image_key`) of the images
+    which were pulled.
+    """
+    images = external_base_images(services, project_services)
+    if not pull:
+        images = [image for image in images if not image_exists(client, image)]
+    if not images:
+        return set()
+
+    def pull_base_image(image):
+        try:
+            pull_image(client, image)
+        except StreamOutputError as e:
+            raise OperationFailedError(six.text_type(e))
+        return image
+
+    # API errors and failed pulls are shown, and don't stop the other pulls
+    pulled = parallel_execute(
+        images,
+        pull_base_image,
+        lambda image: image,
+        'Pulling base image',
+        limit=concurrency)
+    return set(image_key(image) for image in pulled)
+
+
+def needs_pull(service, prefetched):
+    """Whether the build of `service` should still pull its base images,
+    because they weren't all prefetched, e.g. because one of them is built
+    by the project or its Dockerfile can't be read.
+    """
+    images = service.build_base_images()
+    return not images or any(image_key(image) not in prefetched for image in images)
+
+
+def pull_image(client, image):
+    repo, tag, separator = parse_repository_tag(image)
+    if separator == '@':
+        output = client.pull(image, stream=True)
+    else:
+        output = client.pull(repo, tag=tag or 'latest', stream=True)
+
+    for event in json_stream(output):
+        if 'errorDetail' in event:
+            raise StreamOutputError(event['errorDetail'].get('message', event.get('error')))
+        if 'error' in event:
+            raise StreamOutputError(event['error'])
+
+
+def image_exists(client, image):
+    try:
+        client.inspect_image(image)
+    except APIError as e:
+        if e.response is not None and e.response.status_code == 404:
+            return False
+        raise
+    return True
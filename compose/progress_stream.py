@@ -1,56 +1,348 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import os
+import re
+import time
+from collections import OrderedDict
+
 from compose import utils
 
 
+PROGRESS_LINES = 'lines'
+PROGRESS_AGGREGATE = 'aggregate'
+PROGRESS_SUMMARY = 'summary'
+PROGRESS_NONE = 'none'
+PROGRESS_MODES = (PROGRESS_LINES, PROGRESS_AGGREGATE, PROGRESS_SUMMARY, PROGRESS_NONE)
+
+# Minimum number of seconds between redraws of the aggregated progress
+AGGREGATE_INTERVAL = 0.1
+# Minimum number of seconds between progress lines when not on a terminal
+SUMMARY_INTERVAL = 5
+
+# Statuses of layers which have been transferred completely
+DONE_STATUSES = ('Download complete', 'Pull complete', 'Pushed', 'Layer already exists')
+
+BUILT_IMAGE_ID = re.compile(r'Successfully built ([0-9a-f]+)')
+
+
 class StreamOutputError(Exception):
     pass
 
 
-def stream_output(output, stream):
+class StreamResult(object):
+    """What is left of a stream of events once it has been printed: the
+    results extracted from the events, but not the events themselves.
+    """
+
+    def __init__(self):
+        self.image_id = None
+        self.digest = None
+        self.last_event = None
+        self.event_count = 0
+
+    def update(self, event):
+        self.last_event = event
+        self.event_count += 1
+
+        aux = event.get('aux') or {}
+        if aux.get('ID'):
+            self.image_id = aux['ID']
+        if aux.get('Digest'):
+            self.digest = aux['Digest']
+
+        match = BUILT_IMAGE_ID.search(event.get('stream', ''))
+        if match:
+            self.image_id = match.group(1)
+
+        status = event.get('status', '')
+        if status.startswith('Digest: '):
+            self.digest = status[len('Digest: '):].strip()
+
+
+def get_progress_mode(stream, mode=None):
+    """Return the progress mode to use for `stream`: `mode` or the
+    COMPOSE_PROGRESS environment variable if either is set, otherwise
+    progress lines on a terminal, and a summary anywhere else.
+    """
+    mode = mode or os.environ.get('COMPOSE_PROGRESS')
+    if mode in PROGRESS_MODES:
+        return mode
+
     is_terminal = hasattr(stream, 'isatty') and stream.isatty()
+    return PROGRESS_LINES if is_terminal else PROGRESS_SUMMARY
+
+
+def stream_output(output, stream, progress=None):
+    """Print the JSON events of `output` (a build, pull or push) to `stream`,
+    and return a :class:`StreamResult`.
+
+    `progress` selects how progress events are shown (see
+    :func:`get_progress_mode`). Events are handled one at a time and not
+    kept, so memory use doesn't grow with the length of the output.
+    """
+    mode = get_progress_mode(stream, progress)
+    is_terminal = mode in (PROGRESS_LINES, PROGRESS_AGGREGATE)
     stream = utils.get_output_stream(stream)
-    all_events = []
-    lines = {}
-    diff = 0
+    renderer = PROGRESS_RENDERERS[mode](stream)
+    result = StreamResult()
 
     for event in utils.json_stream(output):
-        all_events.append(event)
+        result.update(event)
         is_progress_event = 'progress' in event or 'progressDetail' in event
 
         if not is_progress_event:
+            renderer.interrupt()
             print_output_event(event, stream, is_terminal)
             stream.flush()
             continue
 
-        if not is_terminal:
-            continue
+        renderer.update(event)
 
-        # if it's a progress event and we have a terminal, then display the progress bars
+    renderer.finish()
+    return result
+
+
+def shared_progress_mode(stream, mode=None):
+    """Return the progress mode to use for `stream` when it is shared with
+    other writers: the same as :func:`get_progress_mode`, but never a mode
+    which redraws earlier lines, as they may not be the lines it wrote.
+    """
+    mode = get_progress_mode(stream, mode)
+    if mode in (PROGRESS_LINES, PROGRESS_AGGREGATE):
+        return PROGRESS_SUMMARY
+    return mode
+
+
+class PrefixedStream(object):
+    """A stream which writes complete lines to `stream`, each prefixed with
+    `prefix`, while holding `lock`, so the output of concurrent writers
+    sharing `stream` (and `lock`) is not mixed up.
+    """
+
+    def __init__(self, stream, prefix, lock):
+        self.stream = stream
+        self.prefix = prefix
+        self.lock = lock
+        self.buffer = ''
+
+    def write(self, text):
+        self.buffer += text.replace('\r\n', '\n').replace('\r', '\n')
+        if '\n' not in self.buffer:
+            return
+        lines, _, self.buffer = self.buffer.rpartition('\n')
+        self.write_lines(lines.split('\n'))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.buffer:
+            self.write_lines([self.buffer])
+            self.buffer = ''
+
+    def write_lines(self, lines):
+        with self.lock:
+            for line in lines:
+                self.stream.write('{}{}\n'.format(self.prefix, line))
+            self.stream.flush()
+
+
+class LineProgress(object):
+    """Show the progress of each layer on its own line, redrawn for every
+    event.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lines = {}
+
+    def update(self, event):
         image_id = event.get('id')
         if not image_id:
-            continue
+            return
 
-        if image_id in lines:
-            diff = len(lines) - lines[image_id]
+        if image_id in self.lines:
+            diff = len(self.lines) - self.lines[image_id]
         else:
-            lines[image_id] = len(lines)
-            stream.write("\n")
+            self.lines[image_id] = len(self.lines)
+            self.stream.write("\n")
             diff = 0
 
         # move cursor up `diff` rows
-        stream.write("%c[%dA" % (27, diff))
+        self.stream.write("%c[%dA" % (27, diff))
+
+        print_output_event(event, self.stream, True)
+
+        # move cursor back down
+        self.stream.write("%c[%dB" % (27, diff))
+        self.stream.flush()
+
+    def interrupt(self):
+        pass
 
-        print_output_event(event, stream, is_terminal)
+    def finish(self):
+        pass
 
-        if 'id' in event:
-            # move cursor back down
-            stream.write("%c[%dB" % (27, diff))
 
-        stream.flush()
+class LayerProgress(object):
+    """The bytes transferred for each layer, and in total."""
 
-    return all_events
+    def __init__(self):
+        self.layers = OrderedDict()
+
+    def update(self, event):
+        layer_id = event.get('id')
+        if not layer_id:
+            return
+
+        current, total = self.layers.get(layer_id, (None, None, None))[1:]
+        detail = event.get('progressDetail') or {}
+        if detail.get('total'):
+            current, total = detail.get('current', 0), detail['total']
+        elif total and event.get('status') in DONE_STATUSES:
+            current = total
+        self.layers[layer_id] = (event.get('status', ''), current, total)
+
+    def totals(self):
+        current = total = 0
+        for _, layer_current, layer_total in self.layers.values():
+            if layer_total:
+                current += layer_current
+                total += layer_total
+        return current, total
+
+    def clear(self):
+        self.layers.clear()
+
+
+class AggregateProgress(object):
+    """Show the progress of each layer and the total bytes transferred, and
+    redraw them at most every AGGREGATE_INTERVAL seconds.
+    """
+
+    def __init__(self, stream, interval=AGGREGATE_INTERVAL):
+        self.stream = stream
+        self.interval = interval
+        self.progress = LayerProgress()
+        self.drawn_lines = 0
+        self.last_draw = 0
+
+    def update(self, event):
+        self.progress.update(event)
+        now = time.time()
+        if now - self.last_draw >= self.interval:
+            self.draw()
+            self.last_draw = now
+
+    def interrupt(self):
+        # Leave the last state on screen, and start over below other output
+        self.finish()
+        self.progress.clear()
+        self.drawn_lines = 0
+
+    def finish(self):
+        if self.progress.layers:
+            self.draw()
+
+    def draw(self):
+        if self.drawn_lines:
+            # move cursor up to the first line
+            self.stream.write("%c[%dA" % (27, self.drawn_lines))
+
+        lines = [
+            "%s: %s %s" % (layer_id, status, format_progress(current, total))
+            for layer_id, (status, current, total) in self.progress.layers.items()
+        ]
+        lines.append("Total: %s" % format_progress(*self.progress.totals()))
+
+        for line in lines:
+            # erase the line before writing over it
+            self.stream.write("%c[2K\r%s\n" % (27, line))
+        self.drawn_lines = len(lines)
+        self.stream.flush()
+
+
+class SummaryProgress(object):
+    """Print the total progress as a percentage at most every
+    SUMMARY_INTERVAL seconds, for output which isn't a terminal.
+    """
+
+    def __init__(self, stream, interval=SUMMARY_INTERVAL):
+        self.stream = stream
+        self.interval = interval
+        self.progress = LayerProgress()
+        self.last_print = time.time()
+        self.last_line = None
+
+    def update(self, event):
+        self.progress.update(event)
+        now = time.time()
+        if now - self.last_print >= self.interval:
+            self.print_summary()
+            self.last_print = now
+
+    def interrupt(self):
+        self.finish()
+        self.progress.clear()
+
+    def finish(self):
+        if self.last_line is not None:
+            self.print_summary()
+        self.last_line = None
+
+    def print_summary(self):
+        current, total = self.progress.totals()
+        if not total:
+            return
+
+        line = "Progress: %s\n" % format_progress(current, total)
+        if line != self.last_line:
+            self.stream.write(line)
+            self.stream.flush()
+            self.last_line = line
+
+
+class NoProgress(object):
+
+    def __init__(self, stream):
+        pass
+
+    def update(self, event):
+        pass
+
+    def interrupt(self):
+        pass
+
+    def finish(self):
+        pass
+
+
+PROGRESS_RENDERERS = {
+    PROGRESS_LINES: LineProgress,
+    PROGRESS_AGGREGATE: AggregateProgress,
+    PROGRESS_SUMMARY: SummaryProgress,
+    PROGRESS_NONE: NoProgress,
+}
+
+
+def format_progress(current, total):
+    if not total:
+        return ''
+    return "%s / %s (%.1f%%)" % (
+        format_size(current),
+        format_size(total),
+        float(current) / float(total) * 100)
+
+
+def format_size(size):
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if size < 1000:
+            break
+        size /= 1000.0
+    else:
+        unit = 'TB'
+    return ("%d %s" if unit == 'B' else "%.1f %s") % (size, unit)
 
 
 def print_output_event(event, stream, is_terminal):
@@ -4,13 +4,19 @@ from __future__ import unicode_literals
 import datetime
 import logging
 import operator
+import sys
 from functools import reduce
+from threading import Lock
 
 import enum
 from docker.errors import APIError
 
 from . import parallel
+from .bundle import BundleError
+from .bundle import BundleReader
+from .bundle import BundleWriter
 from .config import ConfigurationError
+from .config.errors import DependencyError
 from .config.config import V1
 from .config.sort_services import get_container_name_from_network_mode
 from .config.sort_services import get_service_name_from_network_mode
@@ -20,21 +26,34 @@ from .const import LABEL_ONE_OFF
 from .const import LABEL_PROJECT
 from .const import LABEL_SERVICE
 from .container import Container
+from .image_cache import ImageCache
+from .image_index import ImageIndex
 from .network import build_networks
 from .network import get_networks
 from .network import ProjectNetworks
+from .prefetch import needs_pull
+from .prefetch import prefetch_base_images
+from .progress_stream import PrefixedStream
 from .service import BuildAction
+from .service import BuildError
 from .service import ContainerNetworkMode
 from .service import ConvergenceStrategy
+from .service import image_key
 from .service import NetworkMode
+from .service import NoSuchImageError
 from .service import Service
 from .service import ServiceNetworkMode
+from .utils import atomic_write
+from .utils import get_output_stream
 from .utils import microseconds_from_time_nano
 from .volume import ProjectVolumes
 
 
 log = logging.getLogger(__name__)
 
+# Builds run at the same time at most, each uploading its context
+BUILD_CONCURRENCY = 4
+
 
 @enum.unique
 class OneOffFilter(enum.Enum):
@@ -58,12 +77,13 @@ class Project(object):
     """
     A collection of services.
     """
-    def __init__(self, name, services, client, networks=None, volumes=None):
+    def __init__(self, name, services, client, networks=None, volumes=None, lockfile=None):
         self.name = name
         self.services = services
         self.client = client
         self.volumes = volumes or ProjectVolumes({})
         self.networks = networks or ProjectNetworks({}, False)
+        self.lockfile = lockfile
 
     def labels(self, one_off=OneOffFilter.exclude):
         labels = ['{0}={1}'.format(LABEL_PROJECT, self.name)]
@@ -72,9 +92,10 @@ class Project(object):
         return labels
 
     @classmethod
-    def from_config(cls, name, config_data, client):
+    def from_config(cls, name, config_data, client, lockfile=None):
         """
-        Construct a Project from a config.Config object.
+        Construct a Project from a config.Config object, and lock the images
+        of its services to the digests in `lockfile`.
         """
         use_networking = (config_data.version and config_data.version != V1)
         networks = build_networks(name, config_data, client)
@@ -83,7 +104,7 @@ class Project(object):
             networks,
             use_networking)
         volumes = ProjectVolumes.from_config(name, config_data, client)
-        project = cls(name, [], client, project_networks, volumes)
+        project = cls(name, [], client, project_networks, volumes, lockfile)
 
         for service_dict in config_data.services:
             service_dict = dict(service_dict)
@@ -118,6 +139,11 @@ class Project(object):
                     **service_dict)
             )
 
+        if lockfile:
+            for service in project.services:
+                if service.can_be_locked():
+                    service.image_digest = lockfile.digest(service.image_name)
+
         return project
 
     @property
@@ -294,12 +320,73 @@ class Project(object):
         parallel.parallel_restart(containers, options)
         return containers
 
-    def build(self, service_names=None, no_cache=False, pull=False, force_rm=False):
+    def build(self, service_names=None, no_cache=False, pull=False, force_rm=False,
+              cache_dir=None):
+        # Services with an identical build definition are built once, and the
+        # image is tagged for each of them.
+        services = []
+        shared_builds = {}
+        builds_by_key = {}
         for service in self.get_services(service_names):
-            if service.can_be_built():
-                service.build(no_cache, pull, force_rm)
-            else:
+            if not service.can_be_built():
                 log.info('%s uses an image, skipping' % service.name)
+                continue
+
+            build_key = service.build_key()
+            if build_key in builds_by_key:
+                shared_builds[builds_by_key[build_key].name].append(service)
+                continue
+
+            builds_by_key[build_key] = service
+            shared_builds[service.name] = []
+            services.append(service)
+
+        build_deps = get_build_dependencies(services, shared_builds)
+        cache = ImageCache(cache_dir) if cache_dir else None
+        prefetched = prefetch_base_images(self.client, services, self.services, pull=pull)
+
+        # Builds run at the same time, so the output of each is written a
+        # line at a time, prefixed with the name of the service
+        output_lock = Lock()
+        stdout = get_output_stream(sys.stdout)
+        prefix_width = max([len(service.name) for service in services] or [0])
+
+        def build_service(service):
+            output = PrefixedStream(
+                stdout,
+                '{} | '.format(service.name.ljust(prefix_width)),
+                output_lock)
+            try:
+                # The daemon would check each base image again, one build
+                # after another
+                image_id = service.build(
+                    no_cache, pull and needs_pull(service, prefetched), force_rm,
+                    cache=cache,
+                    output=output,
+                    close_client=False)
+            except APIError as e:
+                raise BuildError(service, e.explanation)
+            finally:
+                output.close()
+
+            for other in shared_builds[service.name]:
+                log.info('%s uses the same build as %s, tagging' % (other.name, service.name))
+                other.tag_image(image_id)
+            return image_id
+
+        try:
+            # No status lines, they would be drawn over by the build output
+            parallel.parallel_execute(
+                services,
+                build_service,
+                operator.attrgetter('name'),
+                None,
+                lambda service: build_deps[service.name],
+                limit=BUILD_CONCURRENCY)
+        finally:
+            # Ensure the HTTP connections are not reused for another
+            # streaming command, once no build is using them
+            self.client.close()
 
     def create(
         self,
@@ -309,6 +396,7 @@ class Project(object):
     ):
         services = self.get_services_without_duplicate(service_names, include_deps=True)
 
+        self.load_image_index(services)
         for svc in services:
             svc.ensure_image_exists(do_build=do_build)
         plans = self._get_convergence_plans(services, strategy)
@@ -319,6 +407,15 @@ class Project(object):
                 detached=True,
                 start=False)
 
+    def load_image_index(self, services):
+        """Look up the images of the daemon with a single request, and use
+        them to find the images of `services`, instead of inspecting the
+        image of each service.
+        """
+        image_index = ImageIndex.load(self.client)
+        for service in services:
+            service.image_index = image_index
+
     def events(self, service_names=None):
         def build_container_event(event, container):
             time = datetime.datetime.fromtimestamp(event['time'])
@@ -364,7 +461,9 @@ class Project(object):
            do_build=BuildAction.none,
            timeout=DEFAULT_TIMEOUT,
            detached=False,
-           remove_orphans=False):
+           remove_orphans=False,
+           reaper=None,
+           start_first=False):
 
         self.initialize()
         self.find_orphan_containers(remove_orphans)
@@ -373,16 +472,28 @@ class Project(object):
             service_names,
             include_deps=start_deps)
 
+        self.load_image_index(services)
+        if do_build == BuildAction.force:
+            prefetch_base_images(self.client, services, self.services)
         for svc in services:
             svc.ensure_image_exists(do_build=do_build)
         plans = self._get_convergence_plans(services, strategy)
 
         def do(service):
-            return service.execute_convergence_plan(
+            containers = service.execute_convergence_plan(
                 plans[service.name],
                 timeout=timeout,
-                detached=detached
+                detached=detached,
+                reaper=reaper,
+                start_first=start_first,
             )
+            # Dependent services are only started once this returns.
+            # Containers recreated start-first were probed before they
+            # replaced the old ones.
+            if not (plans[service.name].action == 'recreate' and
+                    start_first and service.can_start_first()):
+                service.wait_until_ready(containers)
+            return containers
 
         def get_deps(service):
             return {self.get_service(dep) for dep in service.get_dependency_names()}
@@ -432,6 +543,50 @@ class Project(object):
         for service in self.get_services(service_names, include_deps=False):
             service.pull(ignore_pull_failures)
 
+    def save_bundle(self, path, service_names=None):
+        """Save the images of services to a bundle at `path`."""
+        images = []
+        for service in self.get_services(service_names, include_deps=False):
+            try:
+                service.image()
+            except NoSuchImageError:
+                raise BundleError(
+                    "Image for service {} does not exist. Pull or build it "
+                    "before saving a bundle.".format(service.name))
+            if service.image_name not in images:
+                images.append(service.image_name)
+
+        with atomic_write(path, 'wb') as f:
+            writer = BundleWriter(f)
+            for image in images:
+                writer.add_image(self.client, image)
+            writer.close()
+
+    def load_bundle(self, path):
+        """Load the images in the bundle at `path` into the daemon."""
+        BundleReader(path).load(self.client)
+
+    def lock(self, service_names=None):
+        for service in self.get_services(service_names, include_deps=False):
+            if not service.can_be_locked():
+                log.info('%s is built, skipping' % service.name)
+                continue
+
+            service.image_digest = None
+            service.pull()
+            digest = service.repo_digest()
+            if not digest:
+                log.warn(
+                    "Image for service {} can't be locked, because it has no "
+                    "digest in a registry".format(service.name))
+                continue
+
+            log.info('Locking %s to %s' % (service.name, digest))
+            self.lockfile.set(service.image_name, digest)
+            service.image_digest = digest
+
+        self.lockfile.save()
+
     def _labeled_containers(self, stopped=False, one_off=OneOffFilter.exclude):
         return list(filter(None, [
             Container.from_ps(self.client, container)
@@ -493,6 +648,46 @@ class Project(object):
         return acc + dep_services
 
 
+def get_build_dependencies(services, shared_builds):
+    """Return a mapping of the name of each service in `services` to the
+    services it must be built after, because its Dockerfile is built from the
+    image of one of them (or of a service in `shared_builds` which shares
+    its build).
+    """
+    builders = {}
+    for service in services:
+        for image_service in [service] + shared_builds[service.name]:
+            builders[image_key(image_service.image_name)] = service
+
+    build_deps = {}
+    for service in services:
+        build_deps[service.name] = [
+            builders[image_key(image)]
+            for image in service.build_base_images()
+            if builders.get(image_key(image), service) is not service
+        ]
+
+    check_build_cycles(services, build_deps)
+    return build_deps
+
+
+def check_build_cycles(services, build_deps):
+    visited = set()
+
+    def visit(service, path):
+        if service.name in path:
+            raise DependencyError(
+                'Circular build dependency between %s' % ' and '.join(path))
+        if service.name in visited:
+            return
+        for dep in build_deps[service.name]:
+            visit(dep, path + [service.name])
+        visited.add(service.name)
+
+    for service in services:
+        visit(service, [])
+
+
 def get_volumes_from(project, service_dict):
     volumes_from = service_dict.pop('volumes_from', None)
     if not volumes_from:
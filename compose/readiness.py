@@ -0,0 +1,228 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import errno
+import logging
+import re
+import socket
+import time
+from threading import Event
+from threading import Lock
+from threading import Thread
+
+import six
+from six.moves.urllib.parse import urlparse
+
+from .utils import split_buffer
+
+
+log = logging.getLogger(__name__)
+
+
+DEFAULT_INTERVAL = 1
+DEFAULT_TIMEOUT = 60
+# Seconds between checks of whether an exec probe's command has exited
+EXEC_POLL_INTERVAL = 0.1
+
+UNSPECIFIED_HOST_IPS = ('', '0.0.0.0', '::')
+
+
+class ReadinessError(Exception):
+    def __init__(self, container, reason):
+        self.container = container
+        self.msg = "Container {} is not ready: {}".format(container.name, reason)
+
+    def __str__(self):
+        return self.msg
+
+
+def wait_until_ready(container, readiness):
+    """Block until `container` passes the readiness probe described by
+    `readiness`, the value of a service's `readiness` option.
+
+    Raises :class:`ReadinessError` if the container exits, or is not ready
+    before the probe's timeout.
+    """
+    interval = readiness.get('interval', DEFAULT_INTERVAL)
+    deadline = time.time() + readiness.get('timeout', DEFAULT_TIMEOUT)
+    check = build_check(container, readiness, interval, deadline)
+
+    log.debug('Waiting for {} to be ready'.format(container.name))
+    try:
+        while True:
+            container.inspect()
+            if not container.is_running:
+                raise ReadinessError(
+                    container,
+                    "exited with code {}".format(container.exit_code))
+
+            if check():
+                log.debug('{} is ready'.format(container.name))
+                return
+
+            if time.time() >= deadline:
+                raise ReadinessError(
+                    container,
+                    "probe did not pass within {} seconds".format(
+                        readiness.get('timeout', DEFAULT_TIMEOUT)))
+
+            time.sleep(interval)
+    finally:
+        # Checks which hold resources, like a log stream, release them
+        close = getattr(check, 'close', None)
+        if close is not None:
+            close()
+
+
+def build_check(container, readiness, interval, deadline):
+    if 'port' in readiness:
+        return PortCheck(container, readiness['port'], interval)
+    if 'exec' in readiness:
+        return build_exec_check(container, readiness['exec'], deadline)
+    if 'log' in readiness:
+        return LogCheck(container, readiness['log'])
+    raise ValueError("Invalid readiness probe: {}".format(readiness))
+
+
+class PortCheck(object):
+    """A check which passes once a TCP connection can be made to `port`.
+
+    A published port accepts connections as soon as the daemon's userland
+    proxy listens on it, before anything in the container does, so when the
+    daemon is local the connection is made to the container's own address.
+    If that address can't be reached, e.g. because the daemon runs in a VM,
+    the host port that `port` is published on is used instead, which can
+    pass before the container is listening.
+    """
+
+    def __init__(self, container, port, timeout):
+        self.container = container
+        self.port = int(port)
+        self.timeout = timeout
+        self.direct = is_local_daemon(container.client)
+
+    def __call__(self):
+        address = self.direct and container_address(self.container)
+        if address:
+            try:
+                return self.connect(address, self.port)
+            except socket.error as e:
+                if e.errno == errno.ECONNREFUSED:
+                    return False
+                log.debug("Can't reach {} at {}, using its published port: {}".format(
+                    self.container.name, address, e))
+                self.direct = False
+
+        binding = self.container.ports.get('{}/tcp'.format(self.port))
+        if not binding:
+            raise ReadinessError(
+                self.container,
+                "port {} is not published to the host".format(self.port))
+
+        host = binding[0]['HostIp']
+        if host in UNSPECIFIED_HOST_IPS:
+            host = get_docker_host(self.container.client)
+
+        try:
+            return self.connect(host, int(binding[0]['HostPort']))
+        except socket.error:
+            return False
+
+    def connect(self, host, port):
+        connection = socket.create_connection((host, port), timeout=self.timeout)
+        connection.close()
+        return True
+
+
+def container_address(container):
+    """Return the IP address of `container` on one of its networks, or None
+    if it has none, e.g. with the host's network.
+    """
+    networks = container.get('NetworkSettings.Networks') or {}
+    for name in sorted(networks):
+        if networks[name].get('IPAddress'):
+            return networks[name]['IPAddress']
+    return container.get('NetworkSettings.IPAddress') or None
+
+
+def build_exec_check(container, command, deadline):
+    """Return a check which passes once `command` exits with code 0 when run
+    in the container.
+
+    The command is run detached and polled, so a command which hangs fails
+    the probe at `deadline` rather than blocking. The daemon can't stop an
+    exec, so such a command is left running in the container.
+    """
+    if isinstance(command, six.string_types):
+        command = ['sh', '-c', command]
+
+    def check():
+        exec_id = container.create_exec(command, stdout=False, stderr=False)
+        container.start_exec(exec_id, detach=True)
+        while True:
+            result = container.client.exec_inspect(exec_id)
+            if not result.get('Running'):
+                return result.get('ExitCode') == 0
+            if time.time() >= deadline:
+                return False
+            time.sleep(EXEC_POLL_INTERVAL)
+
+    return check
+
+
+class LogCheck(object):
+    """A check which passes once a line of the container's output matches
+    `pattern`.
+
+    The output is streamed in a background thread until a line matches or
+    the check is closed, which closes the log response so the thread
+    doesn't outlive the probe.
+    """
+
+    def __init__(self, container, pattern):
+        self.regex = re.compile(pattern)
+        self.matched = Event()
+        self.closed = False
+        self.lock = Lock()
+        self.response = container.open_log_response(follow=True)
+        self.stream = container.stream_response(self.response)
+
+        watcher = Thread(target=self.watch)
+        watcher.daemon = True
+        watcher.start()
+
+    def __call__(self):
+        return self.matched.is_set()
+
+    def watch(self):
+        try:
+            for line in split_buffer(self.stream):
+                if self.regex.search(line):
+                    self.matched.set()
+                    break
+        except Exception:
+            # Reading fails once the response is closed
+            if not self.closed:
+                raise
+        finally:
+            self.close()
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        self.response.close()
+
+
+def is_local_daemon(client):
+    """Whether `client` talks to the daemon through a local socket."""
+    url = urlparse(client.base_url)
+    return url.scheme.startswith('http+') or not url.hostname
+
+
+def get_docker_host(client):
+    """Return the host that ports published by the daemon are reachable on."""
+    if is_local_daemon(client):
+        return '127.0.0.1'
+    return urlparse(client.base_url).hostname
@@ -0,0 +1,88 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import logging
+from threading import Thread
+
+from docker.errors import APIError
+from six.moves.queue import Queue
+
+
+log = logging.getLogger(__name__)
+
+
+DEFAULT_CONCURRENCY = 4
+
+
+class Reaper(object):
+    """Remove containers in the background.
+
+    Removals are handed to a bounded pool of worker threads, so they are
+    taken off the critical path of the operation which scheduled them. The
+    workers are daemon threads, so :meth:`wait` must be called (or the
+    reaper used as a context manager) before the command exits.
+    """
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY):
+        self.concurrency = concurrency
+        self.queue = Queue()
+        self.workers = []
+        self.errors = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.wait()
+        elif self.pending:
+            log.warn(
+                "%s container(s) scheduled for removal were not removed. "
+                "Run `docker-compose rm` to remove them." % self.pending)
+
+    def remove(self, container, **options):
+        log.debug('Scheduling removal of {}'.format(container.name))
+        self.queue.put((container, options))
+        if len(self.workers) < self.concurrency:
+            self._start_worker()
+
+    @property
+    def pending(self):
+        return self.queue.unfinished_tasks
+
+    def wait(self):
+        """Block until every scheduled removal has finished, and report the
+        removals which failed.
+        """
+        if self.pending:
+            log.info("Waiting for %s container(s) to be removed..." % self.pending)
+        self.queue.join()
+
+        for name, error in sorted(self.errors.items()):
+            log.error("Failed to remove {}: {}".format(name, error))
+        self.errors = {}
+
+    def _start_worker(self):
+        worker = Thread(target=self._work)
+        worker.daemon = True
+        worker.start()
+        self.workers.append(worker)
+
+    def _work(self):
+        while True:
+            container, options = self.queue.get()
+            try:
+                container.remove(**options)
+            except APIError as e:
+                self.errors[container.name] = e.explanation
+            except Exception as e:
+                self.errors[container.name] = e
+            finally:
+                self.queue.task_done()
+
+
+def remove_container(container, reaper=None, **options):
+    """Remove `container`, in the background if a reaper is given."""
+    if reaper is None:
+        return container.remove(**options)
+    reaper.remove(container, **options)
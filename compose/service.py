@@ -1,9 +1,10 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import copy
 import logging
-import re
 import sys
+import time
 from collections import namedtuple
 from operator import attrgetter
 
@@ -15,6 +16,11 @@ from docker.utils.ports import build_port_bindings
 from docker.utils.ports import split_port
 
 from . import __version__
+from .build_cache import BuildIndex
+from .build_context import base_images
+from .build_context import context_digest
+from .build_context import is_remote_context
+from .build_context import stream_context
 from .config import DOCKER_CONFIG_KEYS
 from .config import merge_environment
 from .config.types import VolumeSpec
@@ -28,8 +34,11 @@ from .const import LABEL_VERSION
 from .container import Container
 from .parallel import parallel_execute
 from .parallel import parallel_start
+from .progress_stream import shared_progress_mode
 from .progress_stream import stream_output
 from .progress_stream import StreamOutputError
+from .readiness import wait_until_ready
+from .reaper import remove_container
 from .utils import json_hash
 
 
@@ -66,6 +75,9 @@ class BuildError(Exception):
         self.service = service
         self.reason = reason
 
+    def __str__(self):
+        return six.text_type(self.reason)
+
 
 class NeedsBuildError(Exception):
     def __init__(self, service):
@@ -76,6 +88,22 @@ class NoSuchImageError(Exception):
     pass
 
 
+# Seconds a replacement container of a service without a readiness probe
+# has to keep running before it replaces the old container
+START_FIRST_GRACE_PERIOD = 2
+START_FIRST_INTERVAL = 0.5
+
+
+class StartFirstError(Exception):
+    def __init__(self, container):
+        self.container = container
+        self.msg = "Container {} exited before it could replace the old container " \
+                   "with code {}".format(container.name, container.exit_code)
+
+    def __str__(self):
+        return self.msg
+
+
 ServiceName = namedtuple('ServiceName', 'project service number')
 
 
@@ -134,6 +162,11 @@ class Service(object):
         self.network_mode = network_mode or NetworkMode(None)
         self.networks = networks or {}
         self.options = options
+        # Set for the duration of an operation by the project (see
+        # Project.load_image_index)
+        self.image_index = None
+        # The digest the image is locked to by the project's lockfile
+        self.image_digest = None
 
     def __repr__(self):
         return '<Service: {}>'.format(self.name)
@@ -163,7 +196,7 @@ class Service(object):
             self.start_container_if_stopped(c, **options)
         return containers
 
-    def scale(self, desired_num, timeout=DEFAULT_TIMEOUT):
+    def scale(self, desired_num, timeout=DEFAULT_TIMEOUT, reaper=None):
         """
         Adjusts the number of containers to the specified number and ensures
         they are running.
@@ -172,6 +205,9 @@ class Service(object):
         - stops containers until there are at most `desired_num` running
         - starts containers until there are at least `desired_num` running
         - removes all stopped containers
+
+        If a :class:`compose.reaper.Reaper` is given, stopped containers are
+        removed in the background.
         """
         if self.custom_container_name and desired_num > 1:
             log.warn('The "%s" service is using the custom container name "%s". '
@@ -185,13 +221,16 @@ class Service(object):
                      % self.name)
 
         def create_and_start(service, number):
-            container = service.create_container(number=number, quiet=True)
+            container = service.create_container(
+                number=number,
+                quiet=True,
+                template=template)
             service.start_container(container)
             return container
 
         def stop_and_remove(container):
             container.stop(timeout=timeout)
-            container.remove()
+            remove_container(container, reaper)
 
         running_containers = self.containers(stopped=False)
         num_running = len(running_containers)
@@ -225,6 +264,7 @@ class Service(object):
 
             num_to_create = desired_num - num_running
             next_number = self._next_container_number()
+            template = ContainerCreateTemplate(self) if num_to_create else None
             container_numbers = [
                 number for number in range(
                     next_number, next_number + num_to_create
@@ -257,21 +297,30 @@ class Service(object):
                          previous_container=None,
                          number=None,
                          quiet=False,
+                         template=None,
                          **override_options):
         """
         Create a container for this service. If the image doesn't exist, attempt to pull
         it.
-        """
-        # This is only necessary for `scale` and `volumes_from`
-        # auto-creating containers to satisfy the dependency.
-        self.ensure_image_exists()
 
-        container_options = self._get_container_create_options(
-            override_options,
-            number or self._next_container_number(one_off=one_off),
-            one_off=one_off,
-            previous_container=previous_container,
-        )
+        If a :class:`ContainerCreateTemplate` is given, the create options are
+        stamped from it instead of being computed again, and `one_off`,
+        `previous_container` and `override_options` are not used.
+        """
+        if template is not None:
+            container_options = template.stamp(
+                number or self._next_container_number(one_off=template.one_off))
+        else:
+            # This is only necessary for `scale` and `volumes_from`
+            # auto-creating containers to satisfy the dependency.
+            self.ensure_image_exists()
+
+            container_options = self._get_container_create_options(
+                override_options,
+                number or self._next_container_number(one_off=one_off),
+                one_off=one_off,
+                previous_container=previous_container,
+            )
 
         if 'name' in container_options and not quiet:
             log.info("Creating %s" % container_options['name'])
@@ -303,18 +352,59 @@ class Service(object):
             "`docker-compose up --build`.".format(self.name))
 
     def image(self):
+        if self.image_index is not None:
+            image = self.image_index.get(self.image_reference)
+            if image:
+                return image
+
         try:
-            return self.client.inspect_image(self.image_name)
+            image = self.client.inspect_image(self.image_reference)
         except APIError as e:
             if e.response.status_code == 404 and e.explanation and 'No such image' in str(e.explanation):
-                raise NoSuchImageError("Image '{}' not found".format(self.image_name))
+                raise NoSuchImageError("Image '{}' not found".format(self.image_reference))
             else:
                 raise
 
+        if self.image_index is not None:
+            self.image_index.add(self.image_reference, image)
+        return image
+
+    def forget_image(self):
+        """Drop this service's image from the image index, after the image
+        was built, pulled or tagged, so it is inspected again.
+        """
+        if self.image_index is not None:
+            self.image_index.discard(self.image_name)
+            self.image_index.discard(self.image_reference)
+
     @property
     def image_name(self):
         return self.options.get('image', '{s.project}_{s.name}'.format(s=self))
 
+    @property
+    def image_reference(self):
+        """The name containers are created from: the image name, or the
+        image pinned to its digest if it is locked.
+        """
+        if not self.image_digest:
+            return self.image_name
+        repo, _, _ = parse_repository_tag(self.image_name)
+        return '{}@{}'.format(repo, self.image_digest)
+
+    def repo_digest(self):
+        """Return the digest of this service's image in the registry it was
+        pulled from, or None if it wasn't pulled from a registry.
+        """
+        repo, _, _ = parse_repository_tag(self.image_name)
+        repo_digests = self.client.inspect_image(self.image_name).get('RepoDigests') or []
+        for repo_digest in repo_digests:
+            digest_repo, digest, _ = parse_repository_tag(repo_digest)
+            if digest_repo == repo:
+                return digest
+        if len(repo_digests) == 1:
+            return parse_repository_tag(repo_digests[0])[1]
+        return None
+
     def convergence_plan(self, strategy=ConvergenceStrategy.changed):
         containers = self.containers(stopped=True)
 
@@ -366,7 +456,9 @@ class Service(object):
                                  plan,
                                  timeout=DEFAULT_TIMEOUT,
                                  detached=False,
-                                 start=True):
+                                 start=True,
+                                 reaper=None,
+                                 start_first=False):
         (action, containers) = plan
         should_attach_logs = not detached
 
@@ -382,12 +474,14 @@ class Service(object):
             return [container]
 
         elif action == 'recreate':
+            recreate = self.get_recreate_method(start_first)
             return [
-                self.recreate_container(
+                recreate(
                     container,
                     timeout=timeout,
                     attach_logs=should_attach_logs,
-                    start_new_container=start
+                    start_new_container=start,
+                    reaper=reaper,
                 )
                 for container in containers
             ]
@@ -408,17 +502,34 @@ class Service(object):
         else:
             raise Exception("Invalid action: {}".format(action))
 
+    def get_recreate_method(self, start_first=False):
+        """Return the method which recreates the containers of the service:
+        start-first if it was asked for and can be used, stop-first otherwise.
+        """
+        if not start_first:
+            return self.recreate_container
+        if self.can_start_first():
+            return self.recreate_container_start_first
+
+        log.warn(
+            'The "%s" service uses a custom container name or a host '
+            'port, so its containers can not be started before the '
+            'old ones are stopped.' % self.name)
+        return self.recreate_container
+
     def recreate_container(
             self,
             container,
             timeout=DEFAULT_TIMEOUT,
             attach_logs=False,
-            start_new_container=True):
+            start_new_container=True,
+            reaper=None):
         """Recreate a container.
 
         The original container is renamed to a temporary name so that data
         volumes can be copied to the new container, before the original
-        container is removed.
+        container is removed. If a :class:`compose.reaper.Reaper` is given,
+        the removal happens in the background.
         """
         log.info("Recreating %s" % container.name)
 
@@ -433,7 +544,57 @@ class Service(object):
             new_container.attach_log_stream()
         if start_new_container:
             self.start_container(new_container)
-        container.remove()
+        remove_container(container, reaper)
+        return new_container
+
+    def can_start_first(self):
+        """Return True if a replacement container can run alongside the
+        container it replaces.
+        """
+        return not self.custom_container_name and not self.specifies_host_port()
+
+    def recreate_container_start_first(
+            self,
+            container,
+            timeout=DEFAULT_TIMEOUT,
+            attach_logs=False,
+            start_new_container=True,
+            reaper=None):
+        """Recreate a container, starting the new container before the
+        original container is stopped.
+
+        The original container keeps running under a temporary name until the
+        new container has passed the service's readiness probe or, if the
+        service has none, kept running for START_FIRST_GRACE_PERIOD seconds.
+        If the new container fails, it is removed and the original container
+        gets its name back.
+        """
+        log.info("Recreating %s (start first)" % container.name)
+
+        container.rename_to_tmp_name()
+        new_container = None
+        try:
+            new_container = self.create_container(
+                previous_container=container,
+                number=container.labels.get(LABEL_CONTAINER_NUMBER),
+                quiet=True,
+            )
+            if attach_logs:
+                new_container.attach_log_stream()
+            if start_new_container:
+                self.start_container(new_container)
+                if self.options.get('readiness'):
+                    self.wait_until_ready([new_container])
+                else:
+                    wait_until_stable(new_container)
+        except Exception:
+            if new_container is not None:
+                new_container.remove(force=True)
+            self.client.rename(container.id, container.name)
+            raise
+
+        container.stop(timeout=timeout)
+        remove_container(container, reaper)
         return new_container
 
     def start_container_if_stopped(self, container, attach_logs=False, quiet=False):
@@ -449,6 +610,17 @@ class Service(object):
         container.start()
         return container
 
+    def wait_until_ready(self, containers):
+        """Block until every container passes the service's readiness probe,
+        if it has one.
+        """
+        readiness = self.options.get('readiness')
+        if not readiness:
+            return
+
+        for container in containers:
+            wait_until_ready(container, readiness)
+
     def connect_container_to_networks(self, container):
         connected_networks = container.get('NetworkSettings.Networks')
 
@@ -495,7 +667,7 @@ class Service(object):
     def config_dict(self):
         return {
             'options': self.options,
-            'image_id': self.image()['Id'],
+            'image_id': self.image_digest or self.image()['Id'],
             'links': self.get_link_names(),
             'net': self.network_mode.id,
             'networks': self.networks,
@@ -617,7 +789,7 @@ class Service(object):
             container_options['volumes'] = dict(
                 (v.internal, {}) for v in container_options['volumes'])
 
-        container_options['image'] = self.image_name
+        container_options['image'] = self.image_reference
 
         container_options['labels'] = build_container_labels(
             container_options.get('labels', {}),
@@ -671,18 +843,59 @@ class Service(object):
             tmpfs=options.get('tmpfs'),
         )
 
-    def build(self, no_cache=False, pull=False, force_rm=False):
+    def build(self, no_cache=False, pull=False, force_rm=False, cache=None, output=None,
+              close_client=True):
+        """Build the image of the service, and return its id.
+
+        The build output goes to `output`, or stdout. Builds which run at
+        the same time as other builds should write to an `output` of their
+        own (see :class:`compose.progress_stream.PrefixedStream`), and not
+        close the client the other builds are using.
+        """
+        digest = image_id = None
+        if not no_cache and not pull:
+            digest = self.build_context_digest()
+            image_id = self.find_built_image(digest)
+            if image_id:
+                log.info('%s is up-to-date, skipping build' % self.name)
+            elif digest and cache and cache.has(digest):
+                log.info('Loading %s from the build cache' % self.name)
+                image_id = cache.load(self.client, digest)
+                self.tag_image(image_id)
+                BuildIndex().add(digest, image_id)
+                return image_id
+
+        if not image_id:
+            image_id = self._build(digest, no_cache, pull, force_rm, output, close_client)
+
+        if digest and cache and not cache.has(digest):
+            log.info('Saving %s to the build cache' % self.name)
+            cache.save(self.client, self.image_name, image_id, digest)
+
+        return image_id
+
+    def _build(self, digest, no_cache, pull, force_rm, output=None, close_client=True):
         log.info('Building %s' % self.name)
 
         build_opts = self.options.get('build', {})
+
         path = build_opts.get('context')
         # python2 os.path() doesn't support unicode, so we need to encode it to
         # a byte string
         if not six.PY3:
             path = path.encode('utf8')
 
+        if is_remote_context(path):
+            context = {'path': path}
+        else:
+            # Stream the context to the daemon as it's archived, instead of
+            # letting docker-py write it to a temporary file first
+            context = {
+                'fileobj': stream_context(path, build_opts.get('dockerfile')),
+                'custom_context': True,
+            }
+
         build_output = self.client.build(
-            path=path,
             tag=self.image_name,
             stream=True,
             rm=True,
@@ -691,31 +904,104 @@ class Service(object):
             nocache=no_cache,
             dockerfile=build_opts.get('dockerfile', None),
             buildargs=build_opts.get('args', None),
+            **context
         )
 
         try:
-            all_events = stream_output(build_output, sys.stdout)
+            if output is None:
+                result = stream_output(build_output, sys.stdout)
+            else:
+                result = stream_output(
+                    build_output, output, progress=shared_progress_mode(output))
         except StreamOutputError as e:
             raise BuildError(self, six.text_type(e))
 
-        # Ensure the HTTP connection is not reused for another
-        # streaming command, as the Docker daemon can sometimes
-        # complain about it
-        self.client.close()
+        if close_client:
+            # Ensure the HTTP connection is not reused for another
+            # streaming command, as the Docker daemon can sometimes
+            # complain about it
+            self.client.close()
 
-        image_id = None
+        image_id = result.image_id
+        if image_id is None:
+            raise BuildError(self, result.last_event or 'Unknown')
 
-        for event in all_events:
-            if 'stream' in event:
-                match = re.search(r'Successfully built ([0-9a-f]+)', event.get('stream', ''))
-                if match:
-                    image_id = match.group(1)
+        self.forget_image()
 
-        if image_id is None:
-            raise BuildError(self, event if all_events else 'Unknown')
+        if digest:
+            BuildIndex().add(digest, image_id)
 
         return image_id
 
+    def build_context_digest(self):
+        build_opts = self.options.get('build', {})
+        return context_digest(
+            build_opts['context'],
+            dockerfile=build_opts.get('dockerfile'),
+            args=build_opts.get('args'),
+            base_image_ids=self.build_base_image_ids())
+
+    def find_built_image(self, digest):
+        """Return the id of an image built from a context with `digest`,
+        tagging it as this service's image if it isn't already. Returns None
+        if there is no such image.
+        """
+        image_id = digest and BuildIndex().get(digest)
+        if not image_id:
+            return None
+
+        try:
+            if image_id_matches(self.image()['Id'], image_id):
+                return image_id
+        except NoSuchImageError:
+            pass
+
+        try:
+            self.client.inspect_image(image_id)
+        except APIError as e:
+            if e.response.status_code == 404:
+                return None
+            raise
+
+        self.tag_image(image_id)
+        return image_id
+
+    def build_base_images(self):
+        """Return the images this service's Dockerfile is built from."""
+        build_opts = self.options.get('build', {})
+        return base_images(build_opts['context'], build_opts.get('dockerfile'))
+
+    def build_base_image_ids(self):
+        """Return the ids of the images this service's Dockerfile is built
+        from, by name, with None for images which don't exist yet. A base
+        image which was rebuilt, e.g. by an earlier build of the same
+        project, changes the digest of the build.
+        """
+        image_ids = {}
+        for image in self.build_base_images():
+            try:
+                image_ids[image] = self.client.inspect_image(image)['Id']
+            except APIError as e:
+                if e.response.status_code != 404:
+                    raise
+                image_ids[image] = None
+        return image_ids
+
+    def build_key(self):
+        """Return a key which is the same for every service with an
+        identical build definition, and so an identical built image.
+        """
+        return json_hash(self.options.get('build', {}))
+
+    def tag_image(self, image_id):
+        """Tag the image `image_id` as this service's image."""
+        repo, tag, _ = parse_repository_tag(self.image_name)
+        self.client.tag(image_id, repo, tag=tag or None, force=True)
+        self.forget_image()
+
+    def can_be_locked(self):
+        return 'image' in self.options and not self.can_be_built()
+
     def can_be_built(self):
         return 'build' in self.options
 
@@ -780,6 +1066,17 @@ class Service(object):
 
         repo, tag, separator = parse_repository_tag(self.options['image'])
         tag = tag or 'latest'
+        if self.image_digest:
+            # Only pull a locked image if the digest isn't already present
+            try:
+                self.image()
+                log.info('%s is locked to %s, which is up-to-date' % (
+                    self.name, self.image_reference))
+                return
+            except NoSuchImageError:
+                pass
+            tag, separator = self.image_digest, '@'
+
         log.info('Pulling %s (%s%s%s)...' % (self.name, repo, separator, tag))
         output = self.client.pull(
             repo,
@@ -794,6 +1091,36 @@ class Service(object):
                 raise
             else:
                 log.error(six.text_type(e))
+        else:
+            if self.image_digest:
+                # Point the tag in the Compose file at the locked image
+                self.tag_image(self.image_reference)
+        finally:
+            self.forget_image()
+
+
+class ContainerCreateTemplate(object):
+    """The create options shared by every container of a service which is
+    created without override options or a previous container.
+
+    Building the options looks up links, volumes_from and the image, so a
+    template is built once per operation and stamped for each container. The
+    stamped options only differ in the container name and number, and are
+    identical to the options computed for each container on its own.
+    """
+
+    def __init__(self, service, one_off=False):
+        service.ensure_image_exists()
+        self.service = service
+        self.one_off = one_off
+        self.options = service._get_container_create_options(
+            {}, 0, one_off=one_off)
+
+    def stamp(self, number):
+        options = copy.deepcopy(self.options)
+        options['name'] = self.service.get_container_name(number, self.one_off)
+        options['labels'][LABEL_CONTAINER_NUMBER] = str(number)
+        return options
 
 
 class NetworkMode(object):
@@ -854,6 +1181,24 @@ class ServiceNetworkMode(object):
 # Names
 
 
+def wait_until_stable(container,
+                      period=None,
+                      interval=START_FIRST_INTERVAL):
+    """Block until `container` has kept running for `period` seconds, and
+    raise :class:`StartFirstError` if it exits or restarts before then.
+    """
+    if period is None:
+        period = START_FIRST_GRACE_PERIOD
+    deadline = time.time() + period
+    while True:
+        container.inspect()
+        if not container.is_running or container.is_restarting:
+            raise StartFirstError(container)
+        if time.time() >= deadline:
+            return
+        time.sleep(interval)
+
+
 def build_container_name(project, service, number, one_off=False):
     bits = [project, service]
     if one_off:
@@ -890,6 +1235,23 @@ def parse_repository_tag(repo_path):
     return repo, tag, tag_separator
 
 
+def image_key(image):
+    """Return a key which is the same for every way of writing the name of
+    an image, e.g. `busybox` and `busybox:latest`.
+    """
+    repo, tag, separator = parse_repository_tag(image)
+    return repo, separator or ':', tag or 'latest'
+
+
+def image_id_matches(full_id, image_id):
+    """Return True if `image_id`, which may be a short id, identifies the
+    image with id `full_id`.
+    """
+    def strip(value):
+        return value.split(':', 1)[-1]
+    return strip(full_id).startswith(strip(image_id))
+
+
 # Volumes
 
 
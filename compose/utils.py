@@ -5,8 +5,11 @@ import codecs
 import hashlib
 import json
 import json.decoder
+import os
+from contextlib import contextmanager
 
 import six
+from six.moves import _thread as thread
 
 
 json_decoder = json.JSONDecoder()
@@ -18,69 +21,113 @@ def get_output_stream(stream):
     return codecs.getwriter('utf-8')(stream)
 
 
-def stream_as_text(stream):
-    """Given a stream of bytes or text, if any of the items in the stream
-    are bytes convert them to text.
+class LineBuffer(object):
+    """Split bytes into lines as they are fed in.
 
-    This function can be removed once docker-py returns text streams instead
-    of byte streams.
+    Only new data is searched for line breaks, and an incomplete line is
+    kept in a bytearray until the rest of it comes in, so each byte is
+    scanned and copied a constant number of times, however the input is
+    chunked. A line break can't be part of a multibyte UTF-8 character, so
+    each line can be decoded on its own.
     """
-    for data in stream:
-        if not isinstance(data, six.text_type):
-            data = data.decode('utf-8', 'replace')
-        yield data
-
 
-def line_splitter(buffer, separator=u'\n'):
-    index = buffer.find(six.text_type(separator))
-    if index == -1:
-        return None
-    return buffer[:index + 1], buffer[index + 1:]
+    def __init__(self):
+        self.partial = bytearray()
 
+    def feed(self, data):
+        """Return the lines, as text, completed by `data`."""
+        if isinstance(data, six.text_type):
+            data = data.encode('utf-8')
 
-def split_buffer(stream, splitter=None, decoder=lambda a: a):
-    """Given a generator which yields strings and a splitter function,
-    joins all input, splits on the separator and yields each chunk.
+        index = data.find(b'\n')
+        if index == -1:
+            self.partial.extend(data)
+            return []
 
-    Unlike string.split(), each chunk includes the trailing
-    separator, except for the last one if none was found on the end
-    of the input.
-    """
-    splitter = splitter or line_splitter
-    buffered = six.text_type('')
+        self.partial.extend(data[:index + 1])
+        lines = [self.partial.decode('utf-8', 'replace')]
+        del self.partial[:]
 
-    for data in stream_as_text(stream):
-        buffered += data
+        start = index + 1
         while True:
-            buffer_split = splitter(buffered)
-            if buffer_split is None:
+            index = data.find(b'\n', start)
+            if index == -1:
                 break
+            lines.append(data[start:index + 1].decode('utf-8', 'replace'))
+            start = index + 1
+
+        self.partial.extend(data[start:])
+        return lines
+
+    def flush(self):
+        """Return what is left of the last line, if it had no line break."""
+        line = self.partial.decode('utf-8', 'replace')
+        del self.partial[:]
+        return [line] if line else []
 
-            item, buffered = buffer_split
-            yield item
 
-    if buffered:
-        yield decoder(buffered)
+def split_buffer(stream):
+    """Given a generator which yields bytes or text, joins all input, splits
+    it into lines and yields each line as text.
 
+    Unlike string.split(), each line includes the trailing line break,
+    except for the last one if none was found on the end of the input.
+    """
+    lines = LineBuffer()
+    for data in stream:
+        for line in lines.feed(data):
+            yield line
+
+    for line in lines.flush():
+        yield line
 
-def json_splitter(buffer):
-    """Attempt to parse a json object from a buffer. If there is at least one
-    object, return it and the rest of the buffer, otherwise return None.
+
+def json_splitter(buffer, index=0):
+    """Attempt to parse a json object from a buffer, starting at `index`. If
+    there is at least one object, return it and the rest of the buffer,
+    otherwise return None.
+    """
+    result = json_decode(buffer, index)
+    if result is None:
+        return None
+    obj, index = result
+    return obj, buffer[index:]
+
+
+def json_decode(buffer, index=0):
+    """Parse a json object from `buffer` at `index`, and return it and the
+    index of the next object, or None if there isn't a whole object.
     """
     try:
-        obj, index = json_decoder.raw_decode(buffer)
-        rest = buffer[json.decoder.WHITESPACE.match(buffer, index).end():]
-        return obj, rest
+        obj, index = json_decoder.raw_decode(buffer, index)
     except ValueError:
         return None
+    return obj, json.decoder.WHITESPACE.match(buffer, index).end()
 
 
 def json_stream(stream):
     """Given a stream of text, return a stream of json objects.
     This handles streams which are inconsistently buffered (some entries may
     be newline delimited, and others are not).
+
+    The stream is split into lines first, and a line is only parsed once it
+    is complete, so an object which comes in many pieces is parsed once.
+    Objects are only parsed again if one spans several lines.
     """
-    return split_buffer(stream, json_splitter, json_decoder.decode)
+    pending = ''
+    for line in split_buffer(stream):
+        pending += line
+        index = json.decoder.WHITESPACE.match(pending).end()
+        while index < len(pending):
+            result = json_decode(pending, index)
+            if result is None:
+                break
+            obj, index = result
+            yield obj
+        pending = pending[index:]
+
+    if pending:
+        yield json_decoder.decode(pending)
 
 
 def json_hash(obj):
@@ -96,3 +143,32 @@ def microseconds_from_time_nano(time_nano):
 
 def build_string_dict(source_dict):
     return dict((k, str(v)) for k, v in source_dict.items())
+
+
+def makedirs(directory):
+    try:
+        os.makedirs(directory)
+    except OSError:
+        # Another thread may have created it
+        if not os.path.isdir(directory):
+            raise
+
+
+@contextmanager
+def atomic_write(path, mode='w'):
+    """Open a file to write the contents of `path` to, which replaces
+    `path` only once it has been written, so a reader never sees part of it.
+    The directory of `path` is created if it doesn't exist.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        makedirs(directory)
+
+    tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), thread.get_ident())
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    os.rename(tmp_path, path)
@@ -0,0 +1,181 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+
+from docker.utils import tar
+
+from .. import unittest
+from compose.build_cache import BuildIndex
+from compose.build_context import base_images
+from compose.build_context import context_digest
+from compose.build_context import context_paths
+from compose.build_context import ContextFilter
+from compose.build_context import stream_context
+
+
+def write(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+class ContextDigestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.context = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.context)
+        write(os.path.join(self.context, 'Dockerfile'), 'FROM busybox\n')
+        write(os.path.join(self.context, 'app.py'), 'print("hello")\n')
+
+    def digest(self, **kwargs):
+        return context_digest(self.context, **kwargs)
+
+    def test_digest_is_stable(self):
+        assert self.digest() == self.digest()
+
+    def test_digest_changes_with_file_contents(self):
+        before = self.digest()
+        write(os.path.join(self.context, 'app.py'), 'print("goodbye")\n')
+        assert self.digest() != before
+
+    def test_digest_changes_with_new_file(self):
+        before = self.digest()
+        os.mkdir(os.path.join(self.context, 'lib'))
+        write(os.path.join(self.context, 'lib', 'util.py'), '')
+        assert self.digest() != before
+
+    def test_digest_ignores_dockerignored_files(self):
+        write(os.path.join(self.context, '.dockerignore'), '*.log\n')
+        before = self.digest()
+        write(os.path.join(self.context, 'debug.log'), 'noise')
+        assert self.digest() == before
+        assert 'debug.log' not in context_paths(self.context)
+
+    def test_digest_depends_on_dockerfile_and_args(self):
+        digest = self.digest()
+        assert self.digest(dockerfile='Dockerfile.dev') != digest
+        assert self.digest(args={'FOO': 'bar'}) != digest
+        assert self.digest(args={'FOO': 'bar'}) == self.digest(args={'FOO': 'bar'})
+
+    def test_digest_depends_on_base_image_ids(self):
+        digest = self.digest(base_image_ids={'busybox': 'sha256:1'})
+        assert self.digest(base_image_ids={'busybox': 'sha256:2'}) != digest
+        assert self.digest(base_image_ids={'busybox': None}) != digest
+        assert self.digest(base_image_ids={'busybox': 'sha256:1'}) == digest
+
+    def test_remote_context_has_no_digest(self):
+        assert context_digest('git://github.com/docker/compose.git') is None
+
+
+class BaseImagesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.context = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.context)
+
+    def test_single_stage(self):
+        write(os.path.join(self.context, 'Dockerfile'), 'from busybox:latest\nRUN true\n')
+        assert base_images(self.context) == ['busybox:latest']
+
+    def test_multi_stage(self):
+        write(os.path.join(self.context, 'Dockerfile.multi'), (
+            '# build stage\n'
+            'FROM --platform=linux/amd64 project_base AS builder\n'
+            'RUN make \\\n'
+            '    all\n'
+            'FROM builder AS tested\n'
+            'FROM scratch\n'
+            'FROM ${BASE}\n'
+            'COPY --from=builder /app /app\n'
+            'COPY --from=0 /app /app\n'
+            'COPY --from=nginx:1.9 /etc/nginx /etc/nginx\n'
+        ))
+        assert base_images(self.context, 'Dockerfile.multi') == [
+            'project_base',
+            'nginx:1.9',
+        ]
+
+    def test_missing_dockerfile(self):
+        assert base_images(self.context) == []
+
+    def test_remote_context(self):
+        assert base_images('git://github.com/docker/compose.git') == []
+
+
+class ContextFilterTest(unittest.TestCase):
+
+    def test_excludes_matching_paths_and_their_contents(self):
+        context_filter = ContextFilter(['*.log', 'build/'])
+        assert not context_filter.includes('debug.log')
+        assert not context_filter.includes('build')
+        assert not context_filter.includes('build/lib/module.py')
+        assert context_filter.includes('src/debug.log')
+        assert context_filter.includes('Dockerfile')
+
+    def test_exceptions(self):
+        context_filter = ContextFilter(['docs', '!docs/README.md'], 'docs/Dockerfile')
+        assert context_filter.has_exceptions
+        assert not context_filter.includes('docs/index.md')
+        assert context_filter.includes('docs/README.md')
+        assert context_filter.includes('docs/Dockerfile')
+
+
+class StreamContextTest(unittest.TestCase):
+
+    def setUp(self):
+        self.context = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.context)
+        write(os.path.join(self.context, 'Dockerfile'), 'FROM busybox\n')
+        write(os.path.join(self.context, '.dockerignore'), 'logs\n*.tmp\n!keep.tmp\n')
+        write(os.path.join(self.context, 'big.bin'), 'x' * 100000)
+        write(os.path.join(self.context, 'keep.tmp'), 'keep')
+        write(os.path.join(self.context, 'drop.tmp'), 'drop')
+        for directory in ['logs', 'src']:
+            os.mkdir(os.path.join(self.context, directory))
+            write(os.path.join(self.context, directory, 'file.txt'), directory)
+        os.symlink('src/file.txt', os.path.join(self.context, 'link'))
+
+    def read_archive(self, fileobj):
+        archive = tarfile.open(fileobj=fileobj)
+        return dict(
+            (member.name, archive.extractfile(member).read() if member.isreg() else member.type)
+            for member in archive.getmembers()
+        )
+
+    def test_same_contents_as_docker_py(self):
+        with open(os.path.join(self.context, '.dockerignore')) as f:
+            exclude = f.read().splitlines()
+        expected = self.read_archive(tar(self.context, exclude=exclude))
+
+        streamed = b''.join(stream_context(self.context))
+        assert self.read_archive(io.BytesIO(streamed)) == expected
+        assert 'drop.tmp' not in expected
+        assert 'logs/file.txt' not in expected
+
+    def test_chunk_size(self):
+        chunks = list(stream_context(self.context, chunk_size=16 * 1024))
+        assert len(chunks) > 1
+        assert max(len(chunk) for chunk in chunks) < 16 * 1024 + 64 * 1024
+        assert sum(len(chunk) for chunk in chunks) % tarfile.BLOCKSIZE == 0
+
+
+class BuildIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.path = os.path.join(tmpdir, 'compose', 'build-index.json')
+
+    def test_get_missing_index(self):
+        assert BuildIndex(self.path).get('abc') is None
+
+    def test_add_and_get(self):
+        BuildIndex(self.path).add('abc', 'sha256:1234')
+        BuildIndex(self.path).add('def', 'sha256:5678')
+        index = BuildIndex(self.path)
+        assert index.get('abc') == 'sha256:1234'
+        assert index.get('def') == 'sha256:5678'
@@ -0,0 +1,99 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+
+import docker
+import pytest
+from docker.errors import APIError
+
+from .. import mock
+from .. import unittest
+from compose.bundle import BundleError
+from compose.bundle import BundleReader
+from compose.bundle import BundleWriter
+
+
+def saved_image(files):
+    fileobj = io.BytesIO()
+    archive = tarfile.open(mode='w', fileobj=fileobj)
+    for name, content in files:
+        info = tarfile.TarInfo(name)
+        info.size = len(content)
+        archive.addfile(info, io.BytesIO(content))
+    archive.close()
+    fileobj.seek(0)
+    return fileobj
+
+
+def read_archive(data):
+    archive = tarfile.open(fileobj=io.BytesIO(data))
+    return [(info.name, archive.extractfile(info).read()) for info in archive.getmembers()]
+
+
+class BundleTest(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.path = os.path.join(tmpdir, 'bundle.tar')
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.images = {
+            'web': [('base/layer.tar', b'base' * 100000), ('web/layer.tar', b'web')],
+            'db': [('base/layer.tar', b'base' * 100000), ('db/layer.tar', b'db' * 300)],
+        }
+        self.mock_client.get_image.side_effect = lambda image: saved_image(self.images[image])
+
+    def write_bundle(self, images):
+        with open(self.path, 'wb') as f:
+            writer = BundleWriter(f)
+            for image in images:
+                writer.add_image(self.mock_client, image)
+            writer.close()
+
+    def test_shared_blobs_are_written_once(self):
+        self.write_bundle(['web', 'db'])
+
+        names = tarfile.open(self.path).getnames()
+        assert len([name for name in names if name.startswith('blobs/')]) == 3
+        assert names[-1] == 'index.json'
+        assert os.path.getsize(self.path) < 2 * len(b'base' * 100000)
+
+    def test_load(self):
+        self.write_bundle(['web', 'db'])
+        loaded = {}
+
+        def load_image(data):
+            files = read_archive(b''.join(data))
+            loaded[files[-1][0].split('/')[0]] = files
+
+        self.mock_client.load_image.side_effect = load_image
+        BundleReader(self.path).load(self.mock_client)
+
+        assert loaded == self.images
+
+    def test_load_failure_is_raised(self):
+        self.write_bundle(['web', 'db'])
+
+        def load_image(data):
+            files = read_archive(b''.join(data))
+            if files[-1][0].startswith('db/'):
+                raise APIError('Bad request', mock.Mock(status_code=500), 'no space left')
+
+        self.mock_client.load_image.side_effect = load_image
+        with pytest.raises(BundleError) as exc:
+            BundleReader(self.path).load(self.mock_client)
+
+        assert 'Failed to load db: no space left' in exc.exconly()
+        assert self.mock_client.load_image.call_count == 2
+
+    def test_not_a_bundle(self):
+        with open(self.path, 'wb') as f:
+            f.write(saved_image([('layer.tar', b'layer')]).read())
+
+        with pytest.raises(BundleError):
+            BundleReader(self.path)
@@ -0,0 +1,173 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import gzip
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from compose.cli.log_capture import CaptureReader
+from compose.cli.log_capture import CaptureWriter
+from compose.cli.log_capture import format_timestamp
+from compose.cli.log_capture import LogCapture
+from compose.cli.log_capture import parse_time
+from compose.cli.log_capture import read_index
+from compose.cli.log_capture import segment_path
+from compose.cli.log_capture import split_timestamp
+from compose.cli.log_capture import split_timestamp_ns
+from compose.container import Container
+from tests import mock
+
+
+@pytest.fixture
+def capture_dir(request):
+    path = tempfile.mkdtemp()
+    request.addfinalizer(lambda: shutil.rmtree(path))
+    return path
+
+
+def timestamped(timestamp, line):
+    return '{} {}'.format(format_timestamp(timestamp), line)
+
+
+class TestCaptureWriter(object):
+
+    def test_lines_are_read_back(self, capture_dir):
+        writer = CaptureWriter(capture_dir)
+        writer.write(timestamped(100, 'one\n'))
+        writer.write(timestamped(101.5, 'two'))
+        writer.close()
+
+        assert list(CaptureReader(capture_dir).lines()) == [
+            (100, 'one\n'),
+            (101.5, 'two\n'),
+        ]
+
+    def test_lines_without_timestamp_get_the_time_read(self, capture_dir):
+        writer = CaptureWriter(capture_dir)
+        with mock.patch('compose.cli.log_capture.time.time', return_value=42.0):
+            writer.write('one\n')
+        writer.close()
+
+        assert list(CaptureReader(capture_dir).lines()) == [(42, 'one\n')]
+
+    def test_lines_captured_before_are_skipped(self, capture_dir):
+        writer = CaptureWriter(capture_dir)
+        writer.write(timestamped(100, 'one\n'))
+        writer.close()
+
+        writer = CaptureWriter(capture_dir)
+        writer.write(timestamped(100, 'one\n'))
+        writer.write(timestamped(101, 'two\n'))
+        writer.close()
+
+        lines = [line for _, line in CaptureReader(capture_dir).lines()]
+        assert lines == ['one\n', 'two\n']
+
+    def test_lines_with_the_same_timestamp_are_kept(self, capture_dir):
+        writer = CaptureWriter(capture_dir)
+        for line in ['one\n', 'two\n', 'one\n']:
+            writer.write('2016-05-01T12:00:00.123456789Z ' + line)
+        writer.write('2016-05-01T12:00:00.123456790Z three\n')
+        writer.close()
+
+        writer = CaptureWriter(capture_dir)
+        for line in ['one\n', 'two\n', 'one\n']:
+            writer.write('2016-05-01T12:00:00.123456789Z ' + line)
+        writer.write('2016-05-01T12:00:00.123456790Z three\n')
+        writer.write('2016-05-01T12:00:00.123456790Z three\n')
+        writer.close()
+
+        lines = [line for _, line in CaptureReader(capture_dir).lines()]
+        assert lines == ['one\n', 'two\n', 'one\n', 'three\n', 'three\n']
+
+    def test_blocks_are_separate_gzip_members(self, capture_dir):
+        writer = CaptureWriter(capture_dir, block_size=1)
+        for timestamp in range(3):
+            writer.write(timestamped(timestamp + 1, 'line {}\n'.format(timestamp)))
+        writer.close()
+
+        entries = read_index(capture_dir)
+        assert [(entry.first, entry.last) for entry in entries] == [(1, 1), (2, 2), (3, 3)]
+        assert len(set(entry.offset for entry in entries)) == 3
+        with gzip.open(segment_path(capture_dir, 0)) as f:
+            assert f.read().count(b'line') == 3
+
+    def test_segments_are_rotated_and_removed(self, capture_dir):
+        writer = CaptureWriter(capture_dir, block_size=1, segment_size=1, max_segments=2)
+        for timestamp in range(4):
+            writer.write(timestamped(timestamp + 1, 'line\n'))
+        writer.close()
+
+        assert sorted(os.listdir(capture_dir)) == [
+            '000002.log.gz', '000003.log.gz', 'index', 'last']
+        assert [entry.segment for entry in read_index(capture_dir)] == [2, 3]
+        assert [t for t, _ in CaptureReader(capture_dir).lines()] == [3, 4]
+
+
+class TestCaptureReader(object):
+
+    def test_since_and_until(self, capture_dir):
+        writer = CaptureWriter(capture_dir, block_size=1)
+        for timestamp in range(1, 6):
+            writer.write(timestamped(timestamp, 'line {}\n'.format(timestamp)))
+        writer.close()
+
+        reader = CaptureReader(capture_dir)
+        with mock.patch.object(reader, 'read_block', wraps=reader.read_block) as read_block:
+            lines = list(reader.lines(since=2, until=3.5))
+
+        assert lines == [(2, 'line 2\n'), (3, 'line 3\n')]
+        assert read_block.call_count == 2
+
+
+class TestLogCapture(object):
+
+    def test_log_generator(self, capture_dir):
+        container = mock.Mock(spec=Container)
+        container.name = 'project_web_1'
+        capture = LogCapture(capture_dir, until=3)
+        assert not capture.reads(container, {})
+
+        writer = capture.writer(container)
+        for timestamp in range(1, 5):
+            writer.write(timestamped(timestamp, 'line {}\n'.format(timestamp)))
+        writer.close()
+
+        assert capture.reads(container, {})
+        assert not capture.reads(container, {'follow': True})
+        lines = capture.log_generator(container, {'tail': 2, 'timestamps': True})
+        assert list(lines) == [
+            '1970-01-01T00:00:02.000000Z line 2\n',
+            '1970-01-01T00:00:03.000000Z line 3\n',
+        ]
+
+
+def test_split_timestamp():
+    assert split_timestamp('2016-05-01T12:00:00.123456789Z hello\n') == (
+        pytest.approx(1462104000.123456789), 'hello\n')
+    assert split_timestamp('hello\n') == (None, 'hello\n')
+
+
+def test_split_timestamp_ns():
+    assert split_timestamp_ns('2016-05-01T12:00:00.123456789Z hello\n') == (
+        1462104000123456789, 'hello\n')
+    assert split_timestamp_ns('2016-05-01T12:00:00.5Z hello\n') == (
+        1462104000500000000, 'hello\n')
+    assert split_timestamp_ns('2016-05-01T12:00:00Z hello\n') == (
+        1462104000000000000, 'hello\n')
+
+
+def test_format_timestamp_carries_into_seconds():
+    assert format_timestamp(1462104000.9999999) == '2016-05-01T12:00:01.000000Z'
+    assert format_timestamp(1462104000.5) == '2016-05-01T12:00:00.500000Z'
+
+
+def test_parse_time():
+    assert parse_time('1462104000') == 1462104000
+    assert parse_time('2016-05-01T12:00:00') == 1462104000
+    assert parse_time('2016-05-01T12:00:00.5Z') == 1462104000.5
+    with pytest.raises(ValueError):
+        parse_time('yesterday')
@@ -0,0 +1,162 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import tempfile
+
+import pytest
+import six
+
+from compose.cli.log_capture import format_timestamp
+from compose.cli.log_file import JsonLogFile
+from compose.cli.log_printer import build_log_file_generator
+from compose.cli.log_printer import build_log_generator
+from compose.cli.log_printer import build_log_presenters
+from compose.cli.log_printer import get_log_generator
+from compose.cli.log_printer import LogPrinter
+from compose.container import Container
+from tests import mock
+
+
+@pytest.fixture
+def log_dir(request):
+    path = tempfile.mkdtemp()
+    request.addfinalizer(lambda: shutil.rmtree(path))
+    return path
+
+
+def write_log(log_dir, count, partial=False):
+    """Write a log file like the json-file log driver does, with a line a
+    second from 100 seconds after the epoch.
+    """
+    path = os.path.join(log_dir, 'container-json.log')
+    with open(path, 'w') as f:
+        for number in range(count):
+            f.write(json.dumps({
+                'log': 'line {}\n'.format(number),
+                'stream': 'stdout',
+                'time': format_timestamp(100 + number),
+            }) + '\n')
+        if partial:
+            f.write('{"log": "still being wri')
+    return path
+
+
+def logged(log_file, **kwargs):
+    return [line for _, line in log_file.lines(**kwargs)]
+
+
+class TestJsonLogFile(object):
+
+    def test_all_lines(self, log_dir):
+        log_file = JsonLogFile(write_log(log_dir, 3))
+        assert logged(log_file) == ['line 0\n', 'line 1\n', 'line 2\n']
+
+    def test_empty_file(self, log_dir):
+        assert logged(JsonLogFile(write_log(log_dir, 0))) == []
+
+    def test_tail(self, log_dir):
+        log_file = JsonLogFile(write_log(log_dir, 100))
+        assert logged(log_file, tail=2) == ['line 98\n', 'line 99\n']
+        assert logged(log_file, tail=0) == []
+        assert len(logged(log_file, tail=1000)) == 100
+
+    def test_tail_skips_a_line_being_written(self, log_dir):
+        log_file = JsonLogFile(write_log(log_dir, 10, partial=True))
+        assert logged(log_file, tail=1) == ['line 9\n']
+
+    def test_since(self, log_dir):
+        log_file = JsonLogFile(write_log(log_dir, 100))
+        assert logged(log_file, since=197) == ['line 97\n', 'line 98\n', 'line 99\n']
+        assert len(logged(log_file, since=0)) == 100
+        assert logged(log_file, since=1000) == []
+
+    def test_since_with_a_line_being_written(self, log_dir):
+        path = write_log(log_dir, 2)
+        with open(path, 'a') as f:
+            f.write('{"log": "' + 'x' * 5000)
+        log_file = JsonLogFile(path)
+        assert logged(log_file, since=101) == ['line 1\n']
+        assert logged(log_file, since=100) == ['line 0\n', 'line 1\n']
+
+    def test_since_skips_lines_which_cant_be_read(self, log_dir):
+        path = write_log(log_dir, 2)
+        with open(path) as f:
+            lines = f.readlines()
+        with open(path, 'w') as f:
+            f.writelines([lines[0]] + ['not json\n'] * 20 + [lines[1]])
+        log_file = JsonLogFile(path)
+        assert logged(log_file, since=101) == ['line 1\n']
+        assert logged(log_file, since=102) == []
+
+    def test_since_and_tail(self, log_dir):
+        log_file = JsonLogFile(write_log(log_dir, 100))
+        assert logged(log_file, since=198, tail=5) == ['line 98\n', 'line 99\n']
+        assert logged(log_file, since=190, tail=1) == ['line 99\n']
+
+    def test_log_generator_with_timestamps(self, log_dir):
+        log_file = JsonLogFile(write_log(log_dir, 1))
+        assert list(log_file.log_generator({'timestamps': True})) == [
+            '1970-01-01T00:01:40.000000Z line 0\n',
+        ]
+
+
+class TestBuildLogFileGenerator(object):
+
+    def container(self, log_path):
+        container = mock.Mock(spec=Container, name='web_1')
+        container.has_api_logs = True
+        container.log_driver = 'json-file'
+        container.log_stream = None
+        container.get.side_effect = lambda key: {'LogPath': log_path}[key]
+        container.logs.return_value = iter([b'from the daemon\n'])
+        return container
+
+    def test_reads_the_log_file(self, log_dir):
+        container = self.container(write_log(log_dir, 2))
+        lines = list(build_log_file_generator(container, {'tail': 1}))
+
+        assert lines == ['line 1\n']
+        assert not container.logs.called
+
+    def test_falls_back_to_the_daemon(self, log_dir):
+        container = self.container(os.path.join(log_dir, 'missing-json.log'))
+        lines = list(build_log_file_generator(container, {'tail': 1}))
+
+        assert lines == ['from the daemon\n']
+        container.logs.assert_called_once_with(
+            stdout=True, stderr=True, stream=True, tail=1)
+
+    def test_opt_in(self, log_dir):
+        container = self.container(write_log(log_dir, 2))
+        with mock.patch.dict(os.environ, {'COMPOSE_LOG_DIRECT': '1'}):
+            assert get_log_generator(container, {}) is build_log_file_generator
+            assert get_log_generator(container, {'follow': True}) is build_log_generator
+        with mock.patch.dict(os.environ, {'COMPOSE_LOG_DIRECT': ''}):
+            assert get_log_generator(container, {}) is build_log_generator
+
+    def test_log_printer_reads_the_log_file(self, log_dir):
+        container = self.container(write_log(log_dir, 2))
+        container.name_without_project = 'web_1'
+        output = six.StringIO()
+        printer = LogPrinter(
+            [container],
+            build_log_presenters(['web'], True),
+            iter([]),
+            output=output,
+            log_args={'tail': 'all'})
+        multiplexer = mock.Mock()
+        multiplexer.add.return_value.is_alive.return_value = False
+
+        with mock.patch.dict(os.environ, {'COMPOSE_LOG_DIRECT': '1'}):
+            with mock.patch(
+                'compose.cli.log_printer.build_multiplexer',
+                return_value=multiplexer,
+            ):
+                printer.run()
+
+        assert output.getvalue() == 'web_1  | line 0\nweb_1  | line 1\n'
+        assert not multiplexer.add.called
+        assert not container.logs.called
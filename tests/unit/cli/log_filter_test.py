@@ -0,0 +1,42 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import pytest
+
+from compose.cli.log_filter import level_pattern
+from compose.cli.log_filter import LogFilter
+
+
+class TestLogFilter(object):
+
+    def test_grep(self):
+        log_filter = LogFilter(grep=r'time(out)?')
+        assert log_filter.match('connection timeout\n')
+        assert not log_filter.match('connected\n')
+
+    def test_exclude(self):
+        log_filter = LogFilter(exclude='healthcheck')
+        assert log_filter.match('GET /\n')
+        assert not log_filter.match('GET /healthcheck\n')
+
+    def test_grep_level_and_exclude_are_combined(self):
+        log_filter = LogFilter(grep='db', exclude='retrying', level='error')
+        assert log_filter.match('ERROR: db is down\n')
+        assert not log_filter.match('ERROR: db is down, retrying\n')
+        assert not log_filter.match('INFO: db is up\n')
+        assert not log_filter.match('ERROR: cache is down\n')
+
+    def test_level_includes_levels_above(self):
+        warnings = LogFilter(level='warning')
+        assert warnings.match('[WARN] disk almost full\n')
+        assert warnings.match('Fatal: disk full\n')
+        assert not warnings.match('terror of errors\n')
+        assert not LogFilter(level='error').match('Warning: disk almost full\n')
+
+    def test_unknown_level(self):
+        with pytest.raises(ValueError):
+            level_pattern('debug')
+
+    def test_highlight(self):
+        log_filter = LogFilter(grep='down')
+        assert log_filter.highlight('db is down\n') == 'db is \033[7mdown\033[0m\n'
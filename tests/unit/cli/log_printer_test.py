@@ -2,16 +2,32 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 
 import itertools
+import json
+import socket
+import struct
+import threading
 
 import pytest
 import six
 from six.moves.queue import Queue
 
+from compose.cli.log_filter import LogFilter
+from compose.cli.log_printer import BatchedWriter
 from compose.cli.log_printer import build_log_generator
 from compose.cli.log_printer import build_log_presenters
 from compose.cli.log_printer import build_no_log_generator
+from compose.cli.log_printer import build_thread
 from compose.cli.log_printer import consume_queue
+from compose.cli.log_printer import JsonLogPresenter
+from compose.cli.log_printer import LogMultiplexer
+from compose.cli.log_printer import LogPresenter
+from compose.cli.log_printer import LogPrinter
+from compose.cli.log_printer import LogQueue
+from compose.cli.log_printer import LogSource
+from compose.cli.log_printer import MergedLogPrinter
+from compose.cli.log_printer import OVERFLOW_DROP
 from compose.cli.log_printer import QueueItem
+from compose.cli.log_printer import tail_container_logs
 from compose.cli.log_printer import wait_on_exit
 from compose.cli.log_printer import watch_events
 from compose.container import Container
@@ -44,6 +60,207 @@ class TestLogPresenter(object):
         actual = presenter.present(mock_container, "this line")
         assert '\033[' in actual
 
+    def test_prefix_is_built_once_per_container(self, mock_container):
+        color_func = mock.Mock(side_effect=lambda text: text)
+        presenter = LogPresenter(6, color_func)
+        assert presenter.present(mock_container, "one\n") == "web_1  | one\n"
+        assert presenter.present(mock_container, "two\n") == "web_1  | two\n"
+        assert color_func.call_count == 1
+
+        other = mock.Mock(spec=Container, name_without_project='db_1')
+        assert presenter.present(other, "three\n") == "db_1   | three\n"
+
+    def test_filter(self, mock_container):
+        presenter = LogPresenter(6, lambda text: text, LogFilter(grep='two'), highlight=True)
+        assert not presenter.accepts('one\n')
+        assert presenter.accepts('two\n')
+        assert presenter.present(mock_container, 'two\n') == 'web_1  | \033[7mtwo\033[0m\n'
+
+    def test_filtered_lines_are_not_queued(self, mock_container):
+        mock_container.log_stream = iter([b'one\ntwo\nthree\n'])
+        presenter = LogPresenter(6, lambda text: text, LogFilter(exclude='^t'))
+        queue = LogQueue()
+
+        tail_container_logs(mock_container, presenter, queue, {})
+
+        assert list(consume_until_stopped(queue, 1)) == ['web_1  | one\n']
+
+    def test_followed_lines_are_captured(self, mock_container):
+        mock_container.log_stream = iter([b'one\ntwo\n'])
+        mock_container.wait.return_value = 0
+        presenter = LogPresenter(6, lambda text: text, LogFilter(exclude='^t'))
+        capture = mock.Mock()
+        capture.reads.return_value = False
+
+        tail_container_logs(mock_container, presenter, LogQueue(), {'follow': True}, capture)
+
+        writer = capture.writer.return_value
+        assert writer.write.mock_calls == [mock.call('one\n'), mock.call('two\n')]
+        writer.close.assert_called_once_with()
+
+    def test_captured_logs_are_requested_with_timestamps(self, mock_container):
+        mock_container.has_api_logs = True
+        mock_container.log_stream = None
+        mock_container.logs.return_value = iter([b'2016-05-01T12:00:00.5Z one\n'])
+        mock_container.wait.return_value = 0
+        presenter = LogPresenter(6, lambda text: text)
+        capture = mock.Mock()
+        capture.reads.return_value = False
+        queue = LogQueue()
+
+        tail_container_logs(mock_container, presenter, queue, {'follow': True}, capture)
+
+        mock_container.logs.assert_called_once_with(
+            stdout=True, stderr=True, stream=True, follow=True, timestamps=True)
+        capture.writer.return_value.write.assert_called_once_with(
+            '2016-05-01T12:00:00.5Z one\n')
+        assert queue.get().item == 'web_1  | one\n'
+
+
+class TestJsonLogPresenter(object):
+
+    @pytest.fixture
+    def container(self, mock_container):
+        mock_container.name = 'project_web_1'
+        mock_container.service = 'web'
+        mock_container.number = 1
+        return mock_container
+
+    def test_present(self, container):
+        presenter = JsonLogPresenter()
+        line = presenter.present(container, '2016-05-01T12:00:00.123456789Z "hi"\n', 'stderr')
+        assert line.endswith('\n')
+        assert json.loads(line) == {
+            'container': 'project_web_1',
+            'service': 'web',
+            'number': 1,
+            'stream': 'stderr',
+            'time': '2016-05-01T12:00:00.123456789Z',
+            'line': '"hi"',
+        }
+
+    def test_present_without_timestamp(self, container):
+        presenter = JsonLogPresenter()
+        with mock.patch('compose.cli.log_printer.time.time', return_value=1462104000):
+            output = json.loads(presenter.present(container, 'hello'))
+        assert output['time'] == '2016-05-01T12:00:00.000000Z'
+        assert output['stream'] is None
+        assert output['line'] == 'hello'
+
+    def test_filter_ignores_the_timestamp(self):
+        presenter = JsonLogPresenter(LogFilter(grep='^ERROR'))
+        assert presenter.accepts('2016-05-01T12:00:00.123456789Z ERROR: oops\n')
+        assert presenter.accepts('ERROR: oops\n')
+        assert not presenter.accepts('2016-05-01T12:00:00.123456789Z INFO: ERROR\n')
+
+    def test_present_exit(self, container):
+        container.wait.return_value = 3
+        output = json.loads(JsonLogPresenter().present_exit(container))
+        assert output['container'] == 'project_web_1'
+        assert output['exit_code'] == 3
+
+    def test_build_log_presenters(self):
+        presenter = next(build_log_presenters(['web'], False, log_format='json'))
+        assert isinstance(presenter, JsonLogPresenter)
+
+
+class TestBatchedWriter(object):
+
+    def test_lines_are_written_together(self, output_stream):
+        writer = BatchedWriter(output_stream, interval=60)
+        writer.write('one\n')
+        writer.write('two\n')
+        assert output_stream.getvalue() == ''
+
+        writer.flush()
+        assert output_stream.getvalue() == 'one\ntwo\n'
+        assert output_stream.flush.call_count == 1
+
+    def test_written_when_full(self, output_stream):
+        writer = BatchedWriter(output_stream, max_size=8, interval=60)
+        writer.write('one\n')
+        writer.write('two\n')
+        writer.write('three\n')
+        assert output_stream.getvalue() == 'one\ntwo\n'
+
+    def test_written_after_interval(self, output_stream):
+        writer = BatchedWriter(output_stream, interval=0)
+        writer.write('one\n')
+        assert output_stream.getvalue() == 'one\n'
+
+
+class TestLogPrinter(object):
+
+    def test_run_writes_lines_and_exits(self, output_stream, mock_container):
+        mock_container.has_api_logs = True
+        mock_container.log_stream = iter([b'hello\nworld\n'])
+        printer = LogPrinter(
+            [mock_container],
+            build_log_presenters(['web'], True),
+            iter([]),
+            output=output_stream)
+
+        with mock.patch('compose.cli.log_printer.build_multiplexer', return_value=None):
+            printer.run()
+
+        assert output_stream.getvalue() == 'web_1  | hello\nweb_1  | world\n'
+
+
+class TestMergedLogPrinter(object):
+
+    def container(self, name, lines):
+        container = mock.Mock(spec=Container, name_without_project=name)
+        container.has_api_logs = True
+        container.log_stream = None
+        container.logs.return_value = iter([''.join(lines).encode('utf-8')])
+        return container
+
+    def test_lines_are_merged_by_timestamp(self, output_stream):
+        web = self.container('web_1', [
+            '2016-05-01T12:00:01.5Z one\n',
+            '2016-05-01T12:00:03Z three\n',
+        ])
+        db = self.container('db_1', [
+            '2016-05-01T12:00:02.25Z two\n',
+            '2016-05-01T12:00:04Z four\n',
+        ])
+        printer = MergedLogPrinter(
+            [web, db],
+            build_log_presenters(['web', 'db'], True),
+            output=output_stream,
+            log_args={'timestamps': False},
+            window=1)
+        printer.run()
+
+        assert output_stream.getvalue() == (
+            'web_1  | one\n'
+            'db_1   | two\n'
+            'web_1  | three\n'
+            'db_1   | four\n'
+        )
+        web.logs.assert_called_once_with(
+            stdout=True, stderr=True, stream=True, timestamps=True)
+
+    def test_timestamps_are_kept_when_asked_for(self, output_stream):
+        web = self.container('web_1', ['2016-05-01T12:00:01Z one\n'])
+        printer = MergedLogPrinter(
+            [web],
+            build_log_presenters(['web'], True),
+            output=output_stream,
+            log_args={'timestamps': True})
+        printer.run()
+
+        assert output_stream.getvalue() == 'web_1  | 2016-05-01T12:00:01Z one\n'
+
+    def test_reader_errors_are_raised(self, output_stream):
+        web = self.container('web_1', [])
+        web.logs.side_effect = IOError('gone')
+        printer = MergedLogPrinter(
+            [web], build_log_presenters(['web'], True), output=output_stream)
+
+        with pytest.raises(IOError):
+            printer.run()
+
 
 def test_wait_on_exit():
     exit_status = 3
@@ -96,6 +313,141 @@ class TestBuildLogGenerator(object):
         assert next(generator) == glyph
 
 
+def frame(stream, payload):
+    return struct.pack('>BxxxL', stream, len(payload)) + payload
+
+
+class TestLogSource(object):
+
+    def test_feed_frames(self, mock_container):
+        source = LogSource(mock_container, mock.Mock(), mock.Mock())
+        glyph = u'\u2022'.encode('utf-8')
+        assert source.feed(frame(1, b'one\ntw') + frame(2, b'err\n' + glyph[:1])) == [
+            ('stdout', 'one\n'), ('stderr', 'err\n')]
+        assert source.feed(frame(1, b'o\n') + frame(2, glyph[1:])) == [('stdout', 'two\n')]
+        assert source.flush() == [('stderr', u'\u2022')]
+
+    def test_feed_tty_and_chunked(self, mock_container):
+        source = LogSource(mock_container, mock.Mock(), mock.Mock(), tty=True, chunked=True)
+        assert source.feed(b'4\r\na\nb\n\r\n') == [('stdout', 'a\n'), ('stdout', 'b\n')]
+        assert not source.done
+        source.feed(b'0\r\n\r\n')
+        assert source.done
+
+
+class TestLogMultiplexer(object):
+
+    @pytest.fixture
+    def presenter(self):
+        return LogPresenter(3, lambda text: text)
+
+    def test_reads_sources(self, mock_container, presenter):
+        queue = LogQueue()
+        multiplexer = LogMultiplexer(queue, {})
+        multiplexer.start()
+
+        sources = []
+        for _ in range(2):
+            reader, writer = socket.socketpair()
+            reader.setblocking(False)
+            source = LogSource(mock_container, presenter, reader)
+            multiplexer.add_source(source, buffered=frame(1, b'first\n'))
+            sources.append(source)
+            writer.sendall(frame(1, b'second\nthi') + frame(1, b'rd'))
+            writer.close()
+
+        output = ''.join(consume_until_stopped(queue, 2))
+        assert sorted(output.replace('third', 'third\n').splitlines()) == sorted(
+            ['web_1 | first', 'web_1 | second', 'web_1 | third'] * 2)
+        assert not any(source.is_alive() for source in sources)
+
+    def test_follow_reports_exit(self, mock_container, presenter):
+        mock_container.name = 'web_1'
+        mock_container.wait.return_value = 0
+        queue = LogQueue()
+        multiplexer = LogMultiplexer(queue, {'follow': True})
+        multiplexer.start()
+
+        reader, writer = socket.socketpair()
+        reader.setblocking(False)
+        multiplexer.add_source(LogSource(mock_container, presenter, reader))
+        writer.close()
+
+        assert list(consume_until_stopped(queue, 1)) == ['web_1 exited with code 0\n']
+
+    def test_timestamps_added_for_the_capture_are_stripped(self, mock_container, presenter):
+        queue = LogQueue()
+        multiplexer = LogMultiplexer(queue, {})
+        multiplexer.start()
+
+        reader, writer = socket.socketpair()
+        reader.setblocking(False)
+        capture_writer = mock.Mock()
+        multiplexer.add_source(LogSource(
+            mock_container, presenter, reader,
+            writer=capture_writer, strip_timestamps=True))
+        writer.sendall(frame(1, b'2016-05-01T12:00:00.5Z one\n'))
+        writer.close()
+
+        assert list(consume_until_stopped(queue, 1)) == ['web_1 | one\n']
+        capture_writer.write.assert_called_once_with('2016-05-01T12:00:00.5Z one\n')
+
+    def test_waiting_for_exit_does_not_block_other_streams(self, mock_container, presenter):
+        running = threading.Event()
+
+        def wait():
+            running.wait()
+            return 0
+        mock_container.name = 'web_1'
+        mock_container.wait.side_effect = wait
+        queue = LogQueue()
+        multiplexer = LogMultiplexer(queue, {'follow': True})
+        multiplexer.start()
+
+        ended, ended_writer = socket.socketpair()
+        ended.setblocking(False)
+        source = LogSource(mock_container, presenter, ended)
+        multiplexer.add_source(source)
+        ended_writer.close()
+
+        other, other_writer = socket.socketpair()
+        other.setblocking(False)
+        multiplexer.add_source(LogSource(mock_container, presenter, other))
+        other_writer.sendall(frame(1, b'still here\n'))
+
+        item = queue.get(timeout=5)
+        assert item.item == 'web_1 | still here\n'
+        assert source.is_alive()
+
+        running.set()
+        assert queue.get(timeout=5).item == 'web_1 exited with code 0\n'
+        other_writer.close()
+
+    def test_build_thread_falls_back_to_a_thread(self, mock_container, presenter):
+        mock_container.has_api_logs = True
+        mock_container.log_stream = iter([b'hello\n'])
+        multiplexer = mock.Mock()
+        multiplexer.add.return_value = None
+        queue = LogQueue()
+
+        tailer = build_thread(mock_container, presenter, queue, {}, multiplexer)
+        tailer.join(1)
+
+        multiplexer.add.assert_called_once_with(mock_container, presenter)
+        assert list(consume_until_stopped(queue, 1)) == ['web_1 | hello\n']
+
+
+def consume_until_stopped(queue, count):
+    while count:
+        item = queue.get(timeout=5)
+        if item.exc:
+            raise item.exc
+        if item.is_stop:
+            count -= 1
+        else:
+            yield item.item
+
+
 @pytest.fixture
 def thread_map():
     return {'cid': mock.Mock()}
@@ -137,6 +489,63 @@ class TestWatchEvents(object):
         assert container_id not in thread_map
 
 
+class TestLogQueue(object):
+
+    @pytest.fixture
+    def presenter(self):
+        return LogPresenter(6, lambda text: text)
+
+    def test_size_is_characters(self, presenter, mock_container):
+        queue = LogQueue(max_size=100)
+        queue.put_lines(presenter, mock_container, [(None, 'one\n'), (None, 'two\n')])
+        queue.put(QueueItem.stop())
+        assert queue.qsize() == len('web_1  | one\nweb_1  | two\n') + 2
+
+        queue.get()
+        queue.get()
+        assert queue.empty()
+
+    def test_block_waits_when_full(self, presenter, mock_container):
+        queue = LogQueue(max_size=10)
+        queue.put_lines(presenter, mock_container, [(None, 'one\n')])
+        with mock.patch.object(queue, 'put', autospec=True) as put:
+            queue.put_lines(presenter, mock_container, [(None, 'two\n')])
+        put.assert_called_once_with(QueueItem.new('web_1  | two\n'))
+
+    def test_drop_counts_lines_and_reports_them(self, presenter, mock_container):
+        queue = LogQueue(max_size=10, overflow=OVERFLOW_DROP)
+        queue.put_lines(presenter, mock_container, [(None, 'one\n')])
+        queue.put_lines(presenter, mock_container, [(None, 'two\n'), (None, 'three\n')])
+        queue.put_lines(presenter, mock_container, [(None, 'four\n')])
+        assert queue.dropped == {'web_1': 3}
+
+        assert queue.get().item == 'web_1  | one\n'
+        queue.put_lines(presenter, mock_container, [(None, 'five\n')])
+        assert queue.get().item == 'web_1  | [3 lines dropped]\nweb_1  | five\n'
+        assert queue.dropped == {'web_1': 3}
+
+    def test_consumed_items_free_their_space(self, presenter, mock_container):
+        queue = LogQueue(max_size=20)
+        queue.put_lines(presenter, mock_container, [(None, 'one\n')])
+
+        generator = consume_queue(queue, False)
+        assert next(generator) == 'web_1  | one\n'
+        assert queue.qsize() == 0
+
+    def test_from_env(self):
+        env = {'COMPOSE_LOG_QUEUE_SIZE': '1000', 'COMPOSE_LOG_OVERFLOW': 'drop'}
+        with mock.patch.dict('os.environ', env):
+            queue = LogQueue.from_env()
+        assert queue.maxsize == 1000
+        assert queue.overflow == OVERFLOW_DROP
+
+        env = {'COMPOSE_LOG_QUEUE_SIZE': 'lots', 'COMPOSE_LOG_OVERFLOW': 'explode'}
+        with mock.patch.dict('os.environ', env):
+            queue = LogQueue.from_env()
+        assert queue.maxsize == 4 * 1024 * 1024
+        assert queue.overflow == 'block'
+
+
 class TestConsumeQueue(object):
 
     def test_item_is_an_exception(self):
@@ -0,0 +1,71 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import socket
+import struct
+
+import pytest
+
+from compose.cli.log_stream import ChunkedDecoder
+from compose.cli.log_stream import FrameDecoder
+from compose.cli.log_stream import read_available
+
+
+def frame(stream, payload):
+    return struct.pack('>BxxxL', stream, len(payload)) + payload
+
+
+class TestFrameDecoder(object):
+
+    def test_whole_frames(self):
+        decoder = FrameDecoder()
+        data = frame(1, b'out\n') + frame(2, b'err\n')
+        assert decoder.feed(data) == [(1, b'out\n'), (2, b'err\n')]
+
+    def test_frames_split_across_chunks(self):
+        decoder = FrameDecoder()
+        data = frame(1, b'hello\n') + frame(2, b'world\n')
+        frames = []
+        for index in range(len(data)):
+            frames.extend(decoder.feed(data[index:index + 1]))
+        assert frames == [(1, b'hello\n'), (2, b'world\n')]
+        assert not decoder.buffer
+
+
+class TestChunkedDecoder(object):
+
+    def test_chunks(self):
+        decoder = ChunkedDecoder()
+        assert decoder.feed(b'5\r\nhello\r\n6;ext=1\r\n world\r\n') == b'hello world'
+        assert not decoder.done
+        assert decoder.feed(b'0\r\n\r\n') == b''
+        assert decoder.done
+
+    def test_chunks_split_across_reads(self):
+        decoder = ChunkedDecoder()
+        data = b'5\r\nhello\r\nb\r\n from a log\r\n0\r\n\r\n'
+        output = b''.join(decoder.feed(data[index:index + 1]) for index in range(len(data)))
+        assert output == b'hello from a log'
+        assert decoder.done
+
+
+class TestReadAvailable(object):
+
+    @pytest.fixture
+    def sockets(self, request):
+        reader, writer = socket.socketpair()
+        reader.setblocking(False)
+        request.addfinalizer(reader.close)
+        request.addfinalizer(writer.close)
+        return reader, writer
+
+    def test_nothing_available(self, sockets):
+        reader, _ = sockets
+        assert read_available(reader) == (b'', False)
+
+    def test_data_and_end_of_stream(self, sockets):
+        reader, writer = sockets
+        writer.sendall(b'some output')
+        assert read_available(reader) == (b'some output', False)
+        writer.close()
+        assert read_available(reader) == (b'', True)
@@ -120,6 +120,7 @@ class CLITestCase(unittest.TestCase):
                 '--publish': [],
                 '--rm': None,
                 '--name': None,
+                '--pool': None,
                 '--workdir': None,
             })
 
@@ -154,6 +155,7 @@ class CLITestCase(unittest.TestCase):
             '--publish': [],
             '--rm': None,
             '--name': None,
+            '--pool': None,
             '--workdir': None,
         })
 
@@ -176,6 +178,7 @@ class CLITestCase(unittest.TestCase):
             '--publish': [],
             '--rm': True,
             '--name': None,
+            '--pool': None,
             '--workdir': None,
         })
 
@@ -207,4 +210,37 @@ class CLITestCase(unittest.TestCase):
                 '--publish': ['80:80'],
                 '--rm': None,
                 '--name': None,
+                '--pool': None,
             })
+
+    @mock.patch('compose.cli.main.log_printer_from_project', autospec=True)
+    def test_logs_in_json_format_only_print_json(self, mock_log_printer):
+        project = Project.from_config(
+            name='composetest',
+            client=mock.create_autospec(docker.Client),
+            config_data=build_config({
+                'service': {'image': 'busybox'},
+            }),
+        )
+        command = TopLevelCommand(project)
+        options = {
+            'SERVICE': [],
+            '--no-color': False,
+            '--follow': False,
+            '--timestamps': False,
+            '--tail': None,
+            '--grep': None,
+            '--exclude': None,
+            '--level': None,
+            '--since': None,
+            '--until': None,
+            '--capture-dir': None,
+            '--merge': False,
+        }
+
+        with mock.patch('compose.cli.main.print', create=True) as mock_print:
+            command.logs(dict(options, **{'--format': 'json'}))
+            assert not mock_print.called
+
+            command.logs(dict(options, **{'--format': 'text'}))
+            mock_print.assert_called_once_with("Attaching to", "")
@@ -1360,6 +1360,57 @@ class ConfigTest(unittest.TestCase):
             config.load(config_details)
         assert "Service 'one' depends on service 'three'" in exc.exconly()
 
+    def test_readiness_probe(self):
+        config_data = config.load(build_config_details({
+            'version': '2',
+            'services': {
+                'db': {
+                    'image': 'postgres',
+                    'readiness': {'exec': 'pg_isready', 'timeout': 30},
+                },
+            },
+        }))
+        assert config_data.services[0]['readiness'] == {
+            'exec': 'pg_isready',
+            'timeout': 30,
+        }
+
+    def test_readiness_probe_with_two_checks_errors(self):
+        config_details = build_config_details({
+            'version': '2',
+            'services': {
+                'db': {
+                    'image': 'postgres',
+                    'readiness': {'exec': 'pg_isready', 'log': 'ready'},
+                },
+            },
+        })
+        with pytest.raises(ConfigurationError) as exc:
+            config.load(config_details)
+        assert "exactly one of 'port', 'exec' or 'log'" in exc.exconly()
+
+    def test_readiness_probe_invalid_log_pattern_errors(self):
+        config_details = build_config_details({
+            'version': '2',
+            'services': {
+                'db': {'image': 'postgres', 'readiness': {'log': 'ready ('}},
+            },
+        })
+        with pytest.raises(ConfigurationError) as exc:
+            config.load(config_details)
+        assert "invalid readiness log pattern" in exc.exconly()
+
+    def test_readiness_probe_port_without_ports_errors(self):
+        config_details = build_config_details({
+            'version': '2',
+            'services': {
+                'db': {'image': 'postgres', 'readiness': {'port': 5432}},
+            },
+        })
+        with pytest.raises(ConfigurationError) as exc:
+            config.load(config_details)
+        assert "does not publish any ports" in exc.exconly()
+
     def test_load_dockerfile_without_context(self):
         config_details = build_config_details({
             'version': '2',
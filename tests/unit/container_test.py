@@ -110,6 +110,68 @@ class ContainerTest(unittest.TestCase):
         container.inspect_if_not_inspected()
         self.assertEqual(mock_client.inspect_container.call_count, 1)
 
+    def test_create_does_not_inspect(self):
+        mock_client = mock.create_autospec(docker.Client)
+        mock_client.create_container.return_value = {'Id': self.container_id}
+        labels = {'com.docker.compose.service': 'web'}
+
+        container = Container.create(
+            mock_client,
+            name='composetest_web_1',
+            image='busybox',
+            labels=labels,
+            host_config={'NetworkMode': 'composetest_default'})
+
+        assert container.id == self.container_id
+        assert container.name == 'composetest_web_1'
+        assert container.labels == labels
+        assert container.get('NetworkSettings.Networks') == {
+            'composetest_default': {},
+        }
+        assert not mock_client.inspect_container.called
+
+    def test_create_knows_what_attach_needs(self):
+        mock_client = mock.create_autospec(docker.Client)
+        mock_client.create_container.return_value = {'Id': self.container_id}
+
+        container = Container.create(
+            mock_client,
+            name='composetest_web_1',
+            image='busybox',
+            tty=True,
+            host_config={'LogConfig': {'Type': 'json-file', 'Config': {}}})
+
+        assert container.log_driver == 'json-file'
+        assert container.has_api_logs
+        assert container.get('Config.Tty') is True
+        assert not mock_client.inspect_container.called
+
+    def test_create_inspects_lazily(self):
+        mock_client = mock.create_autospec(docker.Client)
+        mock_client.create_container.return_value = {'Id': self.container_id}
+        mock_client.inspect_container.return_value = {
+            'Id': self.container_id,
+            'State': {'Running': True},
+        }
+
+        container = Container.create(
+            mock_client,
+            name='composetest_web_1',
+            image='busybox')
+
+        assert container.is_running
+        mock_client.inspect_container.assert_called_once_with(self.container_id)
+        assert container.has_been_inspected
+
+    def test_create_without_name_inspects(self):
+        mock_client = mock.create_autospec(docker.Client)
+        mock_client.create_container.return_value = {'Id': self.container_id}
+
+        container = Container.create(mock_client, image='busybox')
+
+        mock_client.inspect_container.assert_called_once_with(self.container_id)
+        assert container.has_been_inspected
+
     def test_human_readable_ports_none(self):
         container = Container(None, self.container_dict, has_been_inspected=True)
         self.assertEqual(container.human_readable_ports, '')
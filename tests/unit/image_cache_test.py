@@ -0,0 +1,77 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+
+import docker
+
+from .. import mock
+from .. import unittest
+from compose.image_cache import ImageCache
+
+
+def saved_image(files):
+    fileobj = io.BytesIO()
+    archive = tarfile.open(mode='w', fileobj=fileobj)
+    for name, content in files:
+        if content is None:
+            info = tarfile.TarInfo(name)
+            info.type = tarfile.DIRTYPE
+            archive.addfile(info)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    archive.close()
+    fileobj.seek(0)
+    return fileobj
+
+
+def read_archive(data):
+    archive = tarfile.open(fileobj=io.BytesIO(data))
+    return [
+        (info.name, archive.extractfile(info).read() if info.isreg() else None)
+        for info in archive.getmembers()
+    ]
+
+
+class ImageCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.cache = ImageCache(self.path)
+        self.mock_client = mock.create_autospec(docker.Client)
+
+    def test_save_and_load(self):
+        files = [
+            ('abc', None),
+            ('abc/layer.tar', b'layer' * 1000),
+            ('abc/json', b'{}'),
+            ('repositories', b'{"default_web": {"latest": "abc"}}'),
+        ]
+        self.mock_client.get_image.return_value = saved_image(files)
+
+        assert not self.cache.has('digest')
+        self.cache.save(self.mock_client, 'default_web', 'sha256:1234', 'digest')
+        assert self.cache.has('digest')
+        self.mock_client.get_image.assert_called_once_with('default_web')
+
+        loaded = []
+        self.mock_client.load_image.side_effect = lambda data: loaded.append(b''.join(data))
+        assert ImageCache(self.path).load(self.mock_client, 'digest') == 'sha256:1234'
+        assert read_archive(loaded[0]) == files
+
+    def test_shared_layers_are_stored_once(self):
+        self.mock_client.get_image.side_effect = [
+            saved_image([('base/layer.tar', b'base'), ('one/layer.tar', b'one')]),
+            saved_image([('base/layer.tar', b'base'), ('two/layer.tar', b'two')]),
+        ]
+        self.cache.save(self.mock_client, 'one', 'sha256:1', 'digest1')
+        self.cache.save(self.mock_client, 'two', 'sha256:2', 'digest2')
+
+        assert len(os.listdir(os.path.join(self.path, 'blobs'))) == 3
@@ -0,0 +1,44 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from .. import unittest
+from compose.image_index import ImageIndex
+
+
+class ImageIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = ImageIndex([
+            {
+                'Id': 'sha256:1',
+                'RepoTags': ['busybox:latest', 'busybox:1.24'],
+                'RepoDigests': ['busybox@sha256:abcd'],
+            },
+            {
+                'Id': 'sha256:2',
+                'RepoTags': ['<none>:<none>'],
+                'RepoDigests': None,
+            },
+            {
+                'Id': 'sha256:3',
+                'RepoTags': ['localhost:5000/web:dev'],
+            },
+        ])
+
+    def test_get(self):
+        assert self.index.get('busybox') == {'Id': 'sha256:1'}
+        assert self.index.get('busybox:1.24') == {'Id': 'sha256:1'}
+        assert self.index.get('busybox@sha256:abcd') == {'Id': 'sha256:1'}
+        assert self.index.get('localhost:5000/web:dev') == {'Id': 'sha256:3'}
+
+    def test_get_missing(self):
+        assert self.index.get('<none>') is None
+        assert self.index.get('busybox:1.25') is None
+        assert self.index.get('localhost:5000/web') is None
+
+    def test_add_and_discard(self):
+        self.index.add('web', {'Id': 'sha256:4'})
+        assert self.index.get('web:latest') == {'Id': 'sha256:4'}
+        self.index.discard('busybox:latest')
+        assert self.index.get('busybox') is None
+        assert self.index.get('busybox:1.24') == {'Id': 'sha256:1'}
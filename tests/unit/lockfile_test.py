@@ -0,0 +1,49 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from .. import unittest
+from compose.config import ConfigurationError
+from compose.lockfile import Lockfile
+
+
+class LockfileTest(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.path = os.path.join(tmpdir, 'docker-compose.lock')
+
+    def test_load_missing(self):
+        lockfile = Lockfile.load(self.path)
+        assert lockfile.images == {}
+        assert lockfile.digest('busybox') is None
+
+    def test_save_and_load(self):
+        lockfile = Lockfile.load(self.path)
+        lockfile.set('busybox', 'sha256:1')
+        lockfile.set('redis:3', 'sha256:2')
+        lockfile.save()
+
+        lockfile = Lockfile.load(self.path)
+        assert lockfile.digest('busybox:latest') == 'sha256:1'
+        assert lockfile.digest('redis:3') == 'sha256:2'
+        assert lockfile.digest('redis') is None
+
+    def test_set_replaces_equivalent_name(self):
+        lockfile = Lockfile(self.path, {'busybox:latest': 'sha256:1'})
+        lockfile.set('busybox', 'sha256:2')
+        assert lockfile.images == {'busybox': 'sha256:2'}
+
+    def test_load_invalid(self):
+        with open(self.path, 'w') as f:
+            json.dump({'images': ['busybox']}, f)
+
+        with pytest.raises(ConfigurationError):
+            Lockfile.load(self.path)
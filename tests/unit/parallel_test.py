@@ -1,9 +1,13 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import time
+from threading import Lock
+
 import six
 from docker.errors import APIError
 
+from compose.parallel import OperationFailedError
 from compose.parallel import parallel_execute
 from compose.parallel import parallel_execute_stream
 from compose.parallel import UpstreamError
@@ -39,6 +43,32 @@ def test_parallel_execute():
     assert sorted(results) == [2, 4, 6, 8, 10]
 
 
+def test_parallel_execute_with_limit():
+    limit = 2
+    lock = Lock()
+    running = []
+    max_running = []
+
+    def process(x):
+        with lock:
+            running.append(x)
+            max_running.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(x)
+
+    parallel_execute(
+        objects=list(range(6)),
+        func=process,
+        get_name=six.text_type,
+        msg="Processing",
+        limit=limit,
+    )
+
+    assert len(max_running) == 6
+    assert max(max_running) <= limit
+
+
 def test_parallel_execute_with_deps():
     log = []
 
@@ -88,3 +118,19 @@ def test_parallel_execute_with_upstream_errors():
     assert (data_volume, None, APIError) in events
     assert (db, None, UpstreamError) in events
     assert (web, None, UpstreamError) in events
+
+
+def test_parallel_execute_with_failed_operation():
+    def process(x):
+        if x == 2:
+            raise OperationFailedError("two is not allowed")
+        return x
+
+    results = parallel_execute(
+        objects=[1, 2, 3],
+        func=process,
+        get_name=six.text_type,
+        msg="Processing",
+    )
+
+    assert sorted(results) == [1, 3]
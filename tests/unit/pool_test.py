@@ -0,0 +1,172 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import docker
+from docker.errors import APIError
+
+from .. import mock
+from .. import unittest
+from compose.const import LABEL_CONFIG_HASH
+from compose.const import LABEL_POOL
+from compose.pool import ContainerPool
+from compose.service import Service
+
+
+class ContainerPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.mock_client.inspect_image.return_value = {'Id': 'abcd'}
+        self.service = Service('web', client=self.mock_client, project='default',
+                               image='busybox')
+        self.pool = ContainerPool(self.service, 2, {'command': ['true']})
+
+    def pool_container(self, container_id, name):
+        return {
+            'Id': container_id,
+            'Image': 'busybox',
+            'Names': ['/' + name],
+        }
+
+    def test_key_depends_on_options(self):
+        other = ContainerPool(self.service, 2, {'command': ['false']})
+        assert self.pool.key != other.key
+        assert self.pool.key == ContainerPool(self.service, 5, {'command': ['true']}).key
+
+    def test_containers_ignores_claimed(self):
+        self.mock_client.containers.return_value = [
+            self.pool_container('1', 'default_web_run_1_pool'),
+            self.pool_container('2', 'default_web_run_2'),
+        ]
+        assert [c.id for c in self.pool.containers()] == ['1']
+
+        _, kwargs = self.mock_client.containers.call_args
+        assert kwargs['filters']['status'] == 'created'
+        assert '{0}={1}'.format(LABEL_POOL, self.pool.key) in kwargs['filters']['label']
+
+    def test_claim(self):
+        self.mock_client.containers.return_value = [
+            self.pool_container('1', 'default_web_run_1_pool'),
+            self.pool_container('2', 'default_web_run_2_pool'),
+        ]
+        self.mock_client.rename.side_effect = [
+            APIError('conflict', mock.Mock()),
+            None,
+        ]
+        self.mock_client.inspect_container.return_value = {
+            'Id': '2',
+            'Name': '/default_web_run_2',
+        }
+
+        container = self.pool.claim()
+
+        assert container.id == '2'
+        assert self.mock_client.rename.mock_calls == [
+            mock.call('1', 'default_web_run_1'),
+            mock.call('2', 'default_web_run_2'),
+        ]
+
+    def test_claim_empty_pool(self):
+        self.mock_client.containers.return_value = []
+        assert self.pool.claim() is None
+
+    def fake_docker(self):
+        """Keep the containers created through the mock client, and list
+        them by their labels like the daemon does.
+        """
+        created = []
+
+        def create_container(**kwargs):
+            created.append({
+                'Id': str(len(created) + 1),
+                'Image': 'busybox',
+                'Names': ['/' + kwargs['name']],
+                'Labels': kwargs['labels'],
+            })
+            return {'Id': created[-1]['Id']}
+
+        def has_label(container, label):
+            key, _, value = label.partition('=')
+            return key in container['Labels'] and (
+                not value or container['Labels'][key] == value)
+
+        def containers(filters=None, **kwargs):
+            return [
+                container for container in created
+                if all(has_label(container, label) for label in filters['label'])
+            ]
+
+        self.mock_client.create_container.side_effect = create_container
+        self.mock_client.containers.side_effect = containers
+        self.mock_client.inspect_container.side_effect = lambda id: {
+            'Id': id,
+            'Name': created[int(id) - 1]['Names'][0],
+            'Config': {'Labels': created[int(id) - 1]['Labels']},
+        }
+        return created
+
+    def test_refill(self):
+        self.mock_client.containers.return_value = []
+        self.mock_client.create_container.return_value = {'Id': 'new'}
+
+        self.pool.refill()
+
+        assert self.mock_client.create_container.call_count == 1
+        _, kwargs = self.mock_client.create_container.call_args
+        assert kwargs['name'] == 'default_web_run_1_pool'
+        assert kwargs['command'] == ['true']
+        assert kwargs['labels'][LABEL_POOL] == self.pool.key
+        assert kwargs['labels'][LABEL_CONFIG_HASH] == self.service.config_hash
+
+    def test_refill_keeps_its_own_containers(self):
+        created = self.fake_docker()
+
+        for _ in range(4):
+            self.pool.refill()
+
+        assert [c['Names'] for c in created] == [
+            ['/default_web_run_1_pool'],
+            ['/default_web_run_2_pool'],
+        ]
+        assert not self.mock_client.remove_container.called
+
+    def test_refill_removes_stale_containers(self):
+        pool_containers = [
+            dict(self.pool_container('1', 'default_web_run_1_pool'),
+                 Labels={LABEL_CONFIG_HASH: 'old'}),
+            dict(self.pool_container('2', 'default_web_run_2_pool'),
+                 Labels={LABEL_CONFIG_HASH: self.service.config_hash}),
+        ]
+
+        def containers(all=False, filters=None):
+            # Only the query for the pools of any configuration finds them
+            if LABEL_POOL in filters['label']:
+                return pool_containers
+            return []
+        self.mock_client.containers.side_effect = containers
+        self.mock_client.inspect_container.return_value = {
+            'Id': '1',
+            'Name': '/default_web_run_1_pool',
+        }
+        self.mock_client.create_container.return_value = {'Id': 'new'}
+
+        self.pool.refill()
+
+        self.mock_client.remove_container.assert_called_once_with('1')
+
+    def test_refill_keeps_stale_containers_claimed_meanwhile(self):
+        def containers(all=False, filters=None):
+            if LABEL_POOL in filters['label']:
+                return [dict(self.pool_container('1', 'default_web_run_1_pool'),
+                             Labels={LABEL_CONFIG_HASH: 'old'})]
+            return []
+        self.mock_client.containers.side_effect = containers
+        self.mock_client.create_container.return_value = {'Id': 'new'}
+        self.mock_client.inspect_container.return_value = {
+            'Id': '1',
+            'Name': '/default_web_run_1',
+        }
+
+        self.pool.refill()
+
+        assert not self.mock_client.remove_container.called
@@ -0,0 +1,91 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import docker
+import six
+from docker.errors import APIError
+
+from .. import mock
+from .. import unittest
+from compose.prefetch import external_base_images
+from compose.prefetch import needs_pull
+from compose.prefetch import prefetch_base_images
+from compose.service import Service
+
+
+class PrefetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.mock_client.pull.return_value = [b'{"status": "Downloaded"}']
+        self.base_images = {
+            'base': ['debian:jessie'],
+            'web': ['test_base', 'busybox'],
+            'worker': ['test_base:latest', 'busybox:latest', 'redis@sha256:abcd'],
+            'db': [],
+        }
+        self.services = [
+            Service('base', client=self.mock_client, project='test', build={'context': '.'}),
+            Service('web', client=self.mock_client, project='test', build={'context': '.'}),
+            Service('worker', client=self.mock_client, project='test', build={'context': '.'}),
+            Service('db', client=self.mock_client, project='test', image='postgres'),
+        ]
+        patcher = mock.patch.object(
+            Service, 'build_base_images', autospec=True,
+            side_effect=lambda service: self.base_images[service.name])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_external_base_images(self):
+        assert external_base_images(self.services, self.services) == [
+            'debian:jessie',
+            'busybox',
+            'redis@sha256:abcd',
+        ]
+
+    def test_external_base_images_of_selected_services(self):
+        assert external_base_images(self.services[1:2], self.services) == ['busybox']
+
+    def test_prefetch_pulls_missing_images(self):
+        def inspect_image(image):
+            if image != 'busybox':
+                raise APIError(None, mock.Mock(status_code=404), 'No such image')
+            return {'Id': 'abcd'}
+
+        self.mock_client.inspect_image.side_effect = inspect_image
+
+        prefetch_base_images(self.mock_client, self.services, self.services)
+
+        assert sorted(self.mock_client.pull.call_args_list) == sorted([
+            mock.call('debian', tag='jessie', stream=True),
+            mock.call('redis@sha256:abcd', stream=True),
+        ])
+
+    def test_prefetch_pull_all(self):
+        prefetched = prefetch_base_images(
+            self.mock_client, self.services, self.services, pull=True)
+
+        assert not self.mock_client.inspect_image.called
+        assert self.mock_client.pull.call_count == 3
+        # Builds from prefetched images only don't pull them again
+        assert not needs_pull(self.services[0], prefetched)
+        assert needs_pull(self.services[1], prefetched)
+        assert needs_pull(self.services[2], prefetched)
+
+    def test_needs_pull_without_base_images(self):
+        self.base_images['base'] = []
+        assert needs_pull(self.services[0], set())
+
+    def test_prefetch_failure_is_reported_as_an_error(self):
+        self.mock_client.pull.return_value = [
+            b'{"error": "not found", "errorDetail": {"message": "not found"}}',
+        ]
+        output = six.StringIO()
+
+        with mock.patch('compose.parallel.sys.stderr', output):
+            prefetched = prefetch_base_images(
+                self.mock_client, self.services[1:2], self.services, pull=True)
+
+        assert 'Pulling base image busybox ... error' in output.getvalue()
+        assert prefetched == set()
+        assert 'ERROR: for busybox  not found' in output.getvalue()
@@ -1,9 +1,13 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import os
+import threading
+
 from six import StringIO
 
 from compose import progress_stream
+from tests import mock
 from tests import unittest
 
 
@@ -14,8 +18,8 @@ class ProgressStreamTestCase(unittest.TestCase):
             b'31019763, "start": 1413653874, "total": 62763875}, '
             b'"progress": "..."}',
         ]
-        events = progress_stream.stream_output(output, StringIO())
-        self.assertEqual(len(events), 1)
+        result = progress_stream.stream_output(output, StringIO())
+        self.assertEqual(result.event_count, 1)
 
     def test_stream_output_div_zero(self):
         output = [
@@ -23,8 +27,8 @@ class ProgressStreamTestCase(unittest.TestCase):
             b'0, "start": 1413653874, "total": 0}, '
             b'"progress": "..."}',
         ]
-        events = progress_stream.stream_output(output, StringIO())
-        self.assertEqual(len(events), 1)
+        result = progress_stream.stream_output(output, StringIO())
+        self.assertEqual(result.event_count, 1)
 
     def test_stream_output_null_total(self):
         output = [
@@ -32,8 +36,8 @@ class ProgressStreamTestCase(unittest.TestCase):
             b'0, "start": 1413653874, "total": null}, '
             b'"progress": "..."}',
         ]
-        events = progress_stream.stream_output(output, StringIO())
-        self.assertEqual(len(events), 1)
+        result = progress_stream.stream_output(output, StringIO())
+        self.assertEqual(result.event_count, 1)
 
     def test_stream_output_progress_event_tty(self):
         events = [
@@ -65,3 +69,101 @@ class ProgressStreamTestCase(unittest.TestCase):
 
         events = progress_stream.stream_output(events, output)
         self.assertTrue(len(output.getvalue()) > 0)
+
+    def test_stream_output_result(self):
+        output = [
+            b'{"stream": "Step 1 : FROM busybox\\n"}',
+            b'{"status": "Digest: sha256:abcd"}',
+            b'{"stream": "Successfully built 12345\\n"}',
+            b'{"stream": "Removing intermediate container\\n"}',
+        ]
+        result = progress_stream.stream_output(output, StringIO())
+        self.assertEqual(result.image_id, '12345')
+        self.assertEqual(result.digest, 'sha256:abcd')
+        self.assertEqual(result.event_count, 4)
+        self.assertEqual(result.last_event, {"stream": "Removing intermediate container\n"})
+
+    def test_stream_output_error(self):
+        output = [
+            b'{"stream": "Step 1 : FROM busybox\\n"}',
+            b'{"error": "oops", "errorDetail": {"message": "oops"}}',
+        ]
+        with self.assertRaises(progress_stream.StreamOutputError):
+            progress_stream.stream_output(output, StringIO())
+
+    def test_stream_output_aggregate(self):
+        events = [
+            b'{"status": "Downloading", "progressDetail": {"current": 500, "total": 1000}, "id": "a"}',
+            b'{"status": "Downloading", "progressDetail": {"current": 1000, "total": 3000}, "id": "b"}',
+            b'{"status": "Download complete", "progressDetail": {}, "id": "a"}',
+        ]
+        output = StringIO()
+
+        with mock.patch('compose.progress_stream.time.time', return_value=100):
+            progress_stream.stream_output(events, output, progress='aggregate')
+
+        lines = output.getvalue().split('\n')
+        # Only the first event and the end of the stream are drawn
+        assert len(lines) == 2 + 3 + 1
+        assert lines[-4].endswith('a: Download complete 1.0 kB / 1.0 kB (100.0%)')
+        assert lines[-3].endswith('b: Downloading 1.0 kB / 3.0 kB (33.3%)')
+        assert lines[-2].endswith('Total: 2.0 kB / 4.0 kB (50.0%)')
+
+    def test_stream_output_summary(self):
+        events = [
+            b'{"status": "Downloading", "progressDetail": {"current": 500, "total": 1000}, "id": "a"}',
+            b'{"status": "Downloading", "progressDetail": {"current": 600, "total": 1000}, "id": "a"}',
+            b'{"status": "Downloading", "progressDetail": {"current": 1000, "total": 1000}, "id": "a"}',
+            b'{"status": "Status: Downloaded newer image for busybox:latest"}',
+        ]
+        output = StringIO()
+
+        with mock.patch('compose.progress_stream.time.time', side_effect=[0, 1, 10, 11]):
+            progress_stream.stream_output(events, output)
+
+        assert output.getvalue() == (
+            "Progress: 600 B / 1.0 kB (60.0%)\n"
+            "Progress: 1.0 kB / 1.0 kB (100.0%)\n"
+            "Status: Downloaded newer image for busybox:latest\n"
+        )
+
+    def test_get_progress_mode(self):
+        class TTYStringIO(StringIO):
+            def isatty(self):
+                return True
+
+        with mock.patch.dict(os.environ, clear=True):
+            assert progress_stream.get_progress_mode(TTYStringIO()) == 'lines'
+            assert progress_stream.get_progress_mode(StringIO()) == 'summary'
+            assert progress_stream.get_progress_mode(StringIO(), 'none') == 'none'
+
+        with mock.patch.dict(os.environ, {'COMPOSE_PROGRESS': 'aggregate'}):
+            assert progress_stream.get_progress_mode(StringIO()) == 'aggregate'
+
+    def test_shared_progress_mode_never_redraws(self):
+        with mock.patch.dict(os.environ, {'COMPOSE_PROGRESS': 'aggregate'}):
+            assert progress_stream.shared_progress_mode(StringIO()) == 'summary'
+        with mock.patch.dict(os.environ, {'COMPOSE_PROGRESS': 'none'}):
+            assert progress_stream.shared_progress_mode(StringIO()) == 'none'
+
+    def test_prefixed_stream_writes_whole_lines(self):
+        output = StringIO()
+        stream = progress_stream.PrefixedStream(output, 'web | ', threading.Lock())
+
+        stream.write('Step 1 : FROM busybox\nStep 2 ')
+        assert output.getvalue() == 'web | Step 1 : FROM busybox\n'
+
+        stream.write(': RUN true\r\n')
+        stream.write('done')
+        stream.close()
+        assert output.getvalue() == (
+            'web | Step 1 : FROM busybox\n'
+            'web | Step 2 : RUN true\n'
+            'web | done\n'
+        )
+
+
+def test_format_size():
+    assert progress_stream.format_size(999) == '999 B'
+    assert progress_stream.format_size(1500) == '1.5 kB'
+    assert progress_stream.format_size(2500000000) == '2.5 GB'
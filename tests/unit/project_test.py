@@ -2,17 +2,29 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 
 import datetime
+import os
+import shutil
+import tempfile
 
 import docker
+import pytest
+import six
 from docker.errors import NotFound
 
 from .. import mock
 from .. import unittest
 from compose.config.config import Config
+from compose.config.errors import DependencyError
 from compose.config.types import VolumeFromSpec
 from compose.const import LABEL_SERVICE
 from compose.container import Container
+from compose.lockfile import Lockfile
+from compose.project import BUILD_CONCURRENCY
+from compose.project import get_build_dependencies
 from compose.project import Project
+from compose.service import BuildError
+from compose.service import ConvergencePlan
+from compose.service import image_key
 from compose.service import ImageType
 from compose.service import Service
 
@@ -510,3 +522,289 @@ class ProjectTest(unittest.TestCase):
 
         project.down(ImageType.all, True)
         self.mock_client.remove_image.assert_called_once_with("busybox:latest")
+
+    @mock.patch('compose.service.context_digest', autospec=True)
+    def test_build_shared_build_context_once(self, mock_digest):
+        mock_digest.return_value = None
+        build = {'context': '/app', 'args': {'FOO': 'bar'}}
+        project = Project.from_config(
+            name='test',
+            client=self.mock_client,
+            config_data=Config(
+                version='2',
+                services=[
+                    {'name': 'web', 'build': dict(build), 'command': 'web'},
+                    {'name': 'worker', 'build': dict(build), 'command': 'worker'},
+                    {'name': 'other', 'build': {'context': '/other'}},
+                ],
+                networks=None,
+                volumes=None,
+            ),
+        )
+        self.mock_client.build.return_value = [
+            b'{"stream": "Successfully built 12345"}',
+        ]
+
+        project.build()
+
+        assert sorted(call[1]['tag'] for call in self.mock_client.build.call_args_list) == [
+            'test_other',
+            'test_web',
+        ]
+        self.mock_client.tag.assert_called_once_with(
+            '12345', 'test_worker', tag=None, force=True)
+
+    @mock.patch('compose.service.context_digest', autospec=True)
+    def test_build_prefixes_output_and_closes_client_once(self, mock_digest):
+        mock_digest.return_value = None
+        project = Project.from_config(
+            name='test',
+            client=self.mock_client,
+            config_data=Config(
+                version='2',
+                services=[
+                    {'name': 'web', 'build': {'context': '/web'}},
+                    {'name': 'db', 'build': {'context': '/db'}},
+                ],
+                networks=None,
+                volumes=None,
+            ),
+        )
+        self.mock_client.build.side_effect = lambda **kwargs: iter([
+            '{{"stream": "Building {}\\n"}}'.format(kwargs['tag']).encode('utf-8'),
+            b'{"stream": "Successfully built 12345"}',
+        ])
+        output = six.StringIO()
+
+        with mock.patch('compose.project.sys.stdout', output):
+            project.build()
+
+        lines = output.getvalue().splitlines()
+        assert 'web | Building test_web' in lines
+        assert 'db  | Building test_db' in lines
+        self.mock_client.close.assert_called_once_with()
+
+    @mock.patch('compose.service.context_digest', autospec=True)
+    def test_build_failure_is_reported_once(self, mock_digest):
+        mock_digest.return_value = None
+        project = Project.from_config(
+            name='test',
+            client=self.mock_client,
+            config_data=Config(
+                version='2',
+                services=[{'name': 'web', 'build': {'context': '/web'}}],
+                networks=None,
+                volumes=None,
+            ),
+        )
+        self.mock_client.build.return_value = [
+            b'{"error": "boom", "errorDetail": {"message": "boom"}}',
+        ]
+        stderr = six.StringIO()
+
+        with mock.patch('compose.parallel.sys.stderr', stderr):
+            with mock.patch('compose.project.sys.stdout', six.StringIO()):
+                with pytest.raises(BuildError) as excinfo:
+                    project.build()
+
+        assert excinfo.value.service.name == 'web'
+        assert str(excinfo.value) == 'boom'
+        assert 'ERROR: for web' not in stderr.getvalue()
+
+    @mock.patch('compose.service.context_digest', autospec=True)
+    @mock.patch('compose.project.prefetch_base_images', autospec=True)
+    def test_build_pull_skips_prefetched_base_images(self, mock_prefetch, mock_digest):
+        mock_digest.return_value = None
+        mock_prefetch.return_value = {image_key('busybox')}
+        project = Project.from_config(
+            name='test',
+            client=self.mock_client,
+            config_data=Config(
+                version='2',
+                services=[
+                    {'name': 'web', 'build': {'context': '/web'}},
+                    {'name': 'db', 'build': {'context': '/db'}},
+                ],
+                networks=None,
+                volumes=None,
+            ),
+        )
+        self.mock_client.build.return_value = [
+            b'{"stream": "Successfully built 12345"}',
+        ]
+        base_images = {'web': ['busybox'], 'db': ['busybox', 'postgres']}
+
+        with mock.patch.object(
+            Service, 'build_base_images', autospec=True,
+            side_effect=lambda service: base_images[service.name]
+        ):
+            with mock.patch('compose.project.sys.stdout', six.StringIO()):
+                project.build(pull=True)
+
+        pulls = dict(
+            (call[1]['tag'], call[1]['pull'])
+            for call in self.mock_client.build.call_args_list)
+        assert pulls == {'test_web': False, 'test_db': True}
+
+    @mock.patch('compose.project.parallel.parallel_execute', autospec=True)
+    def test_build_concurrency_is_limited(self, mock_parallel_execute):
+        project = Project.from_config(
+            name='test',
+            client=self.mock_client,
+            config_data=Config(
+                version='2',
+                services=[{'name': 'web', 'build': {'context': '/web'}}],
+                networks=None,
+                volumes=None,
+            ),
+        )
+
+        project.build()
+
+        _, kwargs = mock_parallel_execute.call_args
+        assert kwargs['limit'] == BUILD_CONCURRENCY
+
+    @mock.patch('compose.service.context_digest', autospec=True)
+    def test_build_base_service_first(self, mock_digest):
+        mock_digest.return_value = None
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        for name, dockerfile in [
+            ('base', 'FROM busybox\n'),
+            ('app', 'FROM test_base AS build\nFROM busybox\nCOPY --from=build /app /app\n'),
+        ]:
+            os.mkdir(os.path.join(tmpdir, name))
+            with open(os.path.join(tmpdir, name, 'Dockerfile'), 'w') as f:
+                f.write(dockerfile)
+
+        project = Project.from_config(
+            name='test',
+            client=self.mock_client,
+            config_data=Config(
+                version='2',
+                services=[
+                    {'name': 'app', 'build': {'context': os.path.join(tmpdir, 'app')}},
+                    {'name': 'base', 'build': {'context': os.path.join(tmpdir, 'base')}},
+                ],
+                networks=None,
+                volumes=None,
+            ),
+        )
+        self.mock_client.build.return_value = [
+            b'{"stream": "Successfully built 12345"}',
+        ]
+
+        project.build()
+
+        assert [call[1]['tag'] for call in self.mock_client.build.call_args_list] == [
+            'test_base',
+            'test_app',
+        ]
+
+    def test_build_dependencies_cycle(self):
+        web = Service('web', project='test', build={'context': '.'})
+        db = Service('db', project='test', build={'context': '.'})
+        base_images = {'web': ['test_db'], 'db': ['test_web:latest']}
+
+        with mock.patch.object(
+            Service, 'build_base_images', autospec=True,
+            side_effect=lambda service: base_images[service.name],
+        ):
+            with pytest.raises(DependencyError):
+                get_build_dependencies([web, db], {'web': [], 'db': []})
+
+    def test_up_loads_image_index_once(self):
+        project = Project.from_config(
+            name='test',
+            client=self.mock_client,
+            config_data=Config(
+                version=None,
+                services=[
+                    {'name': 'web', 'image': 'busybox'},
+                    {'name': 'db', 'image': 'busybox:latest'},
+                ],
+                networks=None,
+                volumes=None,
+            ),
+        )
+        self.mock_client.images.return_value = [
+            {'Id': 'sha256:1', 'RepoTags': ['busybox:latest']},
+        ]
+        self.mock_client.containers.return_value = []
+
+        with mock.patch.object(Service, 'execute_convergence_plan', autospec=True):
+            project.up()
+
+        self.mock_client.images.assert_called_once_with()
+        assert not self.mock_client.inspect_image.called
+
+    def test_up_start_first_probes_recreated_containers_once(self):
+        project = Project.from_config(
+            name='test',
+            client=self.mock_client,
+            config_data=Config(
+                version=None,
+                services=[{'name': 'web', 'image': 'busybox:latest'}],
+                networks=None,
+                volumes=None,
+            ),
+        )
+        self.mock_client.images.return_value = []
+        self.mock_client.containers.return_value = []
+        container = mock.create_autospec(Container)
+
+        with mock.patch.object(
+            Project, '_get_convergence_plans', autospec=True,
+            return_value={'web': ConvergencePlan('recreate', [container])},
+        ), mock.patch.object(
+            Service, 'execute_convergence_plan', autospec=True,
+            return_value=[container],
+        ), mock.patch.object(Service, 'wait_until_ready', autospec=True) as mock_wait:
+            project.up(start_first=True)
+            assert not mock_wait.called
+
+            project.up()
+            assert mock_wait.call_count == 1
+
+    def test_lock(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        lockfile = Lockfile.find(tmpdir)
+        project = Project.from_config(
+            name='test',
+            client=self.mock_client,
+            config_data=Config(
+                version=None,
+                services=[
+                    {'name': 'web', 'build': {'context': '.'}},
+                    {'name': 'db', 'image': 'postgres:9.5'},
+                ],
+                networks=None,
+                volumes=None,
+            ),
+            lockfile=lockfile,
+        )
+        self.mock_client.pull.return_value = []
+        self.mock_client.inspect_image.return_value = {
+            'Id': 'sha256:1',
+            'RepoDigests': ['postgres@sha256:abcd'],
+        }
+
+        project.lock()
+
+        self.mock_client.pull.assert_called_once_with('postgres', tag='9.5', stream=True)
+        assert project.get_service('db').image_digest == 'sha256:abcd'
+        assert Lockfile.find(tmpdir).images == {'postgres:9.5': 'sha256:abcd'}
+
+        project = Project.from_config(
+            name='test',
+            client=self.mock_client,
+            config_data=Config(
+                version=None,
+                services=[{'name': 'db', 'image': 'postgres:9.5'}],
+                networks=None,
+                volumes=None,
+            ),
+            lockfile=Lockfile.find(tmpdir),
+        )
+        assert project.get_service('db').image_reference == 'postgres@sha256:abcd'
@@ -0,0 +1,163 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import errno
+import socket
+
+import docker
+import pytest
+
+from .. import mock
+from compose.container import Container
+from compose.readiness import get_docker_host
+from compose.readiness import ReadinessError
+from compose.readiness import wait_until_ready
+
+
+@pytest.fixture
+def mock_client():
+    client = mock.create_autospec(docker.Client)
+    client.base_url = 'http+docker://localunixsocket'
+    return client
+
+
+@pytest.fixture
+def container(mock_client):
+    container = Container(mock_client, {'Id': 'abc', 'Name': '/default_db_1'})
+    mock_client.inspect_container.return_value = {
+        'Id': 'abc',
+        'Name': '/default_db_1',
+        'State': {'Running': True, 'ExitCode': 0},
+        'NetworkSettings': {
+            'Ports': {
+                '5432/tcp': [{'HostIp': '0.0.0.0', 'HostPort': '32768'}],
+            },
+        },
+    }
+    return container
+
+
+class TestWaitUntilReady(object):
+
+    def test_exec_probe(self, container, mock_client):
+        mock_client.exec_create.return_value = {'Id': 'execid'}
+        mock_client.exec_inspect.side_effect = [{'ExitCode': 1}, {'ExitCode': 0}]
+
+        with mock.patch('compose.readiness.time.sleep') as mock_sleep:
+            wait_until_ready(container, {'exec': 'pg_isready', 'interval': 2})
+
+        mock_client.exec_create.assert_called_with(
+            'abc', ['sh', '-c', 'pg_isready'], stdout=False, stderr=False)
+        mock_sleep.assert_called_once_with(2)
+
+    def test_exec_probe_which_hangs_times_out(self, container, mock_client):
+        mock_client.exec_create.return_value = {'Id': 'execid'}
+        mock_client.exec_inspect.return_value = {'Running': True, 'ExitCode': None}
+
+        with pytest.raises(ReadinessError) as exc:
+            wait_until_ready(container, {'exec': 'sleep 1000', 'timeout': 0})
+
+        assert 'did not pass within 0 seconds' in exc.exconly()
+        mock_client.exec_start.assert_called_once_with({'Id': 'execid'}, detach=True)
+
+    def test_port_probe(self, container):
+        with mock.patch(
+            'compose.readiness.socket.create_connection',
+            autospec=True
+        ) as mock_connect:
+            wait_until_ready(container, {'port': 5432})
+
+        mock_connect.assert_called_once_with(('127.0.0.1', 32768), timeout=1)
+
+    def test_port_probe_connects_to_the_container(self, container, mock_client):
+        mock_client.inspect_container.return_value['NetworkSettings']['Networks'] = {
+            'default_default': {'IPAddress': '172.18.0.2'},
+        }
+        refused = socket.error(errno.ECONNREFUSED, 'Connection refused')
+        with mock.patch(
+            'compose.readiness.socket.create_connection',
+            autospec=True,
+            side_effect=[refused, mock.Mock()],
+        ) as mock_connect:
+            with mock.patch('compose.readiness.time.sleep'):
+                wait_until_ready(container, {'port': 5432})
+
+        # A refused connection means the container isn't listening yet, even
+        # if the port is published
+        assert mock_connect.mock_calls == [
+            mock.call(('172.18.0.2', 5432), timeout=1),
+            mock.call(('172.18.0.2', 5432), timeout=1),
+        ]
+
+    def test_port_probe_falls_back_to_the_published_port(self, container, mock_client):
+        mock_client.inspect_container.return_value['NetworkSettings']['Networks'] = {
+            'default_default': {'IPAddress': '172.18.0.2'},
+        }
+        with mock.patch(
+            'compose.readiness.socket.create_connection',
+            autospec=True,
+            side_effect=[socket.timeout(), mock.Mock()],
+        ) as mock_connect:
+            wait_until_ready(container, {'port': 5432})
+
+        assert mock_connect.mock_calls[-1] == mock.call(('127.0.0.1', 32768), timeout=1)
+
+    def test_port_probe_with_a_remote_daemon(self, container, mock_client):
+        mock_client.base_url = 'https://192.168.99.100:2376'
+        mock_client.inspect_container.return_value['NetworkSettings']['Networks'] = {
+            'default_default': {'IPAddress': '172.18.0.2'},
+        }
+        with mock.patch(
+            'compose.readiness.socket.create_connection',
+            autospec=True
+        ) as mock_connect:
+            wait_until_ready(container, {'port': 5432})
+
+        mock_connect.assert_called_once_with(('192.168.99.100', 32768), timeout=1)
+
+    def test_port_probe_not_published(self, container):
+        with pytest.raises(ReadinessError) as exc:
+            wait_until_ready(container, {'port': 8000})
+        assert 'port 8000 is not published' in exc.exconly()
+
+    def test_log_probe(self, container, mock_client):
+        mock_client._get_result_tty.return_value = iter([b'starting\n', b'ready to go\n'])
+
+        with mock.patch('compose.readiness.time.sleep'):
+            wait_until_ready(container, {'log': '^ready'})
+
+        mock_client._get.return_value.close.assert_called_once_with()
+
+    def test_log_probe_closes_the_stream_on_timeout(self, container, mock_client):
+        response = mock_client._get.return_value
+        mock_client._get_result_tty.return_value = iter([b'starting\n'])
+
+        with pytest.raises(ReadinessError):
+            wait_until_ready(container, {'log': '^ready', 'timeout': 0})
+
+        response.close.assert_called_once_with()
+
+    def test_container_exited(self, container, mock_client):
+        mock_client.inspect_container.return_value['State'] = {
+            'Running': False,
+            'ExitCode': 3,
+        }
+        with pytest.raises(ReadinessError) as exc:
+            wait_until_ready(container, {'exec': 'true'})
+        assert 'exited with code 3' in exc.exconly()
+
+    def test_timeout(self, container):
+        with mock.patch(
+            'compose.readiness.socket.create_connection',
+            autospec=True,
+            side_effect=socket.error,
+        ):
+            with pytest.raises(ReadinessError) as exc:
+                wait_until_ready(container, {'port': 5432, 'timeout': 0})
+        assert 'did not pass within 0 seconds' in exc.exconly()
+
+
+def test_get_docker_host(mock_client):
+    assert get_docker_host(mock_client) == '127.0.0.1'
+    mock_client.base_url = 'https://192.168.99.100:2376'
+    assert get_docker_host(mock_client) == '192.168.99.100'
@@ -0,0 +1,68 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from docker.errors import APIError
+
+from .. import mock
+from .. import unittest
+from compose.container import Container
+from compose.reaper import Reaper
+from compose.reaper import remove_container
+
+
+def mock_container(name):
+    container = mock.create_autospec(Container, instance=True)
+    container.name = name
+    return container
+
+
+class ReaperTest(unittest.TestCase):
+
+    def test_remove_in_background(self):
+        containers = [mock_container('web_%s' % i) for i in range(6)]
+        reaper = Reaper(concurrency=2)
+
+        for container in containers:
+            reaper.remove(container, v=True)
+        reaper.wait()
+
+        assert len(reaper.workers) == 2
+        assert reaper.pending == 0
+        for container in containers:
+            container.remove.assert_called_once_with(v=True)
+
+    def test_wait_reports_errors(self):
+        container = mock_container('web_1')
+        container.remove.side_effect = APIError(
+            'oops', mock.Mock(), explanation='removal failed')
+        reaper = Reaper()
+        reaper.remove(container)
+
+        with mock.patch('compose.reaper.log', autospec=True) as mock_log:
+            reaper.wait()
+
+        mock_log.error.assert_called_once_with(
+            'Failed to remove web_1: removal failed')
+        assert reaper.errors == {}
+
+    def test_context_manager_waits(self):
+        container = mock_container('web_1')
+        with Reaper() as reaper:
+            reaper.remove(container)
+
+        assert reaper.pending == 0
+        container.remove.assert_called_once_with()
+
+
+def test_remove_container_without_reaper():
+    container = mock_container('web_1')
+    remove_container(container, None, force=True)
+    container.remove.assert_called_once_with(force=True)
+
+
+def test_remove_container_with_reaper():
+    container = mock_container('web_1')
+    reaper = mock.create_autospec(Reaper, instance=True)
+    remove_container(container, reaper, force=True)
+    reaper.remove.assert_called_once_with(container, force=True)
+    assert not container.remove.called
@@ -1,6 +1,8 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import functools
+
 import docker
 import pytest
 from docker.errors import APIError
@@ -10,15 +12,21 @@ from .. import unittest
 from compose.config.types import VolumeFromSpec
 from compose.config.types import VolumeSpec
 from compose.const import LABEL_CONFIG_HASH
+from compose.const import LABEL_CONTAINER_NUMBER
 from compose.const import LABEL_ONE_OFF
 from compose.const import LABEL_PROJECT
 from compose.const import LABEL_SERVICE
 from compose.container import Container
+from compose.image_cache import ImageCache
+from compose.image_index import ImageIndex
 from compose.project import OneOffFilter
+from compose.reaper import Reaper
 from compose.service import build_ulimits
 from compose.service import build_volume_binding
 from compose.service import BuildAction
+from compose.service import ContainerCreateTemplate
 from compose.service import ContainerNetworkMode
+from compose.service import ConvergencePlan
 from compose.service import get_container_data_volumes
 from compose.service import ImageType
 from compose.service import merge_volume_bindings
@@ -28,6 +36,8 @@ from compose.service import NoSuchImageError
 from compose.service import parse_repository_tag
 from compose.service import Service
 from compose.service import ServiceNetworkMode
+from compose.service import StartFirstError
+from compose.service import wait_until_stable
 from compose.service import warn_on_masked_volume
 
 
@@ -35,6 +45,14 @@ class ServiceTest(unittest.TestCase):
 
     def setUp(self):
         self.mock_client = mock.create_autospec(docker.Client)
+        patcher = mock.patch('compose.service.BuildIndex', autospec=True)
+        self.mock_build_index = patcher.start().return_value
+        self.mock_build_index.get.return_value = None
+        self.addCleanup(patcher.stop)
+        # Builds use the repository as their context, don't inspect its base images
+        patcher = mock.patch('compose.service.base_images', autospec=True, return_value=[])
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     def test_containers(self):
         service = Service('db', self.mock_client, 'myproject', image='foo')
@@ -289,6 +307,47 @@ class ServiceTest(unittest.TestCase):
             '2524a06fcb3d781aa2c981fc40bcfa08013bb318e4273bfa388df22023e6f2aa')
         assert opts['environment'] == ['also=real']
 
+    def test_container_create_template_matches_create_options(self):
+        self.mock_client.inspect_image.return_value = {'Id': 'abcd'}
+        self.mock_client.create_host_config.side_effect = functools.partial(
+            docker.utils.create_host_config, version='1.22')
+        self.mock_client.containers.return_value = []
+        service = Service(
+            'foo',
+            image='foo',
+            client=self.mock_client,
+            environment={'FOO': 'bar'},
+            labels={'owner': 'me'},
+            ports=['8000'],
+            volumes=[VolumeSpec.parse('/tmp:/tmp')],
+            dns=['8.8.8.8'],
+        )
+
+        template = ContainerCreateTemplate(service)
+        self.mock_client.reset_mock()
+        stamped = [template.stamp(number) for number in (3, 4)]
+        assert not self.mock_client.mock_calls
+
+        for number in (1, 2, 10):
+            assert template.stamp(number) == service._get_container_create_options({}, number)
+            template.stamp(number)['labels']['owner'] = 'someone else'
+
+        assert stamped[0]['name'] == 'default_foo_3'
+        assert stamped[1]['labels'][LABEL_CONTAINER_NUMBER] == '4'
+
+    def test_create_container_with_template(self):
+        template = mock.create_autospec(ContainerCreateTemplate, instance=True)
+        template.stamp.return_value = {'name': 'default_foo_3', 'image': 'foo'}
+        self.mock_client.create_container.return_value = {'Id': 'abc'}
+        service = Service('foo', image='foo', client=self.mock_client)
+
+        service.create_container(number=3, template=template)
+
+        template.stamp.assert_called_once_with(3)
+        self.mock_client.create_container.assert_called_once_with(
+            name='default_foo_3', image='foo')
+        assert not self.mock_client.inspect_image.called
+
     def test_get_container_create_options_sets_affinity_with_binds(self):
         service = Service(
             'foo',
@@ -392,6 +451,117 @@ class ServiceTest(unittest.TestCase):
         new_container.start.assert_called_once_with()
         mock_container.remove.assert_called_once_with()
 
+    @mock.patch('compose.service.Container', autospec=True)
+    def test_recreate_container_with_reaper(self, _):
+        mock_container = mock.create_autospec(Container)
+        reaper = mock.create_autospec(Reaper, instance=True)
+        service = Service('foo', client=self.mock_client, image='someimage')
+        service.image = lambda: {'Id': 'abc123'}
+        service.recreate_container(mock_container, reaper=reaper)
+
+        reaper.remove.assert_called_once_with(mock_container)
+        assert not mock_container.remove.called
+
+    @mock.patch('compose.service.START_FIRST_GRACE_PERIOD', 0)
+    @mock.patch('compose.service.Container', autospec=True)
+    def test_recreate_container_start_first(self, mock_container_class):
+        mock_container = mock.create_autospec(Container)
+        new_container = mock_container_class.create.return_value
+        new_container.is_running = True
+        new_container.is_restarting = False
+        service = Service('foo', client=self.mock_client, image='someimage')
+        service.image = lambda: {'Id': 'abc123'}
+
+        manager = mock.Mock()
+        manager.attach_mock(mock_container.stop, 'stop')
+        manager.attach_mock(new_container.start, 'start')
+        assert service.recreate_container_start_first(mock_container) is new_container
+
+        mock_container.rename_to_tmp_name.assert_called_once_with()
+        assert manager.mock_calls == [mock.call.start(), mock.call.stop(timeout=10)]
+        mock_container.remove.assert_called_once_with()
+
+    @mock.patch('compose.service.START_FIRST_GRACE_PERIOD', 0)
+    @mock.patch('compose.service.Container', autospec=True)
+    def test_recreate_container_start_first_rollback(self, mock_container_class):
+        mock_container = mock.create_autospec(Container)
+        mock_container.id = 'oldid'
+        mock_container.name = 'default_foo_1'
+        new_container = mock_container_class.create.return_value
+        new_container.is_running = False
+        service = Service('foo', client=self.mock_client, image='someimage')
+        service.image = lambda: {'Id': 'abc123'}
+
+        with pytest.raises(StartFirstError):
+            service.recreate_container_start_first(mock_container)
+
+        new_container.remove.assert_called_once_with(force=True)
+        self.mock_client.rename.assert_called_once_with('oldid', 'default_foo_1')
+        assert not mock_container.stop.called
+        assert not mock_container.remove.called
+
+    @mock.patch('compose.service.Container', autospec=True)
+    def test_recreate_container_start_first_uses_readiness_probe(self, mock_container_class):
+        mock_container = mock.create_autospec(Container)
+        new_container = mock_container_class.create.return_value
+        service = Service('foo', client=self.mock_client, image='someimage',
+                          readiness={'exec': 'true'})
+        service.image = lambda: {'Id': 'abc123'}
+
+        with mock.patch('compose.service.wait_until_ready', autospec=True) as mock_wait, \
+                mock.patch('compose.service.wait_until_stable', autospec=True) as mock_stable:
+            service.recreate_container_start_first(mock_container)
+
+        mock_wait.assert_called_once_with(new_container, {'exec': 'true'})
+        assert not mock_stable.called
+
+    def test_wait_until_stable_fails_when_restarting(self):
+        container = mock.create_autospec(Container)
+        container.name = 'default_foo_1'
+        container.is_running = True
+        container.is_restarting = False
+        states = iter([False, True])
+
+        def inspect():
+            container.is_restarting = next(states)
+        container.inspect.side_effect = inspect
+
+        with mock.patch('compose.service.time.sleep', autospec=True):
+            with pytest.raises(StartFirstError):
+                wait_until_stable(container, period=10, interval=0)
+        assert container.inspect.call_count == 2
+
+    def test_wait_until_ready(self):
+        readiness = {'exec': 'true'}
+        service = Service('foo', client=self.mock_client, image='someimage',
+                          readiness=readiness)
+        containers = [mock.create_autospec(Container) for _ in range(2)]
+
+        with mock.patch('compose.service.wait_until_ready', autospec=True) as mock_wait:
+            service.wait_until_ready(containers)
+
+        assert mock_wait.mock_calls == [
+            mock.call(containers[0], readiness),
+            mock.call(containers[1], readiness),
+        ]
+
+    def test_wait_until_ready_without_probe(self):
+        service = Service('foo', client=self.mock_client, image='someimage')
+        with mock.patch('compose.service.wait_until_ready', autospec=True) as mock_wait:
+            service.wait_until_ready([mock.create_autospec(Container)])
+        assert not mock_wait.called
+
+    def test_execute_convergence_plan_start_first_with_host_port(self):
+        service = Service('foo', client=self.mock_client, image='someimage',
+                          ports=['8000:8000'])
+        mock_container = mock.create_autospec(Container)
+        plan = ConvergencePlan('recreate', [mock_container])
+
+        with mock.patch.object(service, 'recreate_container') as mock_recreate:
+            service.execute_convergence_plan(plan, start_first=True)
+
+        assert mock_recreate.call_count == 1
+
     @mock.patch('compose.service.Container', autospec=True)
     def test_recreate_container_with_timeout(self, _):
         mock_container = mock.create_autospec(Container)
@@ -440,7 +610,8 @@ class ServiceTest(unittest.TestCase):
             tag='default_foo',
             dockerfile=None,
             stream=True,
-            path='.',
+            fileobj=mock.ANY,
+            custom_context=True,
             pull=False,
             forcerm=False,
             nocache=False,
@@ -476,7 +647,8 @@ class ServiceTest(unittest.TestCase):
             tag='default_foo',
             dockerfile=None,
             stream=True,
-            path='.',
+            fileobj=mock.ANY,
+            custom_context=True,
             pull=False,
             forcerm=False,
             nocache=False,
@@ -495,6 +667,202 @@ class ServiceTest(unittest.TestCase):
         self.assertEqual(self.mock_client.build.call_count, 1)
         self.assertFalse(self.mock_client.build.call_args[1]['pull'])
 
+    def test_image_from_index(self):
+        service = Service('foo', client=self.mock_client, image='busybox')
+        service.image_index = ImageIndex([{'Id': 'sha256:1', 'RepoTags': ['busybox:latest']}])
+
+        assert service.image() == {'Id': 'sha256:1'}
+        assert not self.mock_client.inspect_image.called
+
+    def test_image_not_in_index(self):
+        self.mock_client.inspect_image.return_value = {'Id': 'sha256:2'}
+        service = Service('foo', client=self.mock_client, image='docker.io/busybox')
+        service.image_index = ImageIndex([])
+
+        assert service.image() == {'Id': 'sha256:2'}
+        assert service.image() == {'Id': 'sha256:2'}
+        self.mock_client.inspect_image.assert_called_once_with('docker.io/busybox')
+
+    def test_build_forgets_indexed_image(self):
+        self.mock_client.build.return_value = [
+            b'{"stream": "Successfully built 12345"}',
+        ]
+        service = Service('foo', client=self.mock_client, build={'context': '.'})
+        service.image_index = ImageIndex([{'Id': 'sha256:1', 'RepoTags': ['default_foo:latest']}])
+
+        service.build(no_cache=True)
+
+        assert service.image_index.get('default_foo') is None
+
+    def test_locked_image_reference(self):
+        service = Service('foo', client=self.mock_client, image='example.com:5000/foo:1.0')
+        assert service.image_reference == 'example.com:5000/foo:1.0'
+
+        service.image_digest = 'sha256:abcd'
+        assert service.image_reference == 'example.com:5000/foo@sha256:abcd'
+        assert service.config_dict()['image_id'] == 'sha256:abcd'
+        assert not self.mock_client.inspect_image.called
+
+        opts = service._get_container_create_options({}, 1)
+        assert opts['image'] == 'example.com:5000/foo@sha256:abcd'
+
+    def test_pull_locked_image_present(self):
+        service = Service('foo', client=self.mock_client, image='busybox')
+        service.image_digest = 'sha256:abcd'
+        self.mock_client.inspect_image.return_value = {'Id': 'sha256:1'}
+
+        service.pull()
+
+        self.mock_client.inspect_image.assert_called_once_with('busybox@sha256:abcd')
+        assert not self.mock_client.pull.called
+
+    def test_pull_locked_image_missing(self):
+        service = Service('foo', client=self.mock_client, image='busybox:1.24')
+        service.image_digest = 'sha256:abcd'
+        self.mock_client.inspect_image.side_effect = APIError(
+            None, mock.Mock(status_code=404), 'No such image')
+        self.mock_client.pull.return_value = [b'{"status": "Digest: sha256:abcd"}']
+
+        service.pull()
+
+        self.mock_client.pull.assert_called_once_with('busybox', tag='sha256:abcd', stream=True)
+        self.mock_client.tag.assert_called_once_with(
+            'busybox@sha256:abcd', 'busybox', tag='1.24', force=True)
+
+    def test_repo_digest(self):
+        service = Service('foo', client=self.mock_client, image='busybox:1.24')
+        self.mock_client.inspect_image.return_value = {
+            'Id': 'sha256:1',
+            'RepoDigests': ['other@sha256:0000', 'busybox@sha256:abcd'],
+        }
+        assert service.repo_digest() == 'sha256:abcd'
+
+        self.mock_client.inspect_image.return_value = {'Id': 'sha256:1', 'RepoDigests': []}
+        assert service.repo_digest() is None
+
+    def test_build_remote_context(self):
+        self.mock_client.build.return_value = [
+            b'{"stream": "Successfully built 12345"}',
+        ]
+
+        context = 'git://github.com/docker/compose.git'
+        service = Service('foo', client=self.mock_client, build={'context': context})
+        service.build()
+
+        assert self.mock_client.build.call_args[1]['path'] == context
+        assert 'fileobj' not in self.mock_client.build.call_args[1]
+
+    @mock.patch('compose.service.context_digest', autospec=True)
+    def test_build_records_context_digest(self, mock_digest):
+        mock_digest.return_value = 'digest'
+        self.mock_client.build.return_value = [
+            b'{"stream": "Successfully built 12345"}',
+        ]
+
+        service = Service('foo', client=self.mock_client, build={'context': '.'})
+        assert service.build() == '12345'
+
+        self.mock_build_index.add.assert_called_once_with('digest', '12345')
+
+    def test_build_context_digest_includes_base_image_ids(self):
+        service = Service('foo', client=self.mock_client, build={'context': '.'})
+        self.mock_client.inspect_image.side_effect = APIError(
+            'Not found', mock.Mock(status_code=404))
+
+        with mock.patch.object(service, 'build_base_images', return_value=['test_base']), \
+                mock.patch('compose.service.context_digest', autospec=True) as mock_digest:
+            service.build_context_digest()
+
+        _, kwargs = mock_digest.call_args
+        assert kwargs['base_image_ids'] == {'test_base': None}
+
+    @mock.patch('compose.service.context_digest', autospec=True)
+    def test_build_skipped_when_context_unchanged(self, mock_digest):
+        mock_digest.return_value = 'digest'
+        self.mock_build_index.get.return_value = '12345'
+        self.mock_client.inspect_image.return_value = {'Id': 'sha256:12345abcdef'}
+
+        service = Service('foo', client=self.mock_client, build={'context': '.'})
+        assert service.build() == '12345'
+
+        self.mock_build_index.get.assert_called_once_with('digest')
+        assert not self.mock_client.build.called
+        assert not self.mock_client.tag.called
+
+    @mock.patch('compose.service.context_digest', autospec=True)
+    def test_build_skipped_tags_existing_image(self, mock_digest):
+        mock_digest.return_value = 'digest'
+        self.mock_build_index.get.return_value = '12345'
+        self.mock_client.inspect_image.side_effect = [
+            {'Id': 'sha256:67890'},
+            {'Id': 'sha256:12345'},
+        ]
+
+        service = Service('foo', client=self.mock_client, build={'context': '.'})
+        assert service.build() == '12345'
+
+        assert not self.mock_client.build.called
+        self.mock_client.tag.assert_called_once_with(
+            '12345', 'default_foo', tag=None, force=True)
+
+    @mock.patch('compose.service.context_digest', autospec=True)
+    def test_build_when_built_image_was_removed(self, mock_digest):
+        mock_digest.return_value = 'digest'
+        self.mock_build_index.get.return_value = '12345'
+        self.mock_client.inspect_image.side_effect = APIError(
+            None, mock.Mock(status_code=404), 'No such image')
+        self.mock_client.build.return_value = [
+            b'{"stream": "Successfully built 67890"}',
+        ]
+
+        service = Service('foo', client=self.mock_client, build={'context': '.'})
+        assert service.build() == '67890'
+        assert self.mock_client.build.call_count == 1
+
+    @mock.patch('compose.service.context_digest', autospec=True)
+    def test_build_loads_from_cache(self, mock_digest):
+        mock_digest.return_value = 'digest'
+        cache = mock.create_autospec(ImageCache)
+        cache.has.return_value = True
+        cache.load.return_value = 'sha256:12345'
+
+        service = Service('foo', client=self.mock_client, build={'context': '.'})
+        assert service.build(cache=cache) == 'sha256:12345'
+
+        assert not self.mock_client.build.called
+        cache.load.assert_called_once_with(self.mock_client, 'digest')
+        self.mock_client.tag.assert_called_once_with(
+            'sha256:12345', 'default_foo', tag=None, force=True)
+        self.mock_build_index.add.assert_called_once_with('digest', 'sha256:12345')
+
+    @mock.patch('compose.service.context_digest', autospec=True)
+    def test_build_saves_to_cache(self, mock_digest):
+        mock_digest.return_value = 'digest'
+        cache = mock.create_autospec(ImageCache)
+        cache.has.return_value = False
+        self.mock_client.build.return_value = [
+            b'{"stream": "Successfully built 12345"}',
+        ]
+
+        service = Service('foo', client=self.mock_client, build={'context': '.'})
+        assert service.build(cache=cache) == '12345'
+
+        assert not cache.load.called
+        cache.save.assert_called_once_with(self.mock_client, 'default_foo', '12345', 'digest')
+
+    @mock.patch('compose.service.context_digest', autospec=True)
+    def test_build_no_cache_ignores_index(self, mock_digest):
+        self.mock_client.build.return_value = [
+            b'{"stream": "Successfully built 12345"}',
+        ]
+
+        service = Service('foo', client=self.mock_client, build={'context': '.'})
+        service.build(no_cache=True)
+
+        assert not mock_digest.called
+        assert not self.mock_build_index.add.called
+        assert self.mock_client.build.call_count == 1
+
     def test_config_dict(self):
         self.mock_client.inspect_image.return_value = {'Id': 'abcd'}
         service = Service(
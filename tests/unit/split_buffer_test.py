@@ -46,9 +46,26 @@ class SplitBufferTest(unittest.TestCase):
 
         self.assert_produces(reader, [string])
 
+    def test_unicode_sequence_split_across_chunks(self):
+        data = u"a\u2022c\nd".encode('utf-8')
+
+        def reader():
+            for index in range(len(data)):
+                yield data[index:index + 1]
+
+        self.assert_produces(reader, [u"a\u2022c\n", u"d"])
+
+    def test_text_chunks(self):
+        def reader():
+            yield u'ab'
+            yield u'c\nd\ne'
+
+        self.assert_produces(reader, ['abc\n', 'd\n', 'e'])
+
     def assert_produces(self, reader, expectations):
-        split = split_buffer(reader())
+        split = list(split_buffer(reader()))
 
+        self.assertEqual(len(split), len(expectations))
         for (actual, expected) in zip(split, expectations):
             self.assertEqual(type(actual), type(expected))
             self.assertEqual(actual, expected)
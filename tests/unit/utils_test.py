@@ -2,6 +2,12 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import os
+import shutil
+import tempfile
+
+import pytest
+
 from compose import utils
 
 
@@ -16,19 +22,6 @@ class TestJsonSplitter(object):
         assert utils.json_splitter(data) == ({'foo': 'bar'}, '{"next": "obj"}')
 
 
-class TestStreamAsText(object):
-
-    def test_stream_with_non_utf_unicode_character(self):
-        stream = [b'\xed\xf3\xf3']
-        output, = utils.stream_as_text(stream)
-        assert output == '���'
-
-    def test_stream_with_utf_character(self):
-        stream = ['ěĝ'.encode('utf-8')]
-        output, = utils.stream_as_text(stream)
-        assert output == 'ěĝ'
-
-
 class TestJsonStream(object):
 
     def test_with_falsy_entries(self):
@@ -43,3 +36,46 @@ class TestJsonStream(object):
             [1, 2, 3],
             [],
         ]
+
+    def test_objects_split_across_items(self):
+        stream = [b'{"one": ', b'"two"}{"three"', b': 3}\n', b'{"four": "\xc4', b'\x9b"}']
+        assert list(utils.json_stream(stream)) == [
+            {'one': 'two'},
+            {'three': 3},
+            {'four': 'ě'},
+        ]
+
+    def test_object_over_several_lines(self):
+        stream = ['{\n  "one": 1,\n', '  "two": 2\n}\n[]\n']
+        assert list(utils.json_stream(stream)) == [{'one': 1, 'two': 2}, []]
+
+
+class TestAtomicWrite(object):
+
+    @pytest.fixture
+    def directory(self, request):
+        path = tempfile.mkdtemp()
+        request.addfinalizer(lambda: shutil.rmtree(path))
+        return path
+
+    def test_write(self, directory):
+        path = os.path.join(directory, 'sub', 'file')
+        with utils.atomic_write(path) as f:
+            f.write('one')
+            assert not os.path.exists(path)
+        with open(path) as f:
+            assert f.read() == 'one'
+
+    def test_failed_write_keeps_the_file(self, directory):
+        path = os.path.join(directory, 'file')
+        with utils.atomic_write(path) as f:
+            f.write('one')
+
+        with pytest.raises(ValueError):
+            with utils.atomic_write(path) as f:
+                f.write('two')
+                raise ValueError()
+
+        with open(path) as f:
+            assert f.read() == 'one'
+        assert os.listdir(directory) == ['file']